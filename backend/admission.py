@@ -0,0 +1,136 @@
+# admission.py (Admission control and load shedding for Gemini and ElevenLabs work)
+#
+# When an upstream slows down, unbounded waiting turns into a pile of requests that
+# all time out on the client side, after we have paid for their answers anyway. An
+# AdmissionController caps the work in flight, lets a bounded number of requests wait
+# for a bounded time, and rejects the rest immediately with Overloaded, which the API
+# turns into 429/503 with a Retry-After estimate. main.py also uses pressured() to drop
+# the audio part of requests first, before any text request has to be turned away.
+
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metrics import ADMISSION_EVENTS, ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, record_queue_wait
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted. `status_code` is 429 (queue full) or 503 (waited too long)."""
+
+    def __init__(self, gate: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"The server is busy ({gate}: {reason}). Please retry in {retry_after}s.")
+        self.gate = gate
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    At most `max_in_flight` holders at once; up to `max_queue` more wait, first come first
+    served, for at most `queue_timeout` seconds. Slots are handed directly from a releasing
+    holder to the next waiter, so a newcomer can never overtake the queue.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        # Moving average of how long a slot is held, for the Retry-After estimate
+        self.mean_hold_seconds = 1.0
+        self.counts = {"admitted": 0, "queued": 0, "shed": 0, "timeout": 0, "degraded": 0}
+
+    @asynccontextmanager
+    async def admit(self):
+        """Holds a slot for the duration of the block; raises Overloaded if none can be had."""
+        await self._acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.mean_hold_seconds = 0.9 * self.mean_hold_seconds + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def pressured(self) -> bool:
+        """True when a new request would have to wait (every slot is taken)."""
+        return self.in_flight >= self.max_in_flight
+
+    def saturated(self) -> bool:
+        """True when a new request would be shed outright (the wait queue is full)."""
+        return self.pressured() and len(self._waiters) >= self.max_queue
+
+    def retry_after(self) -> int:
+        # Roughly the time for everything queued ahead to drain through the slots
+        drain = self.mean_hold_seconds * (len(self._waiters) + 1) / max(self.max_in_flight, 1)
+        return min(max(math.ceil(drain), 1), 60)
+
+    def overloaded(self, reason: str, status_code: int = 429) -> Overloaded:
+        self._count("shed" if status_code == 429 else "timeout")
+        return Overloaded(self.name, reason, status_code, self.retry_after())
+
+    def record_degraded(self):
+        self._count("degraded")
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+            "waiting": len(self._waiters), "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout, "mean_hold_seconds": round(self.mean_hold_seconds, 3),
+            **self.counts,
+        }
+
+    # --- INTERNALS ---
+    def _count(self, result: str):
+        self.counts[result] += 1
+        ADMISSION_EVENTS.labels(self.name, result).inc()
+
+    def _update_gauges(self):
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        ADMISSION_QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+
+    async def _acquire(self):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            record_queue_wait(self.name, 0.0)
+            self._count("admitted")
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self.overloaded("queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._count("queued")
+        self._update_gauges()
+        started = time.perf_counter()
+        try:
+            # shield() so a timeout can't cancel a slot that was handed over at the same moment
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except BaseException as e:
+            if waiter.done():
+                self._release()  # We were given the slot just as we gave up; pass it on
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self.overloaded(f"waited {self.queue_timeout:.0f}s", status_code=503) from None
+            raise
+        record_queue_wait(self.name, time.perf_counter() - started)
+        self._count("admitted")
+
+    def _release(self):
+        # The slot goes straight to the next waiter, so in_flight only drops when nobody is waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
@@ -0,0 +1,267 @@
+# answer_cache.py (Semantic cache for Krishna's answers)
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    Caches (answer, sources) pairs keyed by (version, author, output_language, query embedding).
+    A lookup is a hit when a cached query of the same version/author/language lies within
+    `threshold` cosine similarity of the new one. Entries are evicted LRU-first once
+    `max_entries` is reached, and expire after `ttl_seconds`. If `db_path` is given,
+    entries are mirrored to SQLite so the cache survives restarts.
+
+    `version` identifies what an answer was made from (prompt, LLM, corpus and collection,
+    see GitaRAG.answer_cache_version); answers of another version are never served and age
+    out through the LRU. Answers that don't come from an embedding (direct verse references)
+    are cached under an exact key instead, with lookup_key/store_key.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=2000, ttl_seconds=24 * 3600, db_path=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # entry_id -> dict, ordered from least to most recently used
+        self._by_age = OrderedDict()  # entry_id -> created_at, oldest first, so expiry only looks at the front
+        self._buckets = {}  # (version, author, language) -> _KeyMatrix of its query embeddings
+        self._keys = {}  # (version, author, language, key) -> entry_id
+        self._next_id = 1
+        self._db = None
+
+        if db_path:
+            self._open_db()
+
+    @classmethod
+    def from_env(cls):
+        """Builds the cache from ANSWER_CACHE_* environment variables, or returns None if disabled."""
+        if os.environ.get("ANSWER_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "2000")),
+            ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600))),
+            db_path=os.environ.get("ANSWER_CACHE_PATH") or None,
+        )
+
+    # --- PUBLIC API ---
+    def lookup(self, author, output_language, embedding, version=""):
+        """Returns the cached (answer, sources) closest to `embedding`, or None on a miss."""
+        bucket_key = (version, author, output_language.lower())
+        query_vector = self._normalize(embedding)
+
+        with self._lock:
+            self._expire(time.time())
+            bucket = self._buckets.get(bucket_key)
+            best = bucket.best(query_vector) if bucket is not None else None
+            if best is None or best[1] < self.threshold:
+                self.misses += 1
+                return None
+            return self._hit(best[0])
+
+    def lookup_key(self, author, output_language, key, version=""):
+        """Returns the (answer, sources) stored under exactly `key`, or None on a miss."""
+        with self._lock:
+            self._expire(time.time())
+            entry_id = self._keys.get((version, author, output_language.lower(), key))
+            if entry_id is None:
+                self.misses += 1
+                return None
+            return self._hit(entry_id)
+
+    def store(self, author, output_language, embedding, answer, sources, version=""):
+        """Adds an answer to the cache, evicting the least recently used entries if full."""
+        self._store((version, author, output_language.lower()), self._normalize(embedding), None, answer, sources)
+
+    def store_key(self, author, output_language, key, answer, sources, version=""):
+        """Adds an answer under an exact key, replacing any answer already stored under it."""
+        self._store((version, author, output_language.lower()), None, key, answer, sources)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_age.clear()
+            self._buckets.clear()
+            self._keys.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    # --- INTERNALS ---
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _hit(self, entry_id):
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        entry = self._entries[entry_id]
+        return entry["answer"], entry["sources"]
+
+    def _store(self, bucket_key, query_vector, key, answer, sources):
+        now = time.time()
+        with self._lock:
+            if key is not None and (*bucket_key, key) in self._keys:
+                self._remove(self._keys[(*bucket_key, key)])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._insert(entry_id, bucket_key, query_vector, key, answer, sources, now)
+            self._evict_overflow()
+            if self._db is not None:
+                version, author, language = bucket_key
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry_id, version, author, language, None if query_vector is None else query_vector.tobytes(),
+                     key, answer, json.dumps(sources, ensure_ascii=False), now),
+                )
+                self._db.commit()
+
+    def _insert(self, entry_id, bucket_key, query_vector, key, answer, sources, created_at):
+        entry = {
+            "bucket": bucket_key,
+            "key": key,
+            "row": None,
+            "answer": answer,
+            "sources": sources,
+            "created_at": created_at,
+        }
+        self._entries[entry_id] = entry
+        self._by_age[entry_id] = created_at
+        if key is not None:
+            self._keys[(*bucket_key, key)] = entry_id
+            return
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = _KeyMatrix(query_vector.shape[0], min(self.max_entries, 64))
+        entry["row"] = bucket.add(entry_id, query_vector)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self._by_age.pop(entry_id, None)
+        if entry["key"] is not None:
+            self._keys.pop((*entry["bucket"], entry["key"]), None)
+        else:
+            bucket = self._buckets[entry["bucket"]]
+            moved_id = bucket.remove(entry["row"])
+            if moved_id is not None:
+                self._entries[moved_id]["row"] = entry["row"]
+            if not bucket.ids:
+                del self._buckets[entry["bucket"]]
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_entries:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+            self.evictions += 1
+
+    def _expire(self, now):
+        # Entries are in creation order in _by_age, so this stops at the first one still fresh
+        if not self.ttl_seconds:
+            return
+        expired = 0
+        while self._by_age:
+            entry_id, created_at = next(iter(self._by_age.items()))
+            if now - created_at <= self.ttl_seconds:
+                break
+            self._remove(entry_id)
+            self.evictions += 1
+            expired += 1
+        if expired and self._db is not None:
+            self._db.commit()
+
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, version TEXT, author TEXT, language TEXT, embedding BLOB, "
+            "exact_key TEXT, answer TEXT, sources TEXT, created_at REAL)"
+        )
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        # Rows beyond max_entries would never be loaded again
+        self._db.execute(
+            "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY created_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT id, version, author, language, embedding, exact_key, answer, sources, created_at "
+            "FROM answers ORDER BY created_at"
+        ).fetchall()
+        for entry_id, version, author, language, blob, key, answer, sources, created_at in rows:
+            vector = None if blob is None else np.frombuffer(blob, dtype=np.float32)
+            self._insert(entry_id, (version, author, language), vector, key, answer, json.loads(sources), created_at)
+            self._next_id = max(self._next_id, entry_id + 1)
+        logger.info(f"Loaded {len(rows)} cached answers from '{self.db_path}'.")
+
+
+class _KeyMatrix:
+    """
+    The normalized query embeddings of one bucket, as rows of a preallocated matrix that
+    grows by doubling. A removed row is filled with the last one, so rows stay contiguous
+    and a lookup is a single matrix-vector product without any restacking.
+    """
+
+    def __init__(self, dimension, capacity):
+        self.vectors = np.empty((max(capacity, 1), dimension), dtype=np.float32)
+        self.ids = []  # entry_id of each row
+
+    def add(self, entry_id, vector):
+        row = len(self.ids)
+        if row == len(self.vectors):
+            grown = np.empty((2 * len(self.vectors), self.vectors.shape[1]), dtype=np.float32)
+            grown[:row] = self.vectors
+            self.vectors = grown
+        self.vectors[row] = vector
+        self.ids.append(entry_id)
+        return row
+
+    def remove(self, row):
+        """Removes `row`; returns the entry_id moved into it, or None if it was the last row."""
+        last = len(self.ids) - 1
+        moved_id = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            moved_id = self.ids[row] = self.ids[last]
+        self.ids.pop()
+        return moved_id
+
+    def best(self, query_vector):
+        """(entry_id, cosine similarity) of the row closest to `query_vector`."""
+        scores = self.vectors[:len(self.ids)] @ query_vector
+        row = int(np.argmax(scores))
+        return self.ids[row], float(scores[row])
@@ -0,0 +1,97 @@
+# audio_store.py (Content-addressed, size/age-bounded store for synthesized audio)
+#
+# Files are named after a hash of everything that determines the audio (text, voice,
+# model, voice settings), so a repeated answer reuses the MP3 instead of being
+# synthesized and billed again. File contents never change once written, which lets
+# /audio/{filename} serve them with strong ETags and long cache lifetimes.
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_AUDIO_FILENAME = re.compile(r"^[A-Za-z0-9_\-]+\.mp3$")
+
+
+class AudioStore:
+    def __init__(self, directory: str, max_bytes: int = 500 * 1024 * 1024, max_age_seconds: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, directory: str):
+        return cls(
+            directory,
+            max_bytes=int(float(os.environ.get("AUDIO_CACHE_MAX_MB", "500")) * 1024 * 1024),
+            max_age_seconds=float(os.environ.get("AUDIO_CACHE_MAX_AGE_DAYS", "7")) * 24 * 3600,
+        )
+
+    @staticmethod
+    def filename_for(text: str, voice: dict) -> str:
+        """Content address of the audio for `text` spoken with the `voice` parameters."""
+        payload = json.dumps({"text": text, **voice}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:40] + ".mp3"
+
+    def path_for(self, filename: str):
+        """Absolute path for a stored file, or None if the name is not a valid audio filename."""
+        if not _AUDIO_FILENAME.match(filename):
+            return None
+        return os.path.join(self.directory, filename)
+
+    def lookup(self, filename: str) -> bool:
+        path = self.path_for(filename)
+        if path is not None and os.path.exists(path):
+            # Refresh the modification time: eviction treats it as "last used"
+            os.utime(path)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def write(self, filename: str, audio_bytes: bytes):
+        path = self.path_for(filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio_bytes)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Deletes files unused for longer than max_age, then the least recently used ones until under max_bytes."""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".tmp") and now - stat.st_mtime < 3600:
+                continue  # Probably still being written
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age_seconds and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            removed += 1
+        self.evicted_files += removed
+        if removed:
+            logger.info(f"Evicted {removed} audio files; {total_bytes / 1e6:.1f} MB remain in '{self.directory}'.")
+        return removed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evicted_files": self.evicted_files}
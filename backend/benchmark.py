@@ -0,0 +1,376 @@
+# benchmark.py (Offline load tests and microbenchmarks)
+#
+# Usage:
+#   python benchmark.py load --concurrency 8 --requests 300            # closed loop, fixed concurrency
+#   python benchmark.py load --rate 5 --duration 60                     # open loop, Poisson arrivals
+#   python benchmark.py load --endpoint stream --audio-fraction 0.3 --json report.json
+#   python benchmark.py load --url http://127.0.0.1:8000 ...            # against an already running server
+#   python benchmark.py micro --iterations 200                          # encode / vector query / context
+#
+# `load` starts main:app under uvicorn with LLM_BACKEND=fake and TTS_BACKEND=stub, so no
+# Gemini or ElevenLabs quota is used; set FAKE_LLM_* / STUB_TTS_* to model their latency,
+# token rate and failure rate (see fake_llm.py and tts.py). Per-stage timings come from
+# the Server-Timing data the server returns with SERVER_TIMING=1. Everything else in the
+# environment (EMBEDDING_BACKEND, RETRIEVAL_ENGINE, cache settings...) is passed through,
+# so the same command compares configurations.
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (weight, query, output_language): everyday questions, verse references, Sanskrit, Hindi and repeats
+QUERY_MIX = [
+    (6, "How can I stop worrying about the results of my work?", "english"),
+    (5, "What is my duty when I feel confused about the right thing to do?", "english"),
+    (4, "How do I deal with anger and desire?", "english"),
+    (4, "What happens to the soul after death?", "english"),
+    (3, "How can I find peace of mind in difficult times?", "english"),
+    (3, "What is the difference between karma yoga and bhakti yoga?", "english"),
+    (2, "Is it wrong to want success?", "english"),
+    (2, "How should I treat people who hurt me?", "english"),
+    (3, "BG 2.47", "english"),
+    (2, "chapter 18 verse 66", "english"),
+    (2, "karmanye vadhikaraste ma phaleshu kadachana", "english"),
+    (3, "मन को शांत कैसे करें?", "hindi"),
+    (2, "कर्म करते हुए फल की चिंता कैसे छोड़ें?", "hindi"),
+    (2, "मृत्यु के बाद आत्मा का क्या होता है?", "hindi"),
+]
+AUTHORS = [(6, "Swami Sivananda"), (3, "Swami Ramsukhdas"), (2, "A.C. Bhaktivedanta Swami Prabhupada"),
+           (2, "Sri Shankaracharya"), (1, "Swami Chinmayananda")]
+
+
+def percentile(values, q: float):
+    """Nearest-rank percentile of `values` (q in 0..100)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(samples_ms):
+    return {"count": len(samples_ms), "p50": percentile(samples_ms, 50),
+            "p95": percentile(samples_ms, 95), "p99": percentile(samples_ms, 99)}
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"  {'':<22}{'count':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for name, stats in rows.items():
+        print(f"  {name:<22}{stats['count']:>8}{stats['p50']:>11.1f}{stats['p95']:>11.1f}{stats['p99']:>11.1f}")
+
+
+def parse_server_timing(header: str):
+    timings = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value)
+    return timings
+
+
+# --- SERVER PROCESS ---
+class ServerProcess:
+    """main:app under uvicorn with the fake LLM and stub TTS, plus an RSS sampler."""
+
+    def __init__(self, port: int, extra_env=None):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.env = {**os.environ, "LLM_BACKEND": "fake", "TTS_BACKEND": "stub", "SERVER_TIMING": "1",
+                    "AUDIO_BASE_URL": f"http://127.0.0.1:{port}", **(extra_env or {})}
+        self.process = None
+        self.rss_samples = []
+        self._sampling = False
+
+    def start(self, timeout: float):
+        import httpx
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"Server exited during startup with code {self.process.returncode}.")
+            try:
+                # /readyz answers 503 until the model and index are warm, so timings exclude the cold start
+                if httpx.get(self.url + "/readyz", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        else:
+            self.stop()
+            raise SystemExit(f"Server was not ready within {timeout:.0f}s.")
+        self._sampling = True
+        threading.Thread(target=self._sample_rss, daemon=True).start()
+
+    def _sample_rss(self):
+        while self._sampling:
+            rss = read_memory(self.process.pid).get("VmRSS")
+            if rss is not None:
+                self.rss_samples.append(rss)
+            time.sleep(0.5)
+
+    def memory(self):
+        stats = read_memory(self.process.pid)
+        return {"rss_mb": stats.get("VmRSS"), "peak_rss_mb": stats.get("VmHWM"),
+                "mean_rss_mb": sum(self.rss_samples) / len(self.rss_samples) if self.rss_samples else None}
+
+    def stop(self):
+        self._sampling = False
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def read_memory(pid: int):
+    """VmRSS / VmHWM of a process in MB, from /proc (Linux only; empty elsewhere)."""
+    stats = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    stats[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return stats
+
+
+# --- LOAD GENERATOR ---
+class LoadRun:
+    def __init__(self, url: str, endpoint: str, audio_fraction: float, seed: int):
+        self.url = url
+        self.endpoint = endpoint
+        self.audio_fraction = audio_fraction
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.first_token = []
+        self.stages = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def next_payload(self):
+        _, query, language = self.random.choices(QUERY_MIX, weights=[w for w, _, _ in QUERY_MIX])[0]
+        author = self.random.choices(AUTHORS, weights=[w for w, _ in AUTHORS])[0][1]
+        return {"query": query, "author": author, "output_language": language,
+                "generate_audio": self.random.random() < self.audio_fraction}
+
+    async def one_request(self, client, record=True):
+        payload = self.next_payload()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            if self.endpoint == "stream":
+                timing, first_token = await self._stream(client, payload, started)
+            else:
+                response = await client.post(self.url + "/ask", json=payload)
+                response.raise_for_status()
+                timing, first_token = response.headers.get("server-timing", ""), None
+        except Exception as e:
+            if record:
+                self.errors[type(e).__name__] += 1
+            return
+        finally:
+            self.in_flight -= 1
+        if not record:
+            return
+        self.latencies.append((time.perf_counter() - started) * 1000.0)
+        if first_token is not None:
+            self.first_token.append(first_token)
+        for stage, ms in parse_server_timing(timing).items():
+            self.stages[stage].append(ms)
+
+    async def _stream(self, client, payload, started):
+        timing, first_token, event = "", None, None
+        async with client.stream("POST", self.url + "/ask/stream", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    if event == "token" and first_token is None:
+                        first_token = (time.perf_counter() - started) * 1000.0
+                    elif event == "done":
+                        timing = json.loads(line[len("data: "):]).get("server_timing", "")
+                    elif event == "error":
+                        raise RuntimeError(json.loads(line[len("data: "):]).get("detail"))
+        return timing, first_token
+
+    async def closed_loop(self, client, concurrency: int, requests: int):
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await self.one_request(client)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def open_loop(self, client, rate: float, duration: float):
+        tasks = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(self.one_request(client)))
+            await asyncio.sleep(self.random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+
+async def run_load(args, url):
+    import httpx
+    run = LoadRun(url, args.endpoint, args.audio_fraction, args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100))
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+        if args.warmup:
+            print(f"Warming up with {args.warmup} requests...")
+            for _ in range(args.warmup):
+                await run.one_request(client, record=False)
+        started = time.perf_counter()
+        if args.rate:
+            print(f"Open loop: {args.rate} req/s for {args.duration}s against {url}/{args.endpoint}...")
+            await run.open_loop(client, args.rate, args.duration)
+        else:
+            print(f"Closed loop: {args.requests} requests at concurrency {args.concurrency} against {url}...")
+            await run.closed_loop(client, args.concurrency, args.requests)
+        elapsed = time.perf_counter() - started
+    return run, elapsed
+
+
+def load_command(args):
+    server = None
+    url = args.url
+    if url is None:
+        server = ServerProcess(args.port)
+        print(f"Starting main:app on port {args.port} with the fake LLM and stub TTS...")
+        server.start(args.startup_timeout)
+        url = server.url
+    try:
+        run, elapsed = asyncio.run(run_load(args, url))
+        memory = server.memory() if server else (read_memory(args.pid) if args.pid else {})
+    finally:
+        if server:
+            server.stop()
+
+    completed = len(run.latencies)
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "func"},
+        "completed": completed,
+        "errors": dict(run.errors),
+        "seconds": elapsed,
+        "throughput_rps": completed / elapsed if elapsed else 0.0,
+        "max_in_flight": run.max_in_flight,
+        "latency_ms": summarize(run.latencies),
+        "first_token_ms": summarize(run.first_token) if run.first_token else None,
+        "stages_ms": {stage: summarize(samples) for stage, samples in sorted(run.stages.items())},
+        "memory": memory,
+    }
+
+    print(f"\n{completed} requests in {elapsed:.1f}s: {report['throughput_rps']:.2f} req/s, "
+          f"{sum(run.errors.values())} errors {dict(run.errors) or ''}, max {run.max_in_flight} in flight")
+    rows = {"client latency": report["latency_ms"]}
+    if report["first_token_ms"]:
+        rows["client first token"] = report["first_token_ms"]
+    print_table("End to end", rows)
+    print_table("Server stages (Server-Timing)", report["stages_ms"])
+    if memory:
+        print(f"\nMemory: " + ", ".join(f"{key} {value:.0f}" for key, value in memory.items() if value is not None))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to '{args.json}'.")
+
+
+# --- MICROBENCHMARKS ---
+def timed(fn, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return summarize(samples)
+
+
+def micro_command(args):
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.chdir(BACKEND_DIR)
+    from gita_rag import GitaRAG
+    from context_builder import build_context
+
+    engine = GitaRAG()
+    queries = [query for _, query, _ in QUERY_MIX]
+    rng = random.Random(args.seed)
+    author = AUTHORS[0][1]
+
+    started = time.perf_counter()
+    engine._load_embedding_model()
+    print(f"Embedding model loaded in {time.perf_counter() - started:.1f}s.")
+    vectors = engine._encode_texts(queries)
+
+    rows = {
+        "encode x1": timed(lambda: engine._encode_texts([rng.choice(queries)]), args.iterations),
+        f"encode x{args.batch_size}": timed(
+            lambda: engine._encode_texts([rng.choice(queries) for _ in range(args.batch_size)]),
+            max(1, args.iterations // 10),
+        ),
+        "vector query": timed(lambda: engine._query_collection(vectors[rng.randrange(len(vectors))], author, 5),
+                              args.iterations),
+    }
+    results = engine._query_collection(vectors[0], author, 5)
+    rows["context build"] = timed(lambda: build_context(results), args.iterations)
+    if engine.verse_index is not None:
+        rows["verse lookup"] = timed(lambda: engine.verse_index.lookup(rng.choice(queries), author), args.iterations)
+    print_table(f"Microbenchmarks (EMBEDDING_BACKEND={os.environ.get('EMBEDDING_BACKEND', 'torch')}, "
+                f"RETRIEVAL_ENGINE={os.environ.get('RETRIEVAL_ENGINE', 'chroma')})", rows)
+    print(f"\nRSS: {read_memory(os.getpid()).get('VmRSS', float('nan')):.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "func"}, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load tests and microbenchmarks for the backend.")
+    subparsers = parser.add_subparsers(required=True)
+
+    load = subparsers.add_parser("load", help="Drive /ask against main:app with fake LLM/TTS backends")
+    load.add_argument("--url", help="Target a running server instead of starting one")
+    load.add_argument("--pid", type=int, help="With --url: process id to report RSS for")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--endpoint", choices=["ask", "stream"], default="ask")
+    load.add_argument("--concurrency", type=int, default=8, help="Closed loop: concurrent clients")
+    load.add_argument("--requests", type=int, default=200, help="Closed loop: total requests")
+    load.add_argument("--rate", type=float, default=0.0, help="Open loop: arrivals per second (overrides closed loop)")
+    load.add_argument("--duration", type=float, default=60.0, help="Open loop: seconds")
+    load.add_argument("--audio-fraction", type=float, default=0.0, help="Share of requests with generate_audio")
+    load.add_argument("--warmup", type=int, default=5)
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--request-timeout", type=float, default=120.0)
+    load.add_argument("--startup-timeout", type=float, default=600.0)
+    load.add_argument("--json", help="Write the report to this file")
+    load.set_defaults(func=load_command)
+
+    micro = subparsers.add_parser("micro", help="In-process encode / vector query / context microbenchmarks")
+    micro.add_argument("--iterations", type=int, default=200)
+    micro.add_argument("--batch-size", type=int, default=32)
+    micro.add_argument("--seed", type=int, default=0)
+    micro.add_argument("--json", help="Write the results to this file")
+    micro.set_defaults(func=micro_command)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,29 @@
+# compression.py (Response compression for the JSON API)
+#
+# Answers and their sources are highly compressible text, and mobile clients pay for
+# every byte. Responses are brotli-compressed when brotli-asgi is installed and the
+# client accepts it, gzip otherwise. Event streams and audio are passed through
+# untouched: compressing them would buffer the stream (or waste CPU on MP3 data).
+
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 500, uncompressed_paths=("/ask/stream", "/audio/")):
+        self.app = app
+        self.uncompressed_paths = tuple(uncompressed_paths)
+        if BrotliMiddleware is not None:
+            self.compressed_app = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed_app = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.uncompressed_paths):
+            await self.compressed_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
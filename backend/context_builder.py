@@ -0,0 +1,174 @@
+# context_builder.py (Verse-grouped, token-budgeted context for the Gemini prompt)
+#
+# Retrieval hits are grouped by verse, so the shloka is written once per verse, and
+# consecutive chunks of the same commentary are stitched back together without their
+# overlap. Verses are then added best-first until the token budget is used up, which
+# keeps prompt size (and so Gemini latency and cost) predictable.
+
+import os
+import re
+from collections import OrderedDict
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+# Below this many remaining tokens a verse is dropped rather than truncated
+MIN_PASSAGE_TOKENS = 60
+MAX_OVERLAP_CHARS = 200
+# Length of the commentary excerpt in compact source references (see source_refs)
+SOURCE_SNIPPET_CHARS = int(os.environ.get("SOURCE_SNIPPET_CHARS", "160"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 bytes of UTF-8 per token), good enough for budgeting without a tokenizer."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    if estimate_tokens(text) <= tokens:
+        return text
+    truncated = text.encode("utf-8")[:tokens * 4].decode("utf-8", errors="ignore")
+    # Cut back to a word boundary when there is one
+    cut = truncated.rfind(" ")
+    return (truncated[:cut] if cut > len(truncated) // 2 else truncated) + " ..."
+
+
+def _merge_overlapping(first: str, second: str) -> str:
+    # Chunks of one commentary overlap by up to chunk_overlap characters; drop the repeated part
+    for size in range(min(len(first), len(second), MAX_OVERLAP_CHARS), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + " " + second
+
+
+def _group_hits(results):
+    """Verses in order of their best hit, each with its commentary pieces merged by chunk_index."""
+    documents = results['documents'][0]
+    metadatas = results['metadatas'][0]
+    distances = (results.get('distances') or [[]])[0] or [float(rank) for rank in range(len(documents))]
+
+    verses = OrderedDict()
+    for rank in sorted(range(len(documents)), key=lambda i: distances[i]):
+        metadata = metadatas[rank]
+        verse = verses.setdefault(metadata.get('shloka_id', 'N/A'), {"metadata": metadata, "pieces": {}})
+        key = (metadata.get('author'), metadata.get('commentary_type'))
+        verse["pieces"].setdefault(key, []).append((metadata.get('chunk_index', 0), documents[rank]))
+
+    for verse in verses.values():
+        merged = []
+        for (author, commentary_type), chunks in verse["pieces"].items():
+            chunks.sort()
+            text, previous_index = chunks[0][1], chunks[0][0]
+            for chunk_index, document in chunks[1:]:
+                if chunk_index == previous_index:
+                    continue  # Same chunk returned twice
+                if chunk_index == previous_index + 1:
+                    text = _merge_overlapping(text, document)
+                else:
+                    text += " ... " + document
+                previous_index = chunk_index
+            merged.append({"author": author, "commentary_type": commentary_type, "text": text})
+        verse["pieces"] = merged
+    return list(verses.values())
+
+
+def build_context(results, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Returns (context_string, source_documents, stats) for Chroma-shaped query results.
+    `stats` reports the estimated context size in tokens and how many verses were used or dropped.
+    """
+    stats = {"context_tokens": 0, "token_budget": token_budget, "verses": 0, "dropped_verses": 0}
+    if not results or not results.get('documents') or not results['documents'][0]:
+        return "No relevant passages found for your query.", [], stats
+
+    parts, source_documents = [], []
+    used = 0
+    for verse in _group_hits(results):
+        metadata = verse["metadata"]
+        header = (f"Passage {stats['verses'] + 1} (from Chapter {metadata['chapter']}, Verse {metadata['verse']}):\n"
+                  f"Shloka: {metadata['shloka_sanskrit']}\n")
+        remaining = token_budget - used - estimate_tokens(header)
+        # The best verse is always included, truncated if need be
+        if remaining < MIN_PASSAGE_TOKENS and stats["verses"]:
+            stats["dropped_verses"] += 1
+            continue
+
+        block = header
+        for piece in verse["pieces"]:
+            line_prefix = "Commentary: "
+            available = remaining - estimate_tokens(line_prefix) - 1
+            if available < MIN_PASSAGE_TOKENS // 2 and block != header:
+                break
+            text = _truncate_to_tokens(piece["text"], max(available, 1))
+            line = f"{line_prefix}{text}\n"
+            block += line
+            remaining -= estimate_tokens(line)
+            source_documents.append({
+                "shloka_id": metadata.get('shloka_id', 'N/A'),
+                "shloka_sanskrit": metadata.get('shloka_sanskrit', 'N/A'),
+                "commentary": piece["text"],
+                "author": piece["author"] or 'N/A',
+                "commentary_type": piece["commentary_type"],
+            })
+        parts.append(block + "\n")
+        used += estimate_tokens(block)
+        stats["verses"] += 1
+
+    stats["context_tokens"] = used
+    return "".join(parts), source_documents, stats
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+")
+
+
+def _verse_label(shloka_id: str) -> str:
+    # "BG2.47" -> "Chapter 2, Verse 47"
+    match = re.match(r"^BG(\d+)\.(\d+)$", shloka_id or "")
+    return f"Chapter {match.group(1)}, Verse {match.group(2)}" if match else shloka_id
+
+
+def _fallback_rank(doc, output_language: str) -> int:
+    # Lower is better: a translation in the requested language, then a commentary in it, then anything else
+    commentary_type = doc.get('commentary_type') or ''
+    in_language = commentary_type.startswith(output_language.lower() + '_')
+    is_translation = commentary_type.endswith('_translation')
+    return (0 if in_language else 2) + (0 if is_translation else 1)
+
+
+def extractive_answer(source_docs, intro: str, output_language: str = 'english',
+                      max_verses: int = 3, max_chars: int = 300) -> str:
+    """
+    A degraded answer built only from the retrieved passages: for each of the top verses, its
+    translation in `output_language` when one was retrieved (else the closest passage by
+    language and type), cut to its opening sentences. Used when the LLM is too slow or unavailable.
+    """
+    best = OrderedDict()  # shloka_id -> passage, verses in retrieval order
+    for doc in source_docs:
+        current = best.get(doc['shloka_id'])
+        if current is None or _fallback_rank(doc, output_language) < _fallback_rank(current, output_language):
+            best[doc['shloka_id']] = doc
+
+    lines = []
+    for doc in list(best.values())[:max_verses]:
+        excerpt = ""
+        for sentence in _SENTENCE_END.split(doc['commentary'].strip()):
+            if excerpt and len(excerpt) + len(sentence) > max_chars:
+                break
+            excerpt = f"{excerpt} {sentence}".strip()
+        if len(excerpt) > max_chars:
+            excerpt = _truncate_to_tokens(excerpt, max_chars // 4)
+        lines.append(f"{_verse_label(doc['shloka_id'])}: {excerpt}")
+    return "\n\n".join([intro] + lines)
+
+
+def source_refs(source_docs, snippet_chars: int = SOURCE_SNIPPET_CHARS):
+    """
+    Sources as compact references (shloka_id, author, snippet) for lean responses; clients
+    fetch the full verse from GET /verse/{shloka_id} when it is opened.
+    """
+    refs = []
+    for doc in source_docs:
+        text = " ".join(doc['commentary'].split())
+        if len(text) > snippet_chars:
+            cut = text.rfind(" ", 0, snippet_chars)
+            text = text[:cut if cut > snippet_chars // 2 else snippet_chars] + " ..."
+        refs.append({"shloka_id": doc['shloka_id'], "author": doc['author'], "snippet": text})
+    return refs
@@ -0,0 +1,239 @@
+# corpus.py (Streaming readers for the slok corpus)
+#
+# Usage:
+#   python corpus.py records --out gita_records.jsonl
+#   python corpus.py chunks  --out gita_chunks.jsonl --chunk-size 1000 --chunk-overlap 100 --workers 8
+#
+# The same steps as archived/preprocessing.py and archived/chunking_data.py, but as
+# generators: slok JSON files -> commentary records -> chunks, without building any
+# intermediate file or whole-corpus list in memory. Files are parsed and chunked in a
+# process pool with a bounded window of in-flight batches, and results are emitted in
+# file order, so the output is identical whatever the worker count.
+
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_SLOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slok")
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 100
+
+# These are the possible keys for commentary text
+COMMENTARY_TYPES = {
+    'et': 'english_translation',
+    'ec': 'english_commentary',
+    'ht': 'hindi_translation',
+    'hc': 'hindi_commentary',
+    'sc': 'sanskrit_commentary'
+}
+
+
+def list_slok_files(data_directory: str = DEFAULT_SLOK_DIR):
+    """Returns the slok JSON files in a stable order, so every run sees the corpus the same way."""
+    return sorted(glob.glob(os.path.join(data_directory, '*.json')))
+
+
+def corpus_fingerprint(data_directory: str = DEFAULT_SLOK_DIR) -> str:
+    """Hash of every slok file's name and contents: changes whenever any verse or commentary does."""
+    digest = hashlib.sha256()
+    for file_path in list_slok_files(data_directory):
+        digest.update(os.path.basename(file_path).encode('utf-8') + b'\0')
+        with open(file_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def parse_slok_file(file_path: str):
+    """
+    Parses a single shloka JSON file and transforms it into a list of
+    structured commentary dictionaries.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Error reading or parsing {file_path}: {e}")
+        return []
+
+    # Extract information common to all commentaries in this file
+    base_info = {
+        'shloka_id': data.get('_id'),
+        'chapter': data.get('chapter'),
+        'verse': data.get('verse'),
+        'shloka_sanskrit': data.get('slok'),
+        'shloka_transliteration': data.get('transliteration'),
+    }
+
+    parsed_commentaries = []
+    for author_key, author_data in data.items():
+        # We only care about keys that contain author commentary dictionaries
+        if isinstance(author_data, dict) and 'author' in author_data:
+            for type_key, type_name in COMMENTARY_TYPES.items():
+                if type_key in author_data and author_data[type_key]:
+                    parsed_commentaries.append({
+                        **base_info,
+                        'author': author_data['author'],
+                        'commentary_type': type_name,
+                        'commentary_text': author_data[type_key]
+                    })
+    return parsed_commentaries
+
+
+def iter_records(data_directory: str = DEFAULT_SLOK_DIR):
+    """Yields one commentary record at a time across the whole corpus."""
+    for file_path in list_slok_files(data_directory):
+        yield from parse_slok_file(file_path)
+
+
+def make_text_splitter(chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP):
+    # Same splitter and settings as archived/chunking_data.py, so chunk boundaries match the existing database
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
+
+
+def chunk_record(record, text_splitter):
+    """Splits one commentary record into chunks shaped like archived/chunking_data.py's output."""
+    chunks = []
+    for i, text_part in enumerate(text_splitter.split_text(record['commentary_text'])):
+        chunks.append({
+            'text_to_embed': text_part,
+            'metadata': {
+                'author': record['author'],
+                'chapter': record['chapter'],
+                'verse': record['verse'],
+                'shloka_id': record['shloka_id'],
+                'commentary_type': record['commentary_type'],
+                'shloka_sanskrit': record['shloka_sanskrit'],
+                'chunk_index': i
+            }
+        })
+    return chunks
+
+
+def iter_chunks(records, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP):
+    text_splitter = make_text_splitter(chunk_size, chunk_overlap)
+    for record in records:
+        yield from chunk_record(record, text_splitter)
+
+
+def chunk_id(chunk) -> str:
+    """Deterministic id: changes exactly when the chunk's text or identifying metadata changes."""
+    metadata = chunk['metadata']
+    key = json.dumps(
+        [metadata['shloka_id'], metadata['author'], metadata['commentary_type'], metadata['chunk_index'],
+         chunk['text_to_embed'], metadata['shloka_sanskrit']],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+# --- PARALLEL PIPELINE ---
+_worker_splitter = None
+_worker_serialize = False
+
+
+def _init_chunk_worker(chunk_size, chunk_overlap, serialize=False):
+    global _worker_splitter, _worker_serialize
+    _worker_splitter = make_text_splitter(chunk_size, chunk_overlap) if chunk_size else None
+    _worker_serialize = serialize
+
+
+def _process_files(file_paths):
+    # Runs in a worker process: slok files -> their records, or their chunks when a splitter is set
+    items = []
+    for file_path in file_paths:
+        records = parse_slok_file(file_path)
+        if _worker_splitter is None:
+            items.extend(records)
+            continue
+        for record in records:
+            items.extend(chunk_record(record, _worker_splitter))
+    if _worker_serialize:
+        # Serializing in the worker leaves the parent with a single string to receive and write
+        return ["".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)]
+    return items
+
+
+def _iter_parallel(data_directory, chunk_size, chunk_overlap, workers, window, files_per_task=16, serialize=False):
+    files = list_slok_files(data_directory)
+    if workers <= 1:
+        _init_chunk_worker(chunk_size, chunk_overlap, serialize)
+        for file_path in files:
+            yield from _process_files([file_path])
+        return
+
+    # Files are small, so several go to each task to keep inter-process overhead low
+    tasks = [files[i:i + files_per_task] for i in range(0, len(files), files_per_task)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_chunk_worker,
+                             initargs=(chunk_size, chunk_overlap, serialize)) as executor:
+        # Only `window` tasks are in flight at once, so memory stays bounded however large the corpus is
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(executor.submit(_process_files, task))
+            if len(in_flight) >= window:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def iter_records_parallel(data_directory: str = DEFAULT_SLOK_DIR, workers: int = 1, window: int = 16):
+    """Like iter_records, but parses files in a process pool. Output order is unchanged."""
+    return _iter_parallel(data_directory, 0, 0, workers, window)
+
+
+def iter_chunks_parallel(data_directory: str = DEFAULT_SLOK_DIR, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, workers: int = 1, window: int = 16):
+    """Like iter_chunks(iter_records(...)), but parses and chunks files in a process pool. Output order is unchanged."""
+    return _iter_parallel(data_directory, chunk_size, chunk_overlap, workers, window)
+
+
+def iter_jsonl_blocks(stage: str, data_directory: str = DEFAULT_SLOK_DIR, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, workers: int = 1, window: int = 16):
+    """Yields blocks of newline-delimited JSON for the 'records' or 'chunks' stage, serialized in the workers."""
+    if stage == "records":
+        chunk_size = chunk_overlap = 0
+    return _iter_parallel(data_directory, chunk_size, chunk_overlap, workers, window, serialize=True)
+
+
+def read_jsonl(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess and chunk the slok corpus into JSONL.")
+    parser.add_argument("stage", choices=["records", "chunks"])
+    parser.add_argument("--slok-dir", default=DEFAULT_SLOK_DIR)
+    parser.add_argument("--out", default="-", help="Output JSONL file ('-' for stdout)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    blocks = iter_jsonl_blocks(args.stage, args.slok_dir, args.chunk_size, args.chunk_overlap, workers=args.workers)
+    started = time.perf_counter()
+    count = size = 0
+    out = sys.stdout if args.out == "-" else open(args.out, 'w', encoding='utf-8')
+    try:
+        for block in blocks:
+            out.write(block)
+            count += block.count("\n")
+            size += len(block.encode("utf-8"))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {count} {args.stage} ({size / 1e6:.1f} MB) from {len(list_slok_files(args.slok_dir))} files "
+          f"in {elapsed:.2f}s: {count / elapsed:.0f} {args.stage}/s, {size / 1e6 / elapsed:.1f} MB/s "
+          f"with {args.workers} workers.", file=sys.stderr)
@@ -0,0 +1,188 @@
+# embed_job.py (Resumable, sharded embedding generation)
+#
+# Usage:
+#   python corpus.py chunks --out gita_chunks.jsonl
+#   python embed_job.py --chunks gita_chunks.jsonl --out embedding_job --workers 4
+#   # split across machines sharing the output directory:
+#   python embed_job.py ... --num-shards 2 --shard-index 0      (and --shard-index 1 on the other)
+#   python ingest.py --embeddings embedding_job                  # load the vectors into ChromaDB
+#
+# Replaces archived/generate_embeddings.py, which encoded everything in one call and
+# only saved at the very end. Here the output is a preallocated .npy memmap plus a
+# completion bitmap that is synced after every batch, so an interrupted run resumes
+# where it stopped. Rows are split into shards handled by separate worker processes,
+# and inside a shard texts are length-sorted so each batch pads as little as possible.
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+MODEL_NAME = 'paraphrase-multilingual-mpnet-base-v2'
+EMBEDDING_DIM = 768
+
+
+def job_paths(out_dir: str):
+    return {
+        "meta": os.path.join(out_dir, "meta.json"),
+        "offsets": os.path.join(out_dir, "offsets.npy"),
+        "embeddings": os.path.join(out_dir, "embeddings.npy"),
+        "done": os.path.join(out_dir, "done.npy"),
+    }
+
+
+def prepare_job(chunks_path: str, out_dir: str):
+    """Indexes the chunk file and preallocates the output arrays. Reuses an existing job for the same input."""
+    paths = job_paths(out_dir)
+    stat = os.stat(chunks_path)
+    source = {"path": os.path.abspath(chunks_path), "size": stat.st_size, "mtime": stat.st_mtime}
+    if os.path.exists(paths["meta"]):
+        with open(paths["meta"], "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["source"] == source and meta["model"] == MODEL_NAME:
+            return meta
+        raise SystemExit(f"'{out_dir}' holds a job for a different input or model; use another --out.")
+
+    os.makedirs(out_dir, exist_ok=True)
+    # Byte offset of every line, so workers can read just the chunks of their shard
+    offsets = []
+    with open(chunks_path, "rb") as f:
+        position = 0
+        for line in f:
+            if line.strip():
+                offsets.append(position)
+            position += len(line)
+    np.save(paths["offsets"], np.asarray(offsets, dtype=np.int64))
+
+    count = len(offsets)
+    # float32, like the vector index the rows end up in (see numpy_index.py)
+    np.lib.format.open_memmap(paths["embeddings"], mode="w+", dtype=np.float32, shape=(count, EMBEDDING_DIM)).flush()
+    np.lib.format.open_memmap(paths["done"], mode="w+", dtype=np.bool_, shape=(count,)).flush()
+
+    meta = {"source": source, "count": count, "model": MODEL_NAME, "dim": EMBEDDING_DIM}
+    with open(paths["meta"], "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def job_vectors(out_dir: str):
+    """
+    {chunk_id: vector} for every row the job has finished, as read-only views of its memmap.
+    ingest.py upserts these instead of encoding the chunks again; unfinished rows are left out.
+    """
+    from corpus import chunk_id, read_jsonl
+
+    paths = job_paths(out_dir)
+    with open(paths["meta"], "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["model"] != MODEL_NAME:
+        raise ValueError(f"Embedding job in '{out_dir}' was made with {meta['model']}, not {MODEL_NAME}.")
+    embeddings = np.load(paths["embeddings"], mmap_mode="r")
+    done = np.load(paths["done"], mmap_mode="r")
+    return {chunk_id(chunk): embeddings[row]
+            for row, chunk in enumerate(read_jsonl(meta["source"]["path"])) if done[row]}
+
+
+# --- WORKER PROCESS ---
+_model = None
+
+
+def _init_worker(threads: int):
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        torch.set_num_threads(threads)
+    _model = SentenceTransformer(MODEL_NAME, device='cpu')
+
+
+def _embed_shard(chunks_path: str, out_dir: str, start: int, end: int, batch_size: int):
+    paths = job_paths(out_dir)
+    offsets = np.load(paths["offsets"], mmap_mode="r")
+    embeddings = np.load(paths["embeddings"], mmap_mode="r")
+    done = np.load(paths["done"], mmap_mode="r")
+    row_bytes = embeddings.shape[1] * embeddings.dtype.itemsize
+
+    rows = [row for row in range(start, end) if not done[row]]
+    if not rows:
+        return 0
+    texts = {}
+    with open(chunks_path, "rb") as f:
+        for row in rows:
+            f.seek(int(offsets[row]))
+            texts[row] = json.loads(f.readline())["text_to_embed"]
+
+    # Rows are written with pwrite rather than through the memmap, so only this shard's bytes
+    # are ever touched; that keeps workers (or machines on a shared disk) from clobbering each other.
+    embeddings_fd = os.open(paths["embeddings"], os.O_RDWR)
+    done_fd = os.open(paths["done"], os.O_RDWR)
+    try:
+        # Similar lengths in a batch means little padding in each forward pass
+        rows.sort(key=lambda row: len(texts[row]))
+        for i in range(0, len(rows), batch_size):
+            batch_rows = rows[i:i + batch_size]
+            vectors = _model.encode([texts[row] for row in batch_rows], batch_size=batch_size)
+            vectors = np.ascontiguousarray(vectors, dtype=embeddings.dtype)
+            for row, vector in zip(batch_rows, vectors):
+                os.pwrite(embeddings_fd, vector.tobytes(), embeddings.offset + row * row_bytes)
+            os.fsync(embeddings_fd)
+            # Only mark rows done once their vectors are on disk
+            for row in batch_rows:
+                os.pwrite(done_fd, b"\x01", done.offset + row)
+            os.fsync(done_fd)
+    finally:
+        os.close(embeddings_fd)
+        os.close(done_fd)
+    return len(rows)
+
+
+# --- DRIVER ---
+def run_job(chunks_path: str, out_dir: str, workers: int = 1, shard_size: int = 2048,
+            batch_size: int = 32, num_shards: int = 1, shard_index: int = 0, threads_per_worker: int = 0):
+    meta = prepare_job(chunks_path, out_dir)
+    done = np.load(job_paths(out_dir)["done"], mmap_mode="r")
+
+    shards = []
+    for shard_number, start in enumerate(range(0, meta["count"], shard_size)):
+        end = min(start + shard_size, meta["count"])
+        if shard_number % num_shards == shard_index and not done[start:end].all():
+            shards.append((start, end))
+    remaining = sum(end - start - int(done[start:end].sum()) for start, end in shards)
+    print(f"{meta['count']} chunks total; {remaining} left to embed in {len(shards)} shards on {workers} workers.")
+    if not shards:
+        return meta
+
+    started = time.perf_counter()
+    embedded = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads_per_worker,)) as executor:
+        futures = [executor.submit(_embed_shard, chunks_path, out_dir, start, end, batch_size) for start, end in shards]
+        for future in as_completed(futures):
+            embedded += future.result()
+            elapsed = time.perf_counter() - started
+            print(f"  {embedded}/{remaining} chunks embedded ({embedded / elapsed:.1f} chunks/s)")
+
+    complete = int(np.load(job_paths(out_dir)["done"], mmap_mode="r").sum())
+    print(f"Done: {complete}/{meta['count']} rows complete in '{out_dir}'.")
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable, sharded embedding generation into a memory-mapped store.")
+    parser.add_argument("--chunks", default="gita_chunks.jsonl", help="Chunk JSONL written by corpus.py")
+    parser.add_argument("--out", default="embedding_job")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="torch threads per worker (0 = default)")
+    parser.add_argument("--shard-size", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-shards", type=int, default=1, help="Split shards across this many machines")
+    parser.add_argument("--shard-index", type=int, default=0, help="Which machine this is (0-based)")
+    args = parser.parse_args()
+
+    run_job(
+        args.chunks, args.out, workers=args.workers, shard_size=args.shard_size,
+        batch_size=args.batch_size, num_shards=args.num_shards, shard_index=args.shard_index,
+        threads_per_worker=args.threads_per_worker,
+    )
@@ -0,0 +1,116 @@
+# embedding_batcher.py (Micro-batching in front of the embedding model)
+
+import time
+import asyncio
+import contextvars
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Collects query texts from concurrent requests and encodes them together.
+    A batch is flushed when it reaches `max_batch_size` or when `max_wait_ms` has passed
+    since its first text arrived. `encode_batch` is an async callable taking a list of
+    texts and returning one vector per text, in order. At most `max_inflight_batches`
+    batches are encoded at once; while they run, new texts keep accumulating so the
+    next batch is fuller.
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0, max_inflight_batches=2):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_inflight_batches = max_inflight_batches
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.encode_seconds = 0.0
+
+        self._loop = None
+        self._queue = None
+        self._inflight = None
+        self._worker = None
+        self._encoding = set()  # running _encode tasks; the loop only keeps weak references to tasks
+
+    async def embed(self, text: str):
+        """Queues `text` for the next batch and waits for its vector."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "encode_seconds": self.encode_seconds,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+    # --- INTERNALS ---
+    def _ensure_worker(self):
+        # The queue and worker belong to one event loop; rebuild them if we are now on another.
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._inflight = asyncio.Semaphore(self.max_inflight_batches)
+        # A fresh context, so batch work isn't attributed to whichever request started the worker
+        self._worker = loop.create_task(self._collect_batches(), context=contextvars.Context())
+
+    async def _collect_batches(self):
+        while True:
+            await self._inflight.acquire()
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Drop waiters that were cancelled while queued
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                self._inflight.release()
+                continue
+            task = self._loop.create_task(self._encode(batch))
+            self._encoding.add(task)
+            task.add_done_callback(self._encoding.discard)
+
+    async def _encode(self, batch):
+        texts = [text for text, _ in batch]
+        started = time.perf_counter()
+        try:
+            vectors = await self.encode_batch(texts)
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(texts)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            # Cancelled (e.g. at shutdown): don't leave the waiting requests hanging
+            for _, future in batch:
+                future.cancel()
+            raise
+        finally:
+            self._inflight.release()
+
+        self.batches += 1
+        self.items += len(texts)
+        self.largest_batch = max(self.largest_batch, len(texts))
+        self.encode_seconds += time.perf_counter() - started
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
@@ -0,0 +1,73 @@
+# fake_llm.py (Local stand-in for the Gemini client, for benchmarks and tests)
+#
+# Selected with LLM_BACKEND=fake. Implements the part of genai.GenerativeModel that
+# GitaRAG uses (generate_content_async, streaming or not) with a configurable time to
+# first token, token rate and failure rate, so the backend can be load-tested without
+# spending Gemini quota.
+
+import os
+import zlib
+import random
+import asyncio
+
+_ANSWER_WORDS = (
+    "My dear friend, listen with your heart. Do your duty without attachment to its fruits, "
+    "for the one who acts with a steady mind, untouched by success and failure, finds peace. "
+    "The Self is eternal; it is neither born nor does it die. Surrender your worries to me, "
+    "and walk the path of action, devotion and knowledge with a calm and loving heart. "
+).split()
+
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [text]
+
+
+class FakeLLM:
+    def __init__(self, first_token_latency: float = 0.5, tokens_per_second: float = 50.0,
+                 answer_tokens: int = 200, tokens_per_chunk: int = 8, failure_rate: float = 0.0):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.tokens_per_chunk = tokens_per_chunk
+        self.failure_rate = failure_rate
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            first_token_latency=float(os.environ.get("FAKE_LLM_FIRST_TOKEN_MS", "500")) / 1000.0,
+            tokens_per_second=float(os.environ.get("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+            answer_tokens=int(os.environ.get("FAKE_LLM_ANSWER_TOKENS", "200")),
+            failure_rate=float(os.environ.get("FAKE_LLM_FAILURE_RATE", "0")),
+        )
+
+    def _chunks(self, prompt):
+        # The answer as chunk texts of `tokens_per_chunk` words; different prompts get different answers
+        offset = zlib.crc32(str(prompt).encode("utf-8"))
+        words = [_ANSWER_WORDS[(offset + i) % len(_ANSWER_WORDS)] for i in range(self.answer_tokens)]
+        return [" ".join(words[i:i + self.tokens_per_chunk]) + " " for i in range(0, len(words), self.tokens_per_chunk)]
+
+    def _chunk_delay(self):
+        return self.tokens_per_chunk / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Fake LLM failure (simulated)")
+
+    async def generate_content_async(self, prompt, safety_settings=None, stream=False):
+        chunks = self._chunks(prompt)
+        if not stream:
+            await asyncio.sleep(self.first_token_latency + self._chunk_delay() * (len(chunks) - 1))
+            self._maybe_fail()
+            return FakeChunk("".join(chunks))
+
+        await asyncio.sleep(self.first_token_latency)
+        self._maybe_fail()
+
+        async def generate():
+            for i, text in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(self._chunk_delay())
+                yield FakeChunk(text)
+        return generate()
@@ -2,78 +2,269 @@
 
 import os
 import json
-import chromadb
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
+import asyncio
+import functools
+import contextlib
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from admission import AdmissionController
+from answer_cache import SemanticAnswerCache
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context, estimate_tokens, extractive_answer
+from embedding_batcher import EmbeddingBatcher
+from ingest import DEFAULT_MANIFEST, manifest_fingerprint
+from metrics import span, record, record_queue_wait, cache_event, PROMPT_TOKENS, ANSWER_CHARS
+from model_server import LocalModels, ModelClient
+from precompute import PrecomputedAnswers, answer_version
+from query_cache import QueryEmbeddingCache, normalize_query
+from resilience import CircuitBreaker, LatencyTracker, hedged_call, open_stream
+from singleflight import SingleFlight
+from verse_index import VerseIndex
+from verse_table import expand_results, shared_verse_table
+
 load_dotenv()
 
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+# --- ASYNC PIPELINE LIMITS ---
+# CPU-bound work (embedding, vector search) runs on a dedicated executor so it never
+# competes with Starlette's threadpool, and every stage has its own concurrency cap
+# so slow Gemini calls can't starve embedding capacity.
+CPU_EXECUTOR_WORKERS = int(os.environ.get("CPU_EXECUTOR_WORKERS", str(os.cpu_count() or 4)))
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "2"))
+RETRIEVAL_CONCURRENCY = int(os.environ.get("RETRIEVAL_CONCURRENCY", "4"))
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "16"))
+# Concurrent queries are micro-batched into a single encode call
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", "5"))
+
+# Admission control for answers that need Gemini (cache hits skip it): at most
+# LLM_MAX_IN_FLIGHT generations, LLM_MAX_QUEUE more waiting up to LLM_QUEUE_TIMEOUT_SECONDS;
+# anything beyond that is rejected at once with admission.Overloaded (see admission.py).
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", str(LLM_CONCURRENCY)))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Batch jobs (ask_krishna_batch_async) run at most this many Gemini generations at once by default.
+# All batches together never hold more than BATCH_LLM_MAX_CONCURRENCY generations (a quarter of
+# LLM_CONCURRENCY by default), in a gate of their own, so they can't take interactive slots.
+BATCH_LLM_MAX_CONCURRENCY = int(os.environ.get("BATCH_LLM_MAX_CONCURRENCY", str(max(1, LLM_CONCURRENCY // 4))))
+BATCH_LLM_CONCURRENCY = min(int(os.environ.get("BATCH_LLM_CONCURRENCY", "4")), BATCH_LLM_MAX_CONCURRENCY)
+
+# --- EMBEDDING BACKEND ---
+# 'torch' runs the original SentenceTransformer; 'onnx' runs the int8 export made by
+# `python onnx_embedder.py export` (lower RSS, faster cold start, same vector space).
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "./onnx_model")
+
+# --- RETRIEVAL ENGINE ---
+# 'chroma' queries the ChromaDB collection; 'numpy' uses the memory-mapped exact index
+# from numpy_index.py (built from the collection on first start if the file is missing).
+RETRIEVAL_ENGINE = os.environ.get("RETRIEVAL_ENGINE", "chroma").lower()
+NUMPY_INDEX_PATH = os.environ.get("NUMPY_INDEX_PATH", "./gita_index.bin")
+
+# --- SHARED MODEL SERVER ---
+# With MODEL_SERVER_SOCKET set, embedding and vector search go to the sidecar from
+# model_server.py instead of a model and index loaded in this process, so several
+# workers share one copy. Warm-up waits up to MODEL_SERVER_WAIT_SECONDS for it to be ready.
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "")
+MODEL_SERVER_WAIT_SECONDS = float(os.environ.get("MODEL_SERVER_WAIT_SECONDS", "300"))
+
+# --- LLM BACKEND ---
+# 'gemini' calls the Gemini API; 'fake' uses the local stand-in from fake_llm.py
+# (for benchmarks; latency, token rate and failure rate via FAKE_LLM_* variables).
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini").lower()
+GEMINI_MODEL = 'gemini-flash-latest'
+
+# --- LLM DEADLINES ---
+# Gemini gets LLM_DEADLINE_SECONDS to answer (to its first token when streaming; a
+# stream must finish within LLM_STREAM_DEADLINE_SECONDS). Past that, or on errors, the
+# answer degrades to an extractive one built from the retrieved passages. LLM_HEDGING=1
+# fires a second call when the first is slower than the recent p95 (LLM_HEDGE_AFTER_SECONDS
+# until enough calls have been seen). After LLM_BREAKER_FAILURES consecutive failures
+# Gemini is skipped for LLM_BREAKER_RESET_SECONDS.
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "20"))
+LLM_STREAM_DEADLINE_SECONDS = float(os.environ.get("LLM_STREAM_DEADLINE_SECONDS", "60"))
+LLM_HEDGING = os.environ.get("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "8"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# --- VERSE LOOKUP ---
+# Verse references ("BG 2.47", "chapter 18 verse 66") and pasted verses are answered from
+# an in-memory index of the slok files without embedding or vector search. With
+# LEXICAL_FUSION=1, BM25 hits are also fused into ordinary vector results.
+VERSE_INDEX_ENABLED = os.environ.get("VERSE_INDEX_ENABLED", "1") == "1"
+LEXICAL_FUSION = os.environ.get("LEXICAL_FUSION", "0") == "1"
+
+# --- PRECOMPUTED ANSWERS ---
+# Answers made ahead of time by `python precompute.py run` (PRECOMPUTED_ANSWERS_PATH) are
+# served before anything else: no embedding, retrieval or Gemini call. Entries made with
+# another prompt, corpus or model are ignored (see precompute.py for the refresh policy).
+
+# --- ANSWER CACHE ---
+# Semantic answer cache entries carry the same version plus a hash of the ingest manifest
+# (INGEST_MANIFEST_PATH), so re-ingesting the collection or changing the prompt retires them.
+INGEST_MANIFEST_PATH = os.environ.get("INGEST_MANIFEST_PATH", DEFAULT_MANIFEST)
+
 class GitaRAG:
     def __init__(self):
         print("Initializing GitaRAG Engine with Gemini...")
-        self.embedding_model = None
-        print("Connecting to vector database...")
-        client = chromadb.PersistentClient(path="./gita_vector_db")
-        self.collection = client.get_collection(name="gita_commentaries")
+        # The model, index, verse index and LLM client are loaded by warm_up() (started from
+        # main.py's lifespan), or on first use if a request arrives before that.
+        if MODEL_SERVER_SOCKET:
+            # Model and index live in the shared sidecar (model_server.py)
+            print(f"Using the shared model server at '{MODEL_SERVER_SOCKET}'...")
+            self.models = ModelClient(MODEL_SERVER_SOCKET, ready_timeout=MODEL_SERVER_WAIT_SECONDS)
+        else:
+            self.models = LocalModels(EMBEDDING_BACKEND, ONNX_MODEL_DIR, RETRIEVAL_ENGINE, NUMPY_INDEX_PATH)
+        self.ready = False
+        self.warmup_error = None
+        # Semantic answer cache (None when disabled via ANSWER_CACHE_ENABLED=0)
+        self.answer_cache = SemanticAnswerCache.from_env()
+        # Query-vector cache, so re-asking with another author/language skips the transformer
+        self.query_cache = QueryEmbeddingCache.from_env(namespace=EMBEDDING_BACKEND)
+        # Precomputed answers for frequent questions (None when disabled or not built yet)
+        self.precomputed = PrecomputedAnswers.from_env()
+        # Executor and per-stage limits for the async request path
+        self.cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="gita-cpu")
+        self.stage_limits = {
+            "embed": asyncio.Semaphore(EMBED_CONCURRENCY),
+            "retrieve": asyncio.Semaphore(RETRIEVAL_CONCURRENCY),
+            "llm": asyncio.Semaphore(LLM_CONCURRENCY),
+            "llm_batch": asyncio.Semaphore(BATCH_LLM_MAX_CONCURRENCY),
+        }
+        self.embedding_batcher = EmbeddingBatcher(
+            lambda texts: self._run_cpu("embed", self._encode_texts, texts),
+            max_batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_BATCH_WAIT_MS,
+            max_inflight_batches=EMBED_CONCURRENCY,
+        )
+        # Bounded waiting for interactive generations, so overload is shed instead of queued forever
+        self.llm_admission = AdmissionController("answer", LLM_MAX_IN_FLIGHT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS)
+        # Identical concurrent questions share one embed/retrieve/generate computation
+        self.answer_flights = SingleFlight("answer")
+        # Deadlines, hedging and circuit breaking for the async Gemini calls
+        self.llm_breaker = CircuitBreaker("llm", LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        self.llm_latency = LatencyTracker()
+        self.llm_first_token_latency = LatencyTracker()
+        print("Initialization complete. Engine is warming up.")
+
+    @functools.cached_property
+    def verse_index(self):
+        if not VERSE_INDEX_ENABLED:
+            return None
+        verse_index = VerseIndex.build()
+        print(f"Loaded verse index with {len(verse_index)} verses.")
+        return verse_index
+
+    @functools.cached_property
+    def llm_client(self):
+        if LLM_BACKEND == 'fake':
+            from fake_llm import FakeLLM
+            print("Using the fake LLM backend (no Gemini calls).")
+            return FakeLLM.from_env()
         print("Initializing Gemini client...")
+        import google.generativeai as genai
         genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
-        self.llm_client = genai.GenerativeModel('gemini-flash-latest')
-        print("Initialization complete. Engine is ready.")
+        return genai.GenerativeModel(GEMINI_MODEL)
+
+    @functools.cached_property
+    def answer_version(self):
+        # What precomputed answers must have been made with to be served (see precompute.py)
+        templates = [self._prompt_text("{query}", "{context}", language) for language in ('english', 'hindi')]
+        return answer_version(templates, f"{LLM_BACKEND}:{GEMINI_MODEL}", CONTEXT_TOKEN_BUDGET)
+
+    @functools.cached_property
+    def answer_cache_version(self):
+        # Cached answers also depend on what the collection holds, which the ingest manifest records
+        return f"{self.answer_version}:{manifest_fingerprint(INGEST_MANIFEST_PATH)}"
+
+    def warm_up(self):
+        """
+        Loads everything the first request would otherwise wait for: the embedding model
+        (with one dummy encode, so its kernels are initialized), the vector index, the verse
+        table and index, and the LLM client. Sets `ready` when done, or `warmup_error` if it failed.
+        """
+        try:
+            with span("warmup"):
+                self.models.warm_up()
+                shared_verse_table()
+                self.verse_index
+                self.llm_client
+                if self.precomputed is not None:
+                    self.answer_version
+                if self.answer_cache is not None:
+                    self.answer_cache_version
+        except Exception as e:
+            self.warmup_error = f"{type(e).__name__}: {e}"
+            raise
+        self.warmup_error = None
+        self.ready = True
+        print("Warm-up complete. Engine is ready.")
 
     def _load_embedding_model(self):
-        # This function is unchanged
-        if self.embedding_model is None:
-            print("\n>>> Loading local embedding model for the first time... (This is the long wait)")
-            self.embedding_model = SentenceTransformer('paraphrase-multilingual-mpnet-base-v2', device='cpu')
-            print(">>> Embedding model loaded successfully into memory.")
-
-    def retrieve_context(self, query: str, author: str, n_results: int = 5):
-        # This function will now return TWO things: the formatted context string
-        # AND the raw source documents.
-        self._load_embedding_model()
-        print(f"Retrieving context for query: '{query}'")
-        query_embedding = self.embedding_model.encode([query]).tolist()
-        results = self.collection.query(
-            query_embeddings=query_embedding, n_results=n_results, where={"author": author}
-        )
-        
-        if not results or not results.get('documents'):
-            return "No relevant passages found for your query.", [] # Return empty list for sources
-
-        # Create the context string for the LLM
-        context_string = ""
-        source_documents = []
-
-        for i, doc in enumerate(results['documents'][0]):
-            metadata = results['metadatas'][0][i]
-            
-            # Build the string for the LLM
-            context_string += f"Passage {i+1} (from Chapter {metadata['chapter']}, Verse {metadata['verse']}):\n"
-            context_string += f"Shloka: {metadata['shloka_sanskrit']}\n"
-            context_string += f"Commentary: {doc}\n\n"
-
-            # Build the structured list for the frontend
-            source_documents.append({
-                "shloka_id": metadata.get('shloka_id', 'N/A'),
-                "shloka_sanskrit": metadata.get('shloka_sanskrit', 'N/A'),
-                "commentary": doc,
-                "author": metadata.get('author', 'N/A')
-            })
-            
+        self.models.load()
+
+    def _encode_texts(self, texts):
+        # One forward pass for the whole list; returns a (len(texts), dim) numpy array.
+        self.models.load()
+        with span("encode"):
+            return self.models.encode(texts)
+
+    def _verse_lookup(self, query: str, author: str, n_results: int = 5):
+        # Results for a verse reference or a pasted verse, or None when semantic search is needed.
+        if self.verse_index is None:
+            return None
+        with span("verse_lookup"):
+            results = self.verse_index.lookup(query, author, n_results)
+        cache_event("verse_index", results is not None)
+        if results is not None:
+            print(f"Direct verse lookup: {results['metadatas'][0][0]['shloka_id']}")
+        return results
+
+    def _query_collection_many(self, query_embeddings, author: str, n_results: int):
+        # One multi-vector query for several queries of the same author; returns one result per query.
+        table = shared_verse_table()
+        return [expand_results(results, table) for results in self.models.query_many(query_embeddings, author, n_results)]
+
+    def _fuse_lexical(self, results, query: str, author: str, n_results: int):
+        if self.verse_index is None or not LEXICAL_FUSION or not results or not results.get('ids'):
+            return results
+        return self.verse_index.fuse(results, query, author, n_results)
+
+    def _query_collection(self, query_embedding, author: str, n_results: int):
+        # Compact chunk metadata is expanded against the shared verse table (see verse_table.py)
+        return expand_results(self.models.query(query_embedding, author, n_results), shared_verse_table())
+
+    def _format_results(self, results):
+        # Groups hits by verse and fits them into the context token budget (see context_builder.py)
+        with span("context"):
+            context_string, source_documents, stats = build_context(results)
+        if source_documents:
+            print(f"Context: {stats['verses']} verses, ~{stats['context_tokens']} tokens "
+                  f"(budget {stats['token_budget']}, {stats['dropped_verses']} verses dropped)")
         return context_string, source_documents
 
-    # --- CHANGED FUNCTION ---
-    def generate_krishna_response(self, query: str, context: str, output_language: str): # <-- New parameter
-        print(f"Generating response from Lord Krishna using Gemini in {output_language}...")
-        
+    def _build_prompt(self, query: str, context: str, output_language: str):
+        prompt = self._prompt_text(query, context, output_language)
+        PROMPT_TOKENS.observe(estimate_tokens(prompt))
+        return prompt
+
+    def _prompt_text(self, query: str, context: str, output_language: str):
         # --- Create a dynamic language instruction ---
         if output_language.lower() == 'hindi':
             language_instruction = "Your final response MUST be in Hindi (using Devanagari script)."
         else: # Default to English
             language_instruction = "Your final response MUST be in English."
 
-        full_prompt = f"""
+        prompt = f"""
         You are Lord Krishna. Your tone is that of a wise and loving guide speaking to a cherished friend. Your goal is to bring clarity and peace, not to be a distant, academic scholar.
 
         Follow these essential rules:
@@ -91,29 +282,431 @@ class GitaRAG:
 
         Now, speak to them with love and clarity.
         """
-        
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-
-        response = self.llm_client.generate_content(full_prompt, safety_settings=safety_settings)
-        return response.text
+        return prompt
+
+    def _verse_cache_key(self, query: str, direct):
+        # Answer cache key for a direct verse lookup. Every spelling of a bare reference ("2.47",
+        # "BG 2.47") shares one answer; a question that mentions a verse or a pasted verse is its own entry.
+        shloka_id = direct['metadatas'][0][0]['shloka_id']
+        if self.verse_index.is_reference_only(query):
+            return f"verse:{shloka_id}"
+        return f"verse:{shloka_id}:{normalize_query(query)}"
+
+    def _lookup_answer(self, author: str, output_language: str, query_embedding=None, verse_key=None):
+        if verse_key is not None:
+            cached = self.answer_cache.lookup_key(author, output_language, verse_key, self.answer_cache_version)
+        else:
+            cached = self.answer_cache.lookup(author, output_language, query_embedding, self.answer_cache_version)
+        cache_event("answer", cached is not None)
+        if cached is not None:
+            print("Answer served from the semantic cache.")
+        return cached
+
+    def _store_answer(self, author: str, output_language: str, answer: str, source_docs,
+                      query_embedding=None, verse_key=None):
+        if verse_key is not None:
+            self.answer_cache.store_key(author, output_language, verse_key, answer, source_docs, self.answer_cache_version)
+        elif query_embedding is not None:
+            self.answer_cache.store(author, output_language, query_embedding, answer, source_docs, self.answer_cache_version)
+
+    def precomputed_answer(self, query: str, author: str, output_language: str = 'english'):
+        # (answer, sources) made ahead of time by precompute.py, or None
+        if self.precomputed is None:
+            return None
+        found = self.precomputed.get(query, author, output_language, self.answer_version)
+        cache_event("precomputed", found is not None)
+        if found is not None:
+            print("Answer served from the precomputed answers.")
+        return found
+
+    def _extractive_answer(self, source_docs, output_language: str):
+        # Degraded answer when Gemini is too slow or unavailable: the retrieved teachings themselves
+        if not source_docs:
+            return self._no_source_answer(output_language)
+        if output_language.lower() == 'hindi':
+            intro = "मेरे प्रिय साधक, अभी मैं विस्तार से नहीं कह सकता, पर ये उपदेश आपके प्रश्न का उत्तर देते हैं:"
+        else:
+            intro = "My dear seeker, I cannot speak at length just now, but these teachings answer your question:"
+        return extractive_answer(source_docs, intro, output_language)
+
+    def _no_source_answer(self, output_language: str):
+        if output_language == 'hindi':
+            return "मेरे प्रिय साधक, मुझे आपके प्रश्न के लिए मेरे उपदेशों में कोई विशेष प्रसंग नहीं मिला। संभव है आप किसी और तरह से पूछ सकें?"
+        return "My dear seeker, I could not find a specific passage for your query in my teachings. Perhaps you could ask in another way?"
 
-    # --- CHANGED FUNCTION ---
     def ask_krishna(self, query: str, author: str, output_language: str = 'english'):
-        # This function will now return the answer AND the sources.
-        retrieved_context, source_docs = self.retrieve_context(query, author)
-        
-        # If no sources are found, return a graceful message and an empty list
+        # Blocking entry point for scripts: runs ask_krishna_async (precomputed answers, caches,
+        # deadlines and breaker included) to completion. Not for use inside a running event loop.
+        return asyncio.run(self.ask_krishna_async(query, author, output_language))
+
+    # --- ASYNC PIPELINE ---
+    @contextlib.asynccontextmanager
+    async def _stage_slot(self, stage: str):
+        # Holds one of the stage's concurrency slots, recording how long it took to get one.
+        started = time.perf_counter()
+        async with self.stage_limits[stage]:
+            record_queue_wait(stage, time.perf_counter() - started)
+            yield
+
+    async def _run_cpu(self, stage: str, fn, *args, **kwargs):
+        # Runs blocking work on the CPU executor, bounded by the stage's concurrency limit.
+        async with self._stage_slot(stage):
+            loop = asyncio.get_running_loop()
+            # Run in a copy of the caller's context so spans inside `fn` count towards its request
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.cpu_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    async def embed_query_async(self, query: str):
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            cache_event("query_embedding", cached is not None)
+            if cached is not None:
+                return cached
+        with span("embed"):
+            query_embedding = await self.embedding_batcher.embed(query)
+        if self.query_cache is not None:
+            self.query_cache.put(query, query_embedding)
+        return query_embedding
+
+    async def retrieve_context_async(self, query: str, author: str, n_results: int = 5, query_embedding=None):
+        print(f"Retrieving context for query: '{query}'")
+        if query_embedding is None:
+            direct = await self._run_cpu("retrieve", self._verse_lookup, query, author, n_results)
+            if direct is not None:
+                return self._format_results(direct)
+            query_embedding = await self.embed_query_async(query)
+        with span("retrieve"):
+            results = await self._run_cpu("retrieve", self._query_collection, query_embedding, author, n_results)
+            if self.verse_index is not None and LEXICAL_FUSION:
+                results = await self._run_cpu("retrieve", self._fuse_lexical, results, query, author, n_results)
+        return self._format_results(results)
+
+    async def generate_krishna_response_async(self, query: str, context: str, output_language: str,
+                                              stage: str = "llm"):
+        # stage=None when the caller already holds a slot (batch generations hold "llm_batch")
+        print(f"Generating response from Lord Krishna using Gemini in {output_language}...")
+        full_prompt = self._build_prompt(query, context, output_language)
+        async with self._stage_slot(stage) if stage else contextlib.nullcontext():
+            with span("llm"):
+                response = await self.llm_client.generate_content_async(full_prompt, safety_settings=SAFETY_SETTINGS)
+        ANSWER_CHARS.observe(len(response.text))
+        return response.text
+
+    async def stream_krishna_response_async(self, query: str, context: str, output_language: str):
+        print(f"Streaming response from Lord Krishna using Gemini in {output_language}...")
+        full_prompt = self._build_prompt(query, context, output_language)
+        async with self._stage_slot("llm"):
+            started = time.perf_counter()
+            first_token, answer_chars = None, 0
+            response = await self.llm_client.generate_content_async(full_prompt, safety_settings=SAFETY_SETTINGS, stream=True)
+            async for chunk in response:
+                if chunk.parts:
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                        record("llm_first_token", first_token)
+                    answer_chars += len(chunk.text)
+                    yield chunk.text
+            record("llm", time.perf_counter() - started)
+        ANSWER_CHARS.observe(answer_chars)
+
+    def _hedge_delay(self, tracker: LatencyTracker):
+        return tracker.percentile(95, LLM_HEDGE_AFTER_SECONDS) if LLM_HEDGING else None
+
+    async def _generate_guarded(self, query: str, context: str, source_docs, output_language: str,
+                                stage: str = "llm"):
+        # generate_krishna_response_async under the deadline, hedging and circuit breaker.
+        # Returns (answer, degraded); a degraded answer is extractive and must not be cached.
+        if not self.llm_breaker.allow():
+            print("Gemini circuit is open; answering from the retrieved passages.")
+            return self._extractive_answer(source_docs, output_language), True
+        started = time.perf_counter()
+        try:
+            answer = await hedged_call(
+                lambda: self.generate_krishna_response_async(query, context, output_language, stage),
+                deadline=LLM_DEADLINE_SECONDS, hedge_after=self._hedge_delay(self.llm_latency),
+            )
+        except asyncio.CancelledError:
+            self.llm_breaker.abandon()
+            raise
+        except Exception as e:
+            self.llm_breaker.record_failure()
+            print(f"Gemini call failed ({type(e).__name__}: {e}); answering from the retrieved passages.")
+            return self._extractive_answer(source_docs, output_language), True
+        self.llm_breaker.record_success()
+        self.llm_latency.add(time.perf_counter() - started)
+        return answer, False
+
+    async def _stream_guarded(self, query: str, context: str, source_docs, output_language: str, outcome: dict):
+        # stream_krishna_response_async under the deadlines, hedging (on the first token) and circuit
+        # breaker. Sets outcome["degraded"] when the answer is extractive or was cut short.
+        outcome["degraded"] = False
+        if not self.llm_breaker.allow():
+            print("Gemini circuit is open; answering from the retrieved passages.")
+            outcome["degraded"] = True
+            yield self._extractive_answer(source_docs, output_language)
+            return
+        started = time.perf_counter()
+        try:
+            stream, first_text = await hedged_call(
+                lambda: open_stream(self.stream_krishna_response_async(query, context, output_language)),
+                deadline=LLM_DEADLINE_SECONDS, hedge_after=self._hedge_delay(self.llm_first_token_latency),
+                discard=lambda opened: opened[0].aclose(),
+            )
+        except asyncio.CancelledError:
+            self.llm_breaker.abandon()
+            raise
+        except Exception as e:
+            self.llm_breaker.record_failure()
+            print(f"Gemini stream failed to start ({type(e).__name__}: {e}); answering from the retrieved passages.")
+            outcome["degraded"] = True
+            yield self._extractive_answer(source_docs, output_language)
+            return
+        self.llm_first_token_latency.add(time.perf_counter() - started)
+
+        settled = False
+        try:
+            yield first_text
+            while True:
+                remaining = started + LLM_STREAM_DEADLINE_SECONDS - time.perf_counter()
+                try:
+                    text = await asyncio.wait_for(stream.__anext__(), timeout=max(remaining, 0))
+                except StopAsyncIteration:
+                    break
+                yield text
+            self.llm_breaker.record_success()
+            settled = True
+        except Exception as e:
+            # Part of the answer has already been sent, so it simply ends here
+            self.llm_breaker.record_failure()
+            settled = True
+            print(f"Gemini stream failed midway ({type(e).__name__}: {e}); ending the answer early.")
+            outcome["degraded"] = True
+        finally:
+            if not settled:
+                self.llm_breaker.abandon()
+            await stream.aclose()
+
+    async def ask_krishna_async(self, query: str, author: str, output_language: str = 'english'):
+        # The answer pipeline used by the /ask endpoint (and by ask_krishna). Precomputed answers come
+        # first; concurrent identical (query, author, language) requests are coalesced into one computation.
+        precomputed = self.precomputed_answer(query, author, output_language)
+        if precomputed is not None:
+            return precomputed
+        key = (normalize_query(query), author, output_language.lower())
+        answer, source_docs, _ = await self.answer_flights.run(
+            key, lambda: self._ask_krishna_async(query, author, output_language)
+        )
+        return answer, source_docs
+
+    async def generate_answer_async(self, query: str, author: str, output_language: str = 'english'):
+        # Always a fresh answer, never from precomputed answers or the answer cache, for offline jobs
+        # such as precompute.py. Returns (answer, source_docs, degraded) so they can skip degraded ones.
+        return await self._ask_krishna_async(query, author, output_language, use_answer_cache=False)
+
+    async def _ask_krishna_async(self, query: str, author: str, output_language: str = 'english',
+                                 use_answer_cache: bool = True):
+        # Returns (answer, source_docs, degraded). generate_answer_async passes use_answer_cache=False.
+        query_embedding = verse_key = None
+        direct = await self._run_cpu("retrieve", self._verse_lookup, query, author)
+        if direct is not None:
+            verse_key = self._verse_cache_key(query, direct)
+        else:
+            query_embedding = await self.embed_query_async(query)
+        if self.answer_cache is not None and use_answer_cache:
+            cached = self._lookup_answer(author, output_language, query_embedding, verse_key)
+            if cached is not None:
+                return (*cached, False)
+        if direct is not None:
+            retrieved_context, source_docs = self._format_results(direct)
+        else:
+            retrieved_context, source_docs = await self.retrieve_context_async(query, author, query_embedding=query_embedding)
         if not source_docs:
-            no_source_answer = "My dear seeker, I could not find a specific passage for your query in my teachings. Perhaps you could ask in another way?"
-            if output_language == 'hindi':
-                no_source_answer = "मेरे प्रिय साधक, मुझे आपके प्रश्न के लिए मेरे उपदेशों में कोई विशेष प्रसंग नहीं मिला। संभव है आप किसी और तरह से पूछ सकें?"
-            return no_source_answer, []
-
-        final_answer = self.generate_krishna_response(query, retrieved_context, output_language)
-        
-        return final_answer, source_docs
\ No newline at end of file
+            return self._no_source_answer(output_language), [], False
+
+        async with self.llm_admission.admit():
+            final_answer, degraded = await self._generate_guarded(query, retrieved_context, source_docs, output_language)
+        if self.answer_cache is not None and not degraded:
+            self._store_answer(author, output_language, final_answer, source_docs, query_embedding, verse_key)
+
+        return final_answer, source_docs, degraded
+
+    async def replay_answer_stream(self, answer: str, source_docs):
+        # A ready answer (e.g. from precomputed_answer) as the events of ask_krishna_stream_async
+        yield "sources", source_docs
+        yield "token", answer
+        yield "done", answer
+
+    async def ask_krishna_stream_async(self, query: str, author: str, output_language: str = 'english'):
+        # Streaming variant of ask_krishna_async. Yields (event, data) pairs: ("sources", [...])
+        # first, then ("token", "...") for every text chunk, and finally ("done", full_answer).
+        # Callers check precomputed_answer first (as /ask/stream does, so it can reuse stored audio).
+        query_embedding = verse_key = None
+        direct = await self._run_cpu("retrieve", self._verse_lookup, query, author)
+        if direct is not None:
+            verse_key = self._verse_cache_key(query, direct)
+        else:
+            query_embedding = await self.embed_query_async(query)
+        if self.answer_cache is not None:
+            cached = self._lookup_answer(author, output_language, query_embedding, verse_key)
+            if cached is not None:
+                answer, source_docs = cached
+                yield "sources", source_docs
+                yield "token", answer
+                yield "done", answer
+                return
+        if direct is not None:
+            retrieved_context, source_docs = self._format_results(direct)
+        else:
+            retrieved_context, source_docs = await self.retrieve_context_async(query, author, query_embedding=query_embedding)
+        yield "sources", source_docs
+
+        if not source_docs:
+            answer = self._no_source_answer(output_language)
+            yield "token", answer
+            yield "done", answer
+            return
+
+        answer_parts, outcome = [], {}
+        async with self.llm_admission.admit():
+            async for text in self._stream_guarded(query, retrieved_context, source_docs, output_language, outcome):
+                answer_parts.append(text)
+                yield "token", text
+
+        final_answer = "".join(answer_parts)
+        if self.answer_cache is not None and not outcome["degraded"]:
+            self._store_answer(author, output_language, final_answer, source_docs, query_embedding, verse_key)
+        yield "done", final_answer
+
+    # --- BATCH ---
+    async def ask_krishna_batch_async(self, items, n_results: int = 5, llm_concurrency: int = None):
+        """
+        Answers many {"query", "author", "output_language"} items as one pipelined job and yields
+        (index, answer, source_docs, error) tuples as generations complete, in completion order.
+        All uncached queries are embedded in one encode call, retrieval runs as one multi-vector
+        query per author, and at most `llm_concurrency` generations run at once (capped at
+        BATCH_LLM_MAX_CONCURRENCY). An item that fails gets an error instead of an answer;
+        the rest of the batch carries on.
+        """
+        items = [{**item, "output_language": item.get("output_language") or 'english'} for item in items]
+        contexts = {}  # index -> (retrieved_context, source_docs)
+        embeddings = {}  # index -> query embedding
+        verse_keys = {}  # index -> answer cache key of a direct verse reference
+        ready = {}  # index -> (answer, source_docs) served without generation
+        errors = {}  # index -> why the item failed
+
+        # 1. Precomputed answers need nothing else; verse references need neither embedding nor vector search
+        for index, item in enumerate(items):
+            precomputed = self.precomputed_answer(item["query"], item["author"], item["output_language"])
+            if precomputed is not None:
+                ready[index] = precomputed
+
+        def lookup_all():
+            return {index: self._verse_lookup(items[index]["query"], items[index]["author"], n_results)
+                    for index in range(len(items)) if index not in ready}
+        try:
+            direct_results = await self._run_cpu("retrieve", lookup_all)
+        except Exception as e:
+            # Direct lookups are only a shortcut; every item can still go through vector search
+            print(f"Batch verse lookup failed ({type(e).__name__}: {e}); using vector search for all items.")
+            direct_results = {}
+        for index, direct in direct_results.items():
+            if direct is None:
+                continue
+            verse_keys[index] = self._verse_cache_key(items[index]["query"], direct)
+            item = items[index]
+            cached = None
+            if self.answer_cache is not None:
+                cached = self._lookup_answer(item["author"], item["output_language"], verse_key=verse_keys[index])
+            if cached is not None:
+                ready[index] = cached
+            else:
+                contexts[index] = self._format_results(direct)
+
+        # 2. One encode call for every query that isn't in the query cache
+        pending = [index for index in range(len(items)) if index not in verse_keys and index not in ready]
+        to_encode = []
+        for index in pending:
+            cached = self.query_cache.get(items[index]["query"]) if self.query_cache is not None else None
+            if self.query_cache is not None:
+                cache_event("query_embedding", cached is not None)
+            if cached is not None:
+                embeddings[index] = cached
+            else:
+                to_encode.append(index)
+        if to_encode:
+            try:
+                with span("embed"):
+                    vectors = await self._run_cpu("embed", self._encode_texts, [items[index]["query"] for index in to_encode])
+            except Exception as e:
+                print(f"Batch embedding of {len(to_encode)} queries failed: {type(e).__name__}: {e}")
+                errors.update((index, _item_error(e)) for index in to_encode)
+                vectors = []
+            for index, vector in zip(to_encode, vectors):
+                embeddings[index] = vector
+                if self.query_cache is not None:
+                    self.query_cache.put(items[index]["query"], vector)
+
+        # 3. Answer cache, then one multi-vector query per author for the rest
+        by_author = {}
+        for index in pending:
+            item = items[index]
+            if index in errors:
+                continue
+            if self.answer_cache is not None:
+                cached = self._lookup_answer(item["author"], item["output_language"], embeddings[index])
+                if cached is not None:
+                    ready[index] = cached
+                    continue
+            by_author.setdefault(item["author"], []).append(index)
+        for author, indexes in by_author.items():
+            try:
+                with span("retrieve"):
+                    results = await self._run_cpu(
+                        "retrieve", self._query_collection_many, [embeddings[index] for index in indexes], author, n_results
+                    )
+                for index, result in zip(indexes, results):
+                    result = self._fuse_lexical(result, items[index]["query"], author, n_results)
+                    contexts[index] = self._format_results(result)
+            except Exception as e:
+                print(f"Batch retrieval for '{author}' failed: {type(e).__name__}: {e}")
+                errors.update((index, _item_error(e)) for index in indexes if index not in contexts)
+
+        for index, (answer, source_docs) in ready.items():
+            yield index, answer, source_docs, None
+        for index, error in errors.items():
+            yield index, None, [], error
+
+        # 4. Generations, bounded by the batch's own cap and by the gate all batches share. The
+        # slots are taken before the deadline starts, so waiting for one never counts as a Gemini failure.
+        batch_limit = asyncio.Semaphore(min(llm_concurrency or BATCH_LLM_CONCURRENCY, BATCH_LLM_MAX_CONCURRENCY))
+
+        async def generate(index):
+            item = items[index]
+            retrieved_context, source_docs = contexts[index]
+            if not source_docs:
+                return index, self._no_source_answer(item["output_language"]), [], None
+            try:
+                async with batch_limit, self._stage_slot("llm_batch"):
+                    answer, degraded = await self._generate_guarded(
+                        item["query"], retrieved_context, source_docs, item["output_language"], stage=None
+                    )
+            except Exception as e:
+                return index, None, [], _item_error(e)
+            if self.answer_cache is not None and not degraded:
+                self._store_answer(item["author"], item["output_language"], answer, source_docs,
+                                   embeddings.get(index), verse_keys.get(index))
+            return index, answer, source_docs, None
+
+        tasks = [asyncio.ensure_future(generate(index)) for index in contexts]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The consumer went away (e.g. the client disconnected): don't keep generating
+            for task in tasks:
+                task.cancel()
+
+
+def _item_error(error: Exception) -> str:
+    # What a failed batch item reports instead of an answer
+    return f"{type(error).__name__}: {error}"
@@ -0,0 +1,198 @@
+# ingest.py (Incremental corpus ingestion)
+#
+# Usage:
+#   python ingest.py                  # embed + upsert only new/changed chunks, delete stale ones
+#   python ingest.py --dry-run        # report what would change
+#   python ingest.py --full           # re-embed everything (e.g. after changing the model)
+#   python ingest.py --embeddings embedding_job   # use vectors made by embed_job.py
+#
+# Replaces running archived/preprocessing.py, chunking_data.py, generate_embeddings.py
+# and load_into_db.py in order. Chunks stream from the slok files straight into the
+# collection under deterministic content-hash ids, and a manifest records what is
+# already loaded, so fixing one verse re-embeds a handful of chunks instead of the
+# whole corpus. The collection is updated in place and never deleted, so the API
+# keeps serving during ingestion.
+
+import os
+import json
+import time
+import hashlib
+import argparse
+
+from corpus import DEFAULT_SLOK_DIR, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, iter_chunks_parallel, chunk_id
+from verse_table import VERSE_TABLE_PATH, VerseTable, collection_is_compact
+
+MODEL_NAME = 'paraphrase-multilingual-mpnet-base-v2'
+COLLECTION_NAME = "gita_commentaries"
+DEFAULT_MANIFEST = "ingest_manifest.json"
+
+
+def load_manifest(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def manifest_fingerprint(path: str = DEFAULT_MANIFEST) -> str:
+    """Hash of the manifest's settings and ids: changes whenever the collection's contents do. '' without one."""
+    manifest = load_manifest(path)
+    if manifest is None:
+        return ""
+    payload = json.dumps([manifest.get("settings"), sorted(manifest.get("ids", []))], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def existing_ids(collection, manifest, settings):
+    """Ids already in the collection. Trusts the manifest if it was written with the same settings."""
+    if collection is None:
+        return set()  # Dry run before the first ingestion
+    if manifest is not None and manifest.get("settings") == settings:
+        return set(manifest["ids"])
+    ids, offset, page = set(), 0, 10000
+    while True:
+        batch = collection.get(include=[], limit=page, offset=offset)
+        ids.update(batch["ids"])
+        if len(batch["ids"]) < page:
+            return ids
+        offset += page
+
+
+def ingest(collection, encode, slok_dir=DEFAULT_SLOK_DIR, manifest_path=DEFAULT_MANIFEST,
+           chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+           batch_size=64, full=False, dry_run=False, workers=1, verse_table=None, vectors=None):
+    """
+    Streams the corpus into `collection`, which may be None for a dry run before the first
+    ingestion. `encode` turns a list of texts into vectors; chunks whose id is in `vectors`
+    (see embed_job.job_vectors) use that vector instead.
+    With a `verse_table`, chunks are stored with compact metadata (see verse_table.py).
+    Returns a summary dict with counts of added, unchanged and deleted chunks.
+    """
+    settings = {"model": MODEL_NAME, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    known_ids = existing_ids(collection, load_manifest(manifest_path), settings)
+
+    started = time.perf_counter()
+    current_ids, pending = [], []
+    added = 0
+
+    def flush():
+        nonlocal added
+        if not dry_run:
+            embeddings = [vectors.get(id_) if vectors is not None else None for id_, _ in pending]
+            missing = [i for i, vector in enumerate(embeddings) if vector is None]
+            if missing:
+                for i, vector in zip(missing, encode([pending[i][1]['text_to_embed'] for i in missing])):
+                    embeddings[i] = vector
+            collection.upsert(
+                ids=[id_ for id_, _ in pending],
+                embeddings=[list(map(float, vector)) for vector in embeddings],
+                documents=[chunk['text_to_embed'] for _, chunk in pending],
+                metadatas=[verse_table.compact(chunk['metadata']) if verse_table else chunk['metadata']
+                           for _, chunk in pending],
+            )
+        previous, added = added, added + len(pending)
+        pending.clear()
+        if previous // 1000 != added // 1000:
+            print(f"  {added} chunks {'to embed' if dry_run else 'embedded and upserted'}...")
+
+    seen = set()
+    for chunk in iter_chunks_parallel(slok_dir, chunk_size, chunk_overlap, workers=workers):
+        id_ = chunk_id(chunk)
+        if id_ in seen:
+            continue  # Identical chunk text under the same verse/author/type
+        seen.add(id_)
+        current_ids.append(id_)
+        if full or id_ not in known_ids:
+            pending.append((id_, chunk))
+            if len(pending) >= batch_size:
+                flush()
+    if pending:
+        flush()
+
+    stale_ids = sorted(known_ids - seen)
+    if stale_ids and not dry_run:
+        for i in range(0, len(stale_ids), 5000):
+            collection.delete(ids=stale_ids[i:i + 5000])
+
+    if not dry_run:
+        save_manifest(manifest_path, {"settings": settings, "ids": current_ids, "updated_at": time.time()})
+
+    summary = {
+        "chunks": len(current_ids),
+        "added": added,
+        "unchanged": len(current_ids) - added,
+        "deleted": len(stale_ids),
+        "seconds": round(time.perf_counter() - started, 2),
+        "dry_run": dry_run,
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally ingest the slok corpus into ChromaDB.")
+    parser.add_argument("--slok-dir", default=DEFAULT_SLOK_DIR)
+    parser.add_argument("--db", default="./gita_vector_db")
+    parser.add_argument("--manifest", default=os.environ.get("INGEST_MANIFEST_PATH", DEFAULT_MANIFEST))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for parsing/chunking")
+    parser.add_argument("--full", action="store_true", help="Re-embed every chunk")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--table", default=VERSE_TABLE_PATH, help="Verse table for compact metadata")
+    parser.add_argument("--embeddings", help="Output directory of embed_job.py; chunks it hasn't embedded are encoded here")
+    args = parser.parse_args()
+
+    import chromadb
+    collection = None
+    if not args.dry_run:
+        client = chromadb.PersistentClient(path=args.db)
+        collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    elif os.path.exists(args.db):
+        # A dry run must not create the database or the collection
+        client = chromadb.PersistentClient(path=args.db)
+        # list_collections() returns names in newer chromadb releases and Collection objects in older ones
+        if COLLECTION_NAME in {getattr(c, "name", c) for c in client.list_collections()}:
+            collection = client.get_collection(name=COLLECTION_NAME)
+    if collection is None and args.dry_run:
+        print(f"No '{COLLECTION_NAME}' collection in '{args.db}' yet; every chunk would be added.")
+
+    # New collections get compact metadata; existing ones keep the format they have (see verse_table.py migrate)
+    table = None
+    if collection is None or not collection.count() or collection_is_compact(collection):
+        previous = VerseTable.load(args.table) if os.path.exists(args.table) else None
+        table = VerseTable.build(args.slok_dir, previous)
+        if not args.dry_run:
+            table.save(args.table)
+
+    vectors = None
+    if args.embeddings:
+        from embed_job import job_vectors
+        vectors = job_vectors(args.embeddings)
+        print(f"Using {len(vectors)} vectors from the embedding job in '{args.embeddings}'.")
+
+    model = None
+    def encode(texts):
+        global model
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            print("Loading the sentence transformer model...")
+            model = SentenceTransformer(MODEL_NAME, device='cpu')
+        return model.encode(texts, batch_size=args.batch_size)
+
+    summary = ingest(
+        collection, encode, slok_dir=args.slok_dir, manifest_path=args.manifest,
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size, full=args.full, dry_run=args.dry_run, workers=args.workers, verse_table=table,
+        vectors=vectors,
+    )
+    print(json.dumps(summary, indent=2))
+    if collection is not None:
+        print(f"The collection now contains {collection.count()} documents.")
@@ -1,18 +1,26 @@
 # main.py (Final Version with Conditional Audio)
 
 import os
-import uuid
+import json
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal, Union
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from elevenlabs.client import ElevenLabs
-from elevenlabs import VoiceSettings
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 
-from gita_rag import GitaRAG
+from gita_rag import GitaRAG, BATCH_LLM_MAX_CONCURRENCY
+from tts import ElevenLabsTTS, StubTTS, AudioStreamRegistry, synthesize_pipelined, iter_text, iter_queue
+from audio_store import AudioStore
+from singleflight import SingleFlight
+from admission import AdmissionController, Overloaded
+from context_builder import source_refs
+from verse_pages import shared_verse_pages
+from compression import CompressionMiddleware
+import metrics
 
 # --- SETUP (Unchanged) ---
 logging.basicConfig(level=logging.INFO)
@@ -26,21 +34,176 @@ logger.info("GitaRAG engine created.")
 try:
     elevenlabs_api_key = os.environ.get("ELEVENLABS_API_KEY")
     if not elevenlabs_api_key: raise ValueError("ELEVENLABS_API_KEY not found.")
-    elevenlabs_client = ElevenLabs(api_key=elevenlabs_api_key)
+    from elevenlabs.client import AsyncElevenLabs # Imported here so stub-TTS deployments never load it
+    elevenlabs_client = AsyncElevenLabs(api_key=elevenlabs_api_key)
     logger.info("Successfully initialized ElevenLabs client.")
 except Exception as e:
     logger.error(f"Failed to initialize ElevenLabs client: {e}")
     elevenlabs_client = None
 
 TEMP_AUDIO_DIR = "temp_audio"
-os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
+# Content-addressed audio files, bounded by AUDIO_CACHE_MAX_MB / AUDIO_CACHE_MAX_AGE_DAYS
+audio_store = AudioStore.from_env(TEMP_AUDIO_DIR)
+AUDIO_EVICT_INTERVAL_SECONDS = float(os.environ.get("AUDIO_EVICT_INTERVAL_SECONDS", "300"))
+AUDIO_BASE_URL = os.environ.get("AUDIO_BASE_URL", "http://127.0.0.1:8000")
+# Caps concurrent ElevenLabs syntheses independently of the RAG stage limits. Syntheses
+# beyond TTS_MAX_QUEUE waiting, or waiting longer than TTS_QUEUE_TIMEOUT_SECONDS, fail fast.
+tts_admission = AdmissionController(
+    "tts", int(os.environ.get("TTS_CONCURRENCY", "4")), int(os.environ.get("TTS_MAX_QUEUE", "16")),
+    float(os.environ.get("TTS_QUEUE_TIMEOUT_SECONDS", "10")),
+)
 
-app = FastAPI(title="Bhagavad Gita Chatbot API", version="1.3.0")
+# --- TEXT-TO-SPEECH ---
+# TTS_BACKEND=stub swaps ElevenLabs for a local silent-audio stand-in (for tests and
+# benchmarks; latency and failure rate via STUB_TTS_* variables, see tts.py).
+# TTS_PIPELINE=1 makes /ask synthesize sentence by sentence and return a streaming
+# audio URL right away instead of waiting for a complete MP3 file.
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "elevenlabs").lower()
+TTS_PIPELINE = os.environ.get("TTS_PIPELINE", "0").lower() in ("1", "true", "yes")
+TTS_SEGMENT_CONCURRENCY = int(os.environ.get("TTS_SEGMENT_CONCURRENCY", "3"))
+if TTS_BACKEND == "stub":
+    tts_engine = StubTTS.from_env()
+elif elevenlabs_client:
+    tts_engine = ElevenLabsTTS(
+        elevenlabs_client, voice_id="pNInz6obpgDQGcFmaJgB", # Adam
+        model_id="eleven_multilingual_v2", voice_settings={"stability": 0.4, "similarity_boost": 0.75},
+    )
+else:
+    tts_engine = None
+audio_streams = AudioStreamRegistry()
+background_tasks = set()
+# Concurrent requests for the same audio share one synthesis (or one live pipeline)
+audio_flights = SingleFlight("audio")
+live_pipelines = {}  # audio filename -> streaming URL of the pipeline producing it
+
+# --- METRICS ---
+# Stage timings are always exported on /metrics; SERVER_TIMING=1 also returns each
+# request's breakdown in a Server-Timing header (and in the "done" event of /ask/stream).
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+async def synthesize_limited(text: str) -> bytes:
+    async with tts_admission.admit():
+        with metrics.span("tts"):
+            return await tts_engine.synthesize(text)
+
+def spawn(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def synthesize_and_store(text: str, filename: str):
+    audio_bytes = await synthesize_limited(text)
+    await asyncio.to_thread(audio_store.write, filename, audio_bytes)
+
+def stored_audio_url(filename: str) -> Optional[str]:
+    # URL of audio already in the store (synthesized earlier or by precompute.py --tts), or None
+    audio_cached = audio_store.lookup(filename)
+    metrics.cache_event("audio", audio_cached)
+    return f"{AUDIO_BASE_URL}/audio/{filename}" if audio_cached else None
+
+def start_audio_pipeline(text_chunks, filename: Optional[str] = None):
+    # Starts sentence-pipelined synthesis in the background and returns the URL to stream it from.
+    # Once complete, the audio is saved to the store so the same answer is never synthesized twice.
+    # When the filename is known up front, requests for the same audio share the running pipeline.
+    if filename in live_pipelines:
+        metrics.COALESCED.labels("audio_pipeline", "joined").inc()
+        return live_pipelines[filename]
+    live_audio = audio_streams.create()
+    url = f"{AUDIO_BASE_URL}/audio/stream/{live_audio.id}"
+
+    async def run():
+        spoken_text = []
+        async def recorded(chunks):
+            async for chunk in chunks:
+                spoken_text.append(chunk)
+                yield chunk
+        try:
+            await synthesize_pipelined(
+                synthesize_limited, recorded(text_chunks), live_audio, max_parallel=TTS_SEGMENT_CONCURRENCY
+            )
+            if live_audio.chunks and not live_audio.failed_segments:
+                stored_name = audio_store.filename_for("".join(spoken_text), tts_engine.voice)
+                await asyncio.to_thread(audio_store.write, stored_name, b"".join(live_audio.chunks))
+        finally:
+            live_pipelines.pop(filename, None)
+
+    if filename is not None:
+        live_pipelines[filename] = url
+        metrics.COALESCED.labels("audio_pipeline", "started").inc()
+    spawn(run())
+    return url
+
+async def evict_audio_periodically():
+    while True:
+        try:
+            await asyncio.to_thread(audio_store.evict)
+        except Exception as e:
+            logger.error(f"Error during audio eviction: {e}")
+        await asyncio.sleep(AUDIO_EVICT_INTERVAL_SECONDS)
+
+# --- WARM-UP ---
+# The app starts accepting connections right away (so /healthz answers), while the model,
+# index and clients load in the background. /readyz reports 503 until that has finished,
+# so the orchestrator only routes traffic to warm instances.
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "10"))
+
+async def warm_up_engine():
+    while True:
+        try:
+            await asyncio.to_thread(shared_verse_pages)
+            await asyncio.to_thread(gita_engine.warm_up)
+            return
+        except Exception as e:
+            logger.error(f"Warm-up failed, retrying in {WARMUP_RETRY_SECONDS:.0f}s: {e}")
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    eviction_task = asyncio.create_task(evict_audio_periodically())
+    warmup_task = asyncio.create_task(warm_up_engine())
+    yield
+    eviction_task.cancel()
+    warmup_task.cancel()
+
+app = FastAPI(title="Bhagavad Gita Chatbot API", version="1.3.0", lifespan=lifespan)
 origins = [
     "http://localhost:5173",
     "https://untreatable-transmarginally-stephania.ngrok-free.dev",
 ]
-app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(
+    CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag"],
+)
+# gzip/brotli for JSON responses (see compression.py)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get("COMPRESSION_MIN_BYTES", "500")))
+
+# --- RESPONSE SIZE ---
+# Sources are returned in full by default; 'ref' returns (shloka_id, author, snippet)
+# references instead, with the verse text served by the cacheable GET /verse/{shloka_id}.
+# Clients can choose per request with `sources_mode`.
+SOURCES_MODE = os.environ.get("SOURCES_MODE", "full").lower()
+VERSE_CACHE_MAX_AGE_SECONDS = int(os.environ.get("VERSE_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+def shape_sources(sources, sources_mode: Optional[str]):
+    return source_refs(sources) if (sources_mode or SOURCES_MODE) == "ref" else sources
+
+# --- LOAD SHEDDING ---
+# Audio is the first thing to go: while Gemini or TTS is at capacity, generate_audio
+# requests are answered with text only (audio_degraded=true), unless their audio is
+# already stored. Requests that can't be admitted at all get 429 (queue full) or 503
+# (waited too long) with Retry-After.
+def audio_allowed() -> bool:
+    if gita_engine.llm_admission.pressured() or tts_admission.pressured():
+        tts_admission.record_degraded()
+        return False
+    return True
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    logger.warning(f"Shedding {request.url.path}: {exc}")
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 # --- DATA MODELS ---
 class QueryRequest(BaseModel):
@@ -48,49 +211,216 @@ class QueryRequest(BaseModel):
     author: str
     output_language: Optional[str] = 'english'
     generate_audio: Optional[bool] = False # <-- THE KEY ADDITION
+    sources_mode: Optional[Literal["full", "ref"]] = None # Defaults to SOURCES_MODE
 
 class SourceDocument(BaseModel): # (Unchanged)
     shloka_id: str; shloka_sanskrit: str; commentary: str; author: str
-class QueryResponse(BaseModel): # (Unchanged)
-    answer: str; sources: List[SourceDocument]; audio_url: Optional[str] = None
+class SourceRef(BaseModel):
+    shloka_id: str; author: str; snippet: str
+class QueryResponse(BaseModel):
+    answer: str; sources: List[Union[SourceDocument, SourceRef]]; audio_url: Optional[str] = None
+    audio_degraded: bool = False # Audio was requested but skipped because the server is under load
+
+class BatchItem(BaseModel):
+    query: str
+    author: str
+    output_language: Optional[str] = 'english'
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    llm_concurrency: Optional[int] = Field(None, ge=1, le=BATCH_LLM_MAX_CONCURRENCY) # Defaults to BATCH_LLM_CONCURRENCY
+    sources_mode: Optional[Literal["full", "ref"]] = None
+
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
 
 # --- API ENDPOINTS ---
 @app.get("/")
 def read_root(): return {"message": "Bhagavad Gita Chatbot API is running."}
 
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up and serving. Says nothing about the model.
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(response: Response):
+    # Readiness: the model, index and clients are loaded, so requests won't hit a cold start.
+    if not gita_engine.ready:
+        response.status_code = 503
+        return {"ready": False, "error": gita_engine.warmup_error}
+    return {"ready": True}
+
 @app.post("/ask", response_model=QueryResponse)
-def ask_gita(request: QueryRequest):
+async def ask_gita(request: QueryRequest, response: Response):
     logger.info(f"Received query: '{request.query}', Generate Audio: {request.generate_audio}")
-    answer, sources = gita_engine.ask_krishna(
+    with metrics.track_request("ask") as timings:
+        result = await answer_with_audio(request)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(timings)
+    return result
+
+async def answer_with_audio(request: QueryRequest):
+    want_audio = bool(tts_engine and request.generate_audio)
+    answer, sources = await gita_engine.ask_krishna_async(
         query=request.query, author=request.author, output_language=request.output_language
     )
     
-    audio_url = None
+    audio_url, audio_degraded = None, False
     # --- THE KEY LOGIC CHANGE ---
     # Only generate audio if the client requested it
-    if elevenlabs_client and answer and request.generate_audio:
-        try:
-            logger.info("Generating audio with ElevenLabs...")
-            # ... (The rest of the audio generation logic is the same)
-            audio_filename = f"gita_response_{uuid.uuid4()}.mp3"
-            audio_filepath = os.path.join(TEMP_AUDIO_DIR, audio_filename)
-            response = elevenlabs_client.text_to_speech.convert(
-                voice_id="pNInz6obpgDQGcFmaJgB", # Adam
-                text=answer, model_id="eleven_multilingual_v2", 
-                voice_settings=VoiceSettings(stability=0.4, similarity_boost=0.75),
-            )
-            with open(audio_filepath, "wb") as f:
-                for chunk in response: f.write(chunk)
-            audio_url = f"http://127.0.0.1:8000/audio/{audio_filename}"
-            logger.info(f"Audio generated successfully: {audio_url}")
-        except Exception as e:
-            logger.error(f"Error during audio generation: {e}")
-            audio_url = None
+    if want_audio and answer:
+        audio_filename = audio_store.filename_for(answer, tts_engine.voice)
+        audio_url = stored_audio_url(audio_filename)
+        if audio_url:
+            logger.info(f"Reusing stored audio: {audio_url}")
+        elif not audio_allowed():
+            audio_degraded = True
+        elif TTS_PIPELINE:
+            audio_url = start_audio_pipeline(iter_text([answer]), filename=audio_filename)
+            logger.info(f"Streaming audio pipeline started: {audio_url}")
+        else:
+            try:
+                logger.info("Generating audio with ElevenLabs...")
+                await audio_flights.run(audio_filename, lambda: synthesize_and_store(answer, audio_filename))
+                audio_url = f"{AUDIO_BASE_URL}/audio/{audio_filename}"
+                logger.info(f"Audio generated successfully: {audio_url}")
+            except Overloaded as e:
+                # TTS filled up after audio_allowed(): still answer, with text only
+                logger.warning(f"Skipping audio: {e}")
+                audio_degraded = True
+            except Exception as e:
+                logger.error(f"Error during audio generation: {e}")
+                audio_url = None
     
-    return {"answer": answer, "sources": sources, "audio_url": audio_url}
+    return {"answer": answer, "sources": shape_sources(sources, request.sources_mode), "audio_url": audio_url,
+            "audio_degraded": audio_degraded}
+
+@app.post("/ask/stream")
+async def ask_gita_stream(request: QueryRequest):
+    # Server-Sent Events variant of /ask: a "sources" event first, then one "token"
+    # event per chunk of the answer as Gemini produces it, then "done".
+    # With generate_audio, an "audio" event carrying a streaming audio URL follows the
+    # sources, and the answer is synthesized sentence by sentence as it arrives.
+    logger.info(f"Received streaming query: '{request.query}'")
+    # A precomputed answer is known in full up front, so its stored audio (if any) can be reused
+    precomputed = gita_engine.precomputed_answer(request.query, request.author, request.output_language)
+    # Shed before the 200 goes out when the queue is already full; later overload becomes an error event
+    if precomputed is None and gita_engine.llm_admission.saturated():
+        raise gita_engine.llm_admission.overloaded("queue full")
+    want_audio = bool(tts_engine and request.generate_audio)
+    ready_audio_url = None
+    if want_audio and precomputed is not None:
+        audio_filename = audio_store.filename_for(precomputed[0], tts_engine.voice)
+        ready_audio_url = stored_audio_url(audio_filename)
+        if ready_audio_url is None and audio_allowed():
+            ready_audio_url = start_audio_pipeline(iter_text([precomputed[0]]), filename=audio_filename)
+        want_audio = ready_audio_url is not None
+    elif want_audio:
+        want_audio = audio_allowed()
+
+    async def event_stream():
+        audio_text = None
+        with metrics.track_request("ask_stream") as timings:
+            try:
+                if precomputed is not None:
+                    events = gita_engine.replay_answer_stream(*precomputed)
+                else:
+                    events = gita_engine.ask_krishna_stream_async(
+                        query=request.query, author=request.author, output_language=request.output_language
+                    )
+                async for event, data in events:
+                    if event == "token" and audio_text is not None: audio_text.put_nowait(data)
+                    if event == "sources": data = shape_sources(data, request.sources_mode)
+                    if event == "done":
+                        data = {"answer": data}
+                        if SERVER_TIMING: data["server_timing"] = metrics.server_timing(timings)
+                    yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                    if event == "sources" and want_audio:
+                        if ready_audio_url is not None:
+                            audio_url = ready_audio_url
+                        else:
+                            audio_text = asyncio.Queue()
+                            audio_url = start_audio_pipeline(iter_queue(audio_text))
+                        yield f"event: audio\ndata: {json.dumps({'audio_url': audio_url})}\n\n"
+            except Overloaded as e:
+                logger.warning(f"Shedding streaming answer: {e}")
+                yield f"event: error\ndata: {json.dumps({'detail': str(e), 'retry_after': e.retry_after})}\n\n"
+            except Exception as e:
+                logger.error(f"Error during streaming answer: {e}")
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            finally:
+                if audio_text is not None: audio_text.put_nowait(None)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Stop Nginx from buffering the stream
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+@app.post("/ask/batch")
+async def ask_gita_batch(request: BatchRequest):
+    # For offline jobs (FAQ pre-generation, evaluation runs): many questions in one request.
+    # Results stream back as newline-delimited JSON, one {"index", "answer", "sources"} object
+    # (or {"index", "error"}) per item, in the order they complete. No audio is generated.
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch.")
+    logger.info(f"Received batch of {len(request.items)} queries")
+
+    async def result_stream():
+        with metrics.track_request("ask_batch"):
+            async for index, answer, sources, error in gita_engine.ask_krishna_batch_async(
+                [item.model_dump() for item in request.items], llm_concurrency=request.llm_concurrency
+            ):
+                result = {"index": index, "error": error} if error else {
+                    "index": index, "answer": answer, "sources": shape_sources(sources, request.sources_mode)}
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.get("/verse/{shloka_id}")
+def get_verse(shloka_id: str, request: Request, author: Optional[str] = None):
+    # The verse, its transliteration and all translations; with ?author=, also that author's commentaries.
+    # The ETag is a hash of the document, so it only changes when the corpus does.
+    page = shared_verse_pages().get(shloka_id, author)
+    if page is None: raise HTTPException(status_code=404, detail="Verse or author not found")
+    body, etag = page
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={VERSE_CACHE_MAX_AGE_SECONDS}"}
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/cache/stats")
+def cache_stats():
+    precomputed = gita_engine.precomputed.stats() if gita_engine.precomputed is not None else None
+    if gita_engine.answer_cache is None: return {"enabled": False, "precomputed": precomputed}
+    return {"enabled": True, **gita_engine.answer_cache.stats(), "precomputed": precomputed}
+
+@app.get("/embedding/stats")
+def embedding_stats():
+    query_cache = gita_engine.query_cache.stats() if gita_engine.query_cache is not None else None
+    return {"batcher": gita_engine.embedding_batcher.stats(), "query_cache": query_cache}
+
+@app.get("/admission/stats")
+def admission_stats():
+    return {"answer": gita_engine.llm_admission.stats(), "tts": tts_admission.stats()}
+
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/audio/stream/{stream_id}")
+async def stream_audio(stream_id: str):
+    live_audio = audio_streams.get(stream_id)
+    if live_audio is None: raise HTTPException(status_code=404, detail="Audio stream not found")
+    return StreamingResponse(live_audio.iter_bytes(), media_type="audio/mpeg", headers={"Cache-Control": "no-cache"})
 
-@app.get("/audio/{filename}") # (Unchanged)
-def get_audio(filename: str):
-    filepath = os.path.join(TEMP_AUDIO_DIR, filename)
-    if os.path.exists(filepath): return FileResponse(filepath, media_type="audio/mpeg")
-    raise HTTPException(status_code=404, detail="Audio file not found")
\ No newline at end of file
+@app.get("/audio/{filename}")
+def get_audio(filename: str, request: Request):
+    # Stored files are immutable (named after a hash of their inputs), so the filename is a strong ETag.
+    # FileResponse takes care of Range requests for seeking.
+    filepath = audio_store.path_for(filename)
+    if filepath is None or not os.path.exists(filepath):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    headers = {"ETag": f'"{filename[:-len(".mp3")]}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if headers["ETag"] in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(filepath, media_type="audio/mpeg", headers=headers)
@@ -0,0 +1,114 @@
+# metrics.py (Per-stage latency metrics and Server-Timing spans)
+#
+# Every stage of a request (verse lookup, encode, vector search, Gemini, TTS, ...) is
+# timed with span(). Durations go into Prometheus histograms served on /metrics and,
+# for the request that is currently running, into a per-request dict that main.py
+# turns into a Server-Timing header. Under several workers (serve.py), each process
+# writes its samples to PROMETHEUS_MULTIPROC_DIR and /metrics aggregates all of them.
+
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram("gita_stage_seconds", "Time spent in each pipeline stage.", ["stage"], buckets=LATENCY_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram(
+    "gita_queue_wait_seconds", "Time spent waiting for a stage's concurrency slot.", ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram("gita_request_seconds", "End-to-end request time.", ["endpoint"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    "gita_requests_in_flight", "Requests currently being handled.", ["endpoint"], multiprocess_mode="livesum"
+)
+CACHE_EVENTS = Counter("gita_cache_events_total", "Cache lookups by cache and result.", ["cache", "result"])
+COALESCED = Counter(
+    "gita_coalesced_total", "Single-flight computations started, and callers that joined one in flight.", ["kind", "result"]
+)
+UPSTREAM_EVENTS = Counter(
+    "gita_upstream_events_total", "Upstream call outcomes: ok, hedged, timeout, error, circuit_open, unused.", ["upstream", "event"]
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "gita_admission_queue_depth", "Requests waiting for admission, per gate.", ["gate"], multiprocess_mode="livesum"
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "gita_admission_in_flight", "Admitted requests holding a slot, per gate.", ["gate"], multiprocess_mode="livesum"
+)
+ADMISSION_EVENTS = Counter(
+    "gita_admission_events_total", "Admission outcomes: admitted, queued, shed, timeout, degraded.", ["gate", "result"]
+)
+PROMPT_TOKENS = Histogram(
+    "gita_prompt_tokens", "Estimated size of the Gemini prompt in tokens.",
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000),
+)
+ANSWER_CHARS = Histogram(
+    "gita_answer_chars", "Length of generated answers in characters.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 5000, 8000),
+)
+
+# Stage durations of the request running in the current context (None outside a request)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def record(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def record_queue_wait(stage: str, seconds: float):
+    QUEUE_WAIT_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[f"{stage}_wait"] = timings.get(f"{stage}_wait", 0.0) + seconds
+
+
+def cache_event(cache: str, hit: bool):
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """Counts the request as in flight and collects its stage timings; yields the timings dict."""
+    timings = {}
+    token = _request_timings.set(timings)
+    REQUESTS_IN_FLIGHT.labels(endpoint).inc()
+    started = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        total = time.perf_counter() - started
+        timings["total"] = total
+        REQUEST_SECONDS.labels(endpoint).observe(total)
+        REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+        try:
+            _request_timings.reset(token)
+        except ValueError:
+            pass  # A streaming generator finalized from another context
+
+
+def server_timing(timings) -> str:
+    """Formats stage timings as a Server-Timing header value (durations in milliseconds)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def render():
+    """Returns (body, content_type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
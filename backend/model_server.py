@@ -0,0 +1,317 @@
+# model_server.py (Shared embedding/retrieval sidecar for multi-worker serving)
+#
+# Usage:
+#   python model_server.py --socket /tmp/gita-models.sock
+#
+# With several uvicorn workers, each one would otherwise load its own embedding model
+# (about 1 GB for the torch backend) and open its own Chroma client on the same
+# directory. Instead the model and the vector index are loaded once, in this process,
+# and workers started with MODEL_SERVER_SOCKET=<path> reach them over a Unix socket
+# through ModelClient. serve.py starts the sidecar, waits until it is ready and then
+# starts the workers.
+#
+# Wire format: every message is a 4-byte big-endian length followed by a JSON object.
+# Requests are {"op": ..., ...}; replies are {"result": ...} or {"error": "..."}.
+
+import os
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+
+import numpy as np
+
+from metrics import span
+from verse_table import collection_is_compact, is_compact, shared_verse_table
+
+_HEADER = struct.Struct(">I")
+# Any author with passages in the collection; used for the warm-up query
+WARM_UP_AUTHOR = "Swami Sivananda"
+
+
+class LocalModels:
+    """
+    The embedding model and the vector index, loaded in this process. Nothing is loaded
+    at construction: warm_up() loads both ahead of traffic, and any call made before
+    that loads what it needs on demand.
+    """
+
+    def __init__(self, embedding_backend: str = "torch", onnx_model_dir: str = "./onnx_model",
+                 retrieval_engine: str = "chroma", numpy_index_path: str = "./gita_index.bin"):
+        self.embedding_backend = embedding_backend
+        self.onnx_model_dir = onnx_model_dir
+        self.retrieval_engine = retrieval_engine
+        self.numpy_index_path = numpy_index_path
+        self.embedding_model = None
+        self.collection = None
+        self.vector_index = None
+        # True when chunks carry compact metadata (integer codes, see verse_table.py)
+        self.compact_metadata = False
+        self._model_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    def load_index(self):
+        if self.collection is not None:
+            return
+        with self._index_lock:
+            if self.collection is not None:
+                return
+            import chromadb
+            print("Connecting to vector database...")
+            with span("index_load"):
+                client = chromadb.PersistentClient(path="./gita_vector_db")
+                collection = client.get_collection(name="gita_commentaries")
+                if self.retrieval_engine == 'numpy':
+                    from numpy_index import NumpyVectorIndex, build_index
+                    if not os.path.exists(self.numpy_index_path):
+                        print(f"Building NumPy vector index at '{self.numpy_index_path}'...")
+                        build_index(collection, self.numpy_index_path)
+                    self.vector_index = NumpyVectorIndex(self.numpy_index_path)
+                    print(f"Loaded NumPy vector index with {len(self.vector_index)} vectors.")
+                    self.compact_metadata = bool(self.vector_index.metadatas) and is_compact(self.vector_index.metadatas[0])
+                else:
+                    self.compact_metadata = collection_is_compact(collection)
+            self.collection = collection
+
+    def warm_up(self):
+        """Loads the model and the index and runs one encode and one query, so kernels and pages are hot."""
+        self.load()
+        self.load_index()
+        vector = self.encode(["warm-up"])[0]
+        self.query(vector, WARM_UP_AUTHOR, 1)
+
+    def load(self):
+        # Guarded by a lock, since the async path may call this from several executor threads at once
+        if self.embedding_model is not None:
+            return
+        with self._model_lock:
+            if self.embedding_model is None:
+                print("\n>>> Loading local embedding model for the first time... (This is the long wait)")
+                with span("model_load"):
+                    if self.embedding_backend == 'onnx':
+                        from onnx_embedder import OnnxEmbedder
+                        self.embedding_model = OnnxEmbedder(self.onnx_model_dir)
+                    else:
+                        from sentence_transformers import SentenceTransformer
+                        self.embedding_model = SentenceTransformer('paraphrase-multilingual-mpnet-base-v2', device='cpu')
+                print(">>> Embedding model loaded successfully into memory.")
+
+    def encode(self, texts):
+        # One forward pass for the whole list; returns a (len(texts), dim) numpy array.
+        self.load()
+        return self.embedding_model.encode(texts)
+
+    def _author_filter(self, author: str):
+        # Compact chunks are filtered on the author's code instead of the name; None for an unknown author
+        if self.compact_metadata:
+            return "author_code", shared_verse_table().author_code(author)
+        return "author", author
+
+    def query(self, query_embedding, author: str, n_results: int):
+        self.load_index()
+        key, value = self._author_filter(author)
+        if value is None:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        if self.vector_index is not None:
+            return self.vector_index.query(query_embedding, value, n_results)
+        return self.collection.query(
+            query_embeddings=[list(map(float, query_embedding))], n_results=n_results, where={key: value}
+        )
+
+    def query_many(self, query_embeddings, author: str, n_results: int):
+        # One multi-vector query for several queries of the same author; returns one result per query.
+        self.load_index()
+        key, value = self._author_filter(author)
+        if value is None:
+            return [{"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]} for _ in query_embeddings]
+        if self.vector_index is not None:
+            return self.vector_index.query_many(query_embeddings, value, n_results)
+        results = self.collection.query(
+            query_embeddings=[list(map(float, vector)) for vector in query_embeddings],
+            n_results=n_results, where={key: value},
+        )
+        return [{key: [results[key][i]] for key in ("ids", "documents", "metadatas", "distances")}
+                for i in range(len(query_embeddings))]
+
+
+# --- WIRE FORMAT ---
+def _to_json(value):
+    # numpy scalars and arrays (vectors, distances from the NumPy index) as plain JSON
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def send_message(sock, message):
+    body = json.dumps(message, default=_to_json, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Model server connection closed")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+# --- SERVER ---
+class _Handler(socketserver.BaseRequestHandler):
+    # One thread per connection; each worker thread keeps its own connection open
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply = {"result": server.dispatch(request)}
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            send_message(self.request, reply)
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, models: LocalModels, encode_concurrency: int = 2):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left over from a previous run
+        super().__init__(socket_path, _Handler)
+        self.models = models
+        # Encode calls from all workers share the model's threads; more at once only thrashes
+        self.encode_slots = threading.Semaphore(encode_concurrency)
+        self.started_at = time.time()
+
+    def dispatch(self, request):
+        op = request.get("op")
+        if op == "encode":
+            with self.encode_slots:
+                return np.asarray(self.models.encode(request["texts"]), dtype=np.float32)
+        if op == "query":
+            return self.models.query(request["embedding"], request["author"], request["n_results"])
+        if op == "query_many":
+            return self.models.query_many(request["embeddings"], request["author"], request["n_results"])
+        if op == "ping":
+            return {"ready": True, "pid": os.getpid(), "uptime_seconds": time.time() - self.started_at}
+        raise ValueError(f"Unknown op '{op}'")
+
+
+def serve(socket_path: str, models: LocalModels, encode_concurrency: int = 2):
+    """Loads and warms up the model, then answers requests on `socket_path` until interrupted."""
+    # The socket only starts accepting once the model has run one encode and one query,
+    # so a successful ping means the first real request won't pay the cold start.
+    models.warm_up()
+    server = ModelServer(socket_path, models, encode_concurrency)
+    print(f"Model server ready on {socket_path} (pid {os.getpid()}).")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# --- CLIENT ---
+class ModelClient:
+    """
+    Same encode/query/query_many interface as LocalModels, served by the sidecar. Safe to
+    use from several threads: each thread gets its own connection.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0, ready_timeout: float = 300.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.ready_timeout = ready_timeout
+        self._local = threading.local()
+
+    def load(self):
+        pass  # the sidecar loaded the model before it started accepting connections
+
+    def warm_up(self):
+        """Waits for the sidecar, then makes one round trip so this thread's connection is open."""
+        info = self.wait_until_ready(self.ready_timeout)
+        print(f"Model server is ready (pid {info['pid']}).")
+        self.encode(["warm-up"])
+
+    def encode(self, texts):
+        return np.asarray(self._call({"op": "encode", "texts": list(texts)}), dtype=np.float32)
+
+    def query(self, query_embedding, author: str, n_results: int):
+        return self._call({"op": "query", "embedding": list(map(float, query_embedding)),
+                           "author": author, "n_results": n_results})
+
+    def query_many(self, query_embeddings, author: str, n_results: int):
+        return self._call({"op": "query_many", "embeddings": [list(map(float, vector)) for vector in query_embeddings],
+                           "author": author, "n_results": n_results})
+
+    def ping(self):
+        return self._call({"op": "ping"})
+
+    def wait_until_ready(self, timeout: float):
+        """Blocks until the sidecar answers a ping; raises RuntimeError after `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.ping()
+            except (OSError, ConnectionError) as e:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"Model server at {self.socket_path} not ready after {timeout:.0f}s: {e}")
+                time.sleep(0.5)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _call(self, request):
+        # A connection that broke since the last call (e.g. the sidecar restarted) is retried once
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            fresh = sock is None
+            try:
+                if fresh:
+                    sock = self._connect()
+                send_message(sock, request)
+                reply = recv_message(sock)
+                break
+            except (OSError, ConnectionError):
+                self._local.sock = None
+                if sock is not None:
+                    sock.close()
+                if fresh or attempt:
+                    raise
+        if "error" in reply:
+            raise RuntimeError(f"Model server error: {reply['error']}")
+        return reply["result"]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Shared embedding/retrieval sidecar for multi-worker serving.")
+    parser.add_argument("--socket", default=os.environ.get("MODEL_SERVER_SOCKET", "/tmp/gita-models.sock"))
+    parser.add_argument("--encode-concurrency", type=int, default=int(os.environ.get("MODEL_SERVER_ENCODE_CONCURRENCY", "2")))
+    args = parser.parse_args()
+    serve(args.socket, LocalModels(
+        embedding_backend=os.environ.get("EMBEDDING_BACKEND", "torch").lower(),
+        onnx_model_dir=os.environ.get("ONNX_MODEL_DIR", "./onnx_model"),
+        retrieval_engine=os.environ.get("RETRIEVAL_ENGINE", "chroma").lower(),
+        numpy_index_path=os.environ.get("NUMPY_INDEX_PATH", "./gita_index.bin"),
+    ), args.encode_concurrency)
@@ -0,0 +1,177 @@
+# numpy_index.py (In-process exact vector index, partitioned by author)
+#
+# Usage:
+#   python numpy_index.py build --out gita_index.bin
+#
+# The whole corpus is a few thousand chunks per author, so exact search with one
+# matrix-vector product is faster than going through Chroma's SQLite + HNSW layers.
+# Rows are sorted by author, so each author's partition is a contiguous slice of a
+# single memory-mapped file; several uvicorn workers mapping the same file share
+# its pages. Vectors are stored as float32, so queries read the mapped pages directly:
+# float16 would halve the file but need a float32 copy of the partition for every query.
+
+import os
+import json
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b"GITAIDX1"
+ALIGNMENT = 64
+
+
+class NumpyVectorIndex:
+    """Read-only, memory-mapped index answering top-k cosine queries per author."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"'{path}' is not a Gita vector index file.")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        self.path = path
+        self.ids = header["ids"]
+        self.documents = header["documents"]
+        self.metadatas = header["metadatas"]
+        # Keyed by author name, or by author code (as a string) for compact metadata
+        self.partitions = {author: tuple(bounds) for author, bounds in header["partitions"].items()}
+        if header["dtype"] != "float32":
+            raise ValueError(f"'{path}' stores {header['dtype']} vectors; only float32 indexes are supported.")
+        self.matrix = np.memmap(
+            path, dtype=header["dtype"], mode="r", offset=header["data_offset"],
+            shape=(len(self.ids), header["dim"]),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, query_embedding, author: str, n_results: int = 5):
+        """Returns the top `n_results` chunks for `author` in the same shape as Chroma's collection.query()."""
+        empty = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        author = str(author)
+        if author not in self.partitions:
+            return empty
+        start, end = self.partitions[author]
+
+        query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+
+        scores = self.matrix[start:end] @ query_vector
+
+        k = min(n_results, len(scores))
+        if k == 0:
+            return empty
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = (top + start).tolist()
+        return {
+            "ids": [[self.ids[row] for row in rows]],
+            "documents": [[self.documents[row] for row in rows]],
+            "metadatas": [[self.metadatas[row] for row in rows]],
+            "distances": [(1.0 - scores[top]).tolist()],
+        }
+
+    def query_many(self, query_embeddings, author: str, n_results: int = 5):
+        """Like query() for several vectors at once: one matrix product over the author's block. Returns a list of results."""
+        empty = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        query_matrix = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        author = str(author)
+        if author not in self.partitions or not len(query_matrix):
+            return [empty for _ in range(len(query_matrix))]
+        start, end = self.partitions[author]
+
+        norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+        query_matrix = query_matrix / np.where(norms == 0, 1.0, norms)
+        scores = query_matrix @ self.matrix[start:end].T  # (queries, chunks)
+
+        k = min(n_results, scores.shape[1])
+        if k == 0:
+            return [empty for _ in range(len(query_matrix))]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for i in range(len(query_matrix)):
+            row_top = top[i][np.argsort(-scores[i, top[i]])]
+            rows = (row_top + start).tolist()
+            results.append({
+                "ids": [[self.ids[row] for row in rows]],
+                "documents": [[self.documents[row] for row in rows]],
+                "metadatas": [[self.metadatas[row] for row in rows]],
+                "distances": [(1.0 - scores[i, row_top]).tolist()],
+            })
+        return results
+
+
+def build_index(collection, out_path: str, batch_size: int = 5000):
+    """Exports every chunk in a Chroma collection into a single index file."""
+    ids, documents, metadatas, embeddings = [], [], [], []
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        embeddings.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    write_index(out_path, ids, documents, metadatas, np.concatenate(embeddings))
+
+
+def _partition_key(metadata) -> str:
+    # The author's name, or its code for compact metadata (see verse_table.py)
+    return str(metadata.get("author", metadata.get("author_code", "")))
+
+
+def write_index(out_path: str, ids, documents, metadatas, embeddings):
+    # Sort rows by author so every author is one contiguous partition
+    order = sorted(range(len(ids)), key=lambda row: (_partition_key(metadatas[row]), ids[row]))
+    matrix = np.asarray(embeddings, dtype=np.float32)[order]
+    matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+    partitions = {}
+    for position, row in enumerate(order):
+        author = _partition_key(metadatas[row])
+        start, _ = partitions.get(author, (position, position))
+        partitions[author] = (start, position + 1)
+
+    header = {
+        "dim": int(matrix.shape[1]),
+        "dtype": "float32",
+        "partitions": partitions,
+        "ids": [ids[row] for row in order],
+        "documents": [documents[row] for row in order],
+        "metadatas": [metadatas[row] for row in order],
+    }
+    # The data offset depends on the header length, which depends on the offset; iterate until stable
+    header["data_offset"] = 0
+    while True:
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        prefix = len(MAGIC) + 8 + len(header_bytes)
+        data_offset = (prefix + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        if data_offset == header["data_offset"]:
+            break
+        header["data_offset"] = data_offset
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (header["data_offset"] - f.tell()))
+        f.write(matrix.tobytes())
+    os.replace(tmp_path, out_path)
+    print(f"Wrote {len(order)} vectors for {len(partitions)} authors to '{out_path}'.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the in-process NumPy vector index from ChromaDB.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build")
+    build_parser.add_argument("--db", default="./gita_vector_db")
+    build_parser.add_argument("--out", default="gita_index.bin")
+    args = parser.parse_args()
+
+    import chromadb
+    collection = chromadb.PersistentClient(path=args.db).get_collection(name="gita_commentaries")
+    build_index(collection, args.out)
@@ -0,0 +1,189 @@
+# onnx_embedder.py (int8-quantized ONNX backend for the query embedding model)
+#
+# Usage:
+#   python onnx_embedder.py export  --out onnx_model
+#   python onnx_embedder.py parity  --onnx-dir onnx_model --sample 500
+#
+# The exported model is the same paraphrase-multilingual-mpnet-base-v2 network, so its
+# vectors live in the same space as the ones already stored in ChromaDB and the
+# database does not need to be re-embedded.
+
+import os
+import time
+import argparse
+
+import numpy as np
+
+MODEL_NAME = 'paraphrase-multilingual-mpnet-base-v2'
+ONNX_FILENAME = 'model_int8.onnx'
+TOKENIZER_FILENAME = 'tokenizer.json'
+MAX_SEQ_LENGTH = 128
+
+
+class OnnxEmbedder:
+    """
+    Drop-in replacement for SentenceTransformer.encode() backed by onnxruntime.
+    Only needs `onnxruntime` and `tokenizers`, so torch is never imported.
+    """
+
+    def __init__(self, model_dir: str, num_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("<pad>") or 1, pad_token="<pad>")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_FILENAME), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            outputs.append(_mean_pool(token_embeddings, attention_mask))
+        if not outputs:
+            return np.zeros((0, 768), dtype=np.float32)
+        return np.concatenate(outputs).astype(np.float32)
+
+
+def _mean_pool(token_embeddings, attention_mask):
+    # The sentence-transformers model uses plain mean pooling over non-padding tokens
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+# --- EXPORT ---
+def export_model(out_dir: str, opset: int = 17):
+    """Exports the transformer to ONNX, then applies dynamic int8 weight quantization."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"Loading '{MODEL_NAME}'...")
+    st_model = SentenceTransformer(MODEL_NAME, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    fp32_path = os.path.join(out_dir, 'model_fp32.onnx')
+    dummy = tokenizer(["Dharma is the path."], return_tensors='pt')
+    print(f"Exporting to '{fp32_path}'...")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (dummy['input_ids'], dummy['attention_mask']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'},
+            },
+            opset_version=opset,
+        )
+
+    int8_path = os.path.join(out_dir, ONNX_FILENAME)
+    print(f"Quantizing to int8 at '{int8_path}'...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, TOKENIZER_FILENAME))
+    size_mb = os.path.getsize(int8_path) / 1e6
+    print(f"Done. Quantized model is {size_mb:.1f} MB.")
+
+
+# --- PARITY CHECK ---
+PARITY_QUERIES = [
+    "What is dharma?",
+    "How should I deal with anxiety?",
+    "What happens to the soul after death?",
+    "Why should I act without attachment to results?",
+    "How can I control my mind?",
+    "What is true devotion?",
+    "मन को कैसे नियंत्रित करें?",
+    "कर्म का फल क्या है?",
+]
+
+
+def parity_check(onnx_dir: str, sample: int = 500, n_results: int = 5, db_path: str = "./gita_vector_db"):
+    """
+    Compares the ONNX embedder against the vectors already in ChromaDB (cosine agreement)
+    and against the PyTorch model on real queries (top-k retrieval overlap).
+    """
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+    from verse_table import is_compact
+
+    collection = chromadb.PersistentClient(path=db_path).get_collection(name="gita_commentaries")
+    stored = collection.get(limit=sample, include=["documents", "embeddings", "metadatas"])
+    documents = stored["documents"]
+    reference = np.asarray(stored["embeddings"], dtype=np.float32)
+
+    onnx_model = OnnxEmbedder(onnx_dir)
+    started = time.perf_counter()
+    candidate = onnx_model.encode(documents)
+    print(f"ONNX encoded {len(documents)} chunks in {time.perf_counter() - started:.2f}s")
+
+    cosines = np.sum(_unit(reference) * _unit(candidate), axis=1)
+    print(f"Cosine agreement with stored vectors: mean={cosines.mean():.4f} "
+          f"p01={np.percentile(cosines, 1):.4f} min={cosines.min():.4f}")
+
+    torch_model = SentenceTransformer(MODEL_NAME, device='cpu')
+    # Compact chunks (see verse_table.py) carry the author's code instead of the name
+    author_key = "author_code" if stored["metadatas"] and is_compact(stored["metadatas"][0]) else "author"
+    authors = sorted({m[author_key] for m in stored["metadatas"]})
+    overlaps, torch_ms, onnx_ms = [], [], []
+    for query in PARITY_QUERIES:
+        started = time.perf_counter()
+        torch_vector = torch_model.encode([query])
+        torch_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        onnx_vector = onnx_model.encode([query])
+        onnx_ms.append((time.perf_counter() - started) * 1000)
+        for author in authors:
+            expected = collection.query(query_embeddings=torch_vector.tolist(), n_results=n_results, where={author_key: author})
+            actual = collection.query(query_embeddings=onnx_vector.tolist(), n_results=n_results, where={author_key: author})
+            expected_ids, actual_ids = set(expected["ids"][0]), set(actual["ids"][0])
+            if expected_ids:
+                overlaps.append(len(expected_ids & actual_ids) / len(expected_ids))
+
+    print(f"Top-{n_results} retrieval overlap vs PyTorch: mean={np.mean(overlaps):.3f} min={np.min(overlaps):.3f} "
+          f"({len(overlaps)} query/author pairs)")
+    print(f"Per-query encode latency: torch={np.median(torch_ms):.1f}ms onnx={np.median(onnx_ms):.1f}ms (median)")
+
+
+def _unit(matrix):
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and validate the int8 ONNX embedding model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Export and quantize the embedding model")
+    export_parser.add_argument("--out", default="onnx_model")
+    parity_parser = commands.add_parser("parity", help="Compare ONNX vectors with the original model")
+    parity_parser.add_argument("--onnx-dir", default="onnx_model")
+    parity_parser.add_argument("--sample", type=int, default=500)
+    parity_parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_model(args.out)
+    else:
+        parity_check(args.onnx_dir, sample=args.sample, n_results=args.n_results)
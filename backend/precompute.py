@@ -0,0 +1,301 @@
+# precompute.py (Offline answers for frequent questions, for every author and language)
+#
+# Usage:
+#   python precompute.py run --questions faq.txt [--authors all] [--languages english,hindi] [--concurrency 4] [--tts]
+#   python precompute.py run --log backend.log --top 200 --min-count 3
+#   python precompute.py stats
+#   python precompute.py prune
+#
+# A long head of perennial questions is asked again and again, and each one used to go
+# through embedding, retrieval and Gemini every time. This job answers a question list
+# (or the most frequent questions mined from request logs) ahead of time for every
+# (author, output_language), and writes the answers to a small SQLite key-value store
+# keyed on (normalized question, author, language). GitaRAG checks the store before
+# anything else, so a head query becomes a pure lookup; with --tts its audio is rendered
+# into the audio store too, and /ask reuses it without calling ElevenLabs.
+#
+# Refresh policy: every entry records the version it was made with, a hash of the prompt
+# template, the slok corpus, the LLM and the context budget (answer_version()). Changing
+# any of them makes existing entries invisible to the API at once, and the next run
+# recomputes them. Entries also expire after PRECOMPUTED_MAX_AGE_DAYS, since a model
+# alias such as 'gemini-flash-latest' can change underneath us; a run refreshes entries
+# older than --refresh-days, so a nightly run keeps the head warm. Runs are resumable:
+# entries that are current are skipped, and each answer is committed as soon as it is made.
+
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import sqlite3
+import argparse
+import threading
+from collections import Counter
+
+from corpus import DEFAULT_SLOK_DIR, corpus_fingerprint
+from query_cache import normalize_query, read_queries
+
+SUPPORTED_LANGUAGES = ('english', 'hindi')
+# Bump to invalidate every precomputed answer by hand
+PRECOMPUTE_SALT = os.environ.get("PRECOMPUTE_SALT", "")
+
+
+def answer_version(prompt_templates, llm_name: str, context_token_budget: int,
+                   data_directory: str = DEFAULT_SLOK_DIR) -> str:
+    """Hash of everything a precomputed answer depends on besides the question, author and language."""
+    payload = json.dumps({
+        "prompts": list(prompt_templates),
+        "corpus": corpus_fingerprint(data_directory),
+        "llm": llm_name,
+        "context_token_budget": context_token_budget,
+        "salt": PRECOMPUTE_SALT,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class PrecomputedAnswers:
+    """
+    (normalized question, author, language) -> (answer, sources), with the version and time
+    each entry was made. Values are zlib-compressed JSON. get() only returns entries of the
+    given version that are younger than `max_age_seconds`.
+
+    With create=False (the API's reader) a missing file is not created: lookups are misses
+    until the first precompute run writes it, and then it is opened without a restart.
+    """
+
+    def __init__(self, db_path: str, max_age_seconds: float = 30 * 24 * 3600, create: bool = True):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if create or os.path.exists(db_path):
+            self._open_db()
+
+    @classmethod
+    def from_env(cls):
+        """The store at PRECOMPUTED_ANSWERS_PATH, or None if disabled. The file may not exist yet."""
+        if os.environ.get("PRECOMPUTED_ANSWERS_ENABLED", "1").lower() in ("0", "false", "no"):
+            return None
+        db_path = os.environ.get("PRECOMPUTED_ANSWERS_PATH", "./precomputed_answers.db")
+        return cls(db_path, max_age_seconds=float(os.environ.get("PRECOMPUTED_MAX_AGE_DAYS", "30")) * 24 * 3600,
+                   create=False)
+
+    # --- PUBLIC API ---
+    def get(self, query: str, author: str, output_language: str, version: str):
+        """Returns the precomputed (answer, sources), or None if missing, of another version or too old."""
+        row = self.entry(query, author, output_language)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            entry_version, created_at, value = row
+            if entry_version != version or (self.max_age_seconds and time.time() - created_at > self.max_age_seconds):
+                self.stale += 1
+                return None
+            self.hits += 1
+        answer, sources = _decode(value)
+        return answer, sources
+
+    def entry(self, query: str, author: str, output_language: str):
+        """The raw (version, created_at, value) row, whatever its version and age, or None."""
+        with self._lock:
+            if self._db is None:
+                # Not written yet when the API started; pick the file up as soon as a run creates it
+                if not os.path.exists(self.db_path):
+                    return None
+                self._open_db()
+            return self._db.execute(
+                "SELECT version, created_at, value FROM answers WHERE query = ? AND author = ? AND language = ?",
+                (normalize_query(query), author, output_language.lower()),
+            ).fetchone()
+
+    def put(self, query: str, author: str, output_language: str, version: str, answer: str, sources):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_query(query), author, output_language.lower(), version, time.time(),
+                 _encode(answer, sources)),
+            )
+            self._db.commit()
+
+    def prune(self, version: str):
+        """Deletes entries of other versions or past max age. Returns how many were deleted."""
+        cutoff = time.time() - self.max_age_seconds if self.max_age_seconds else 0
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM answers WHERE version != ? OR created_at < ?", (version, cutoff)
+            ).rowcount
+            self._db.commit()
+            self._db.execute("VACUUM")
+        return deleted
+
+    def counts(self, version: str):
+        with self._lock:
+            total, current = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(version = ?), 0) FROM answers", (version,)
+            ).fetchone()
+        return {"entries": total, "current": current, "stale": total - current}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    # --- INTERNALS ---
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL lets a running job write while the API reads
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "query TEXT, author TEXT, language TEXT, version TEXT, created_at REAL, value BLOB, "
+            "PRIMARY KEY (query, author, language)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+
+def _encode(answer: str, sources) -> bytes:
+    return zlib.compress(json.dumps([answer, sources], ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(value: bytes):
+    return json.loads(zlib.decompress(value))
+
+
+# --- QUESTION LISTS ---
+def top_queries(queries, top: int = 200, min_count: int = 1):
+    """The `top` most frequent questions asked at least `min_count` times, in the spelling first seen."""
+    counts, spellings = Counter(), {}
+    for query in queries:
+        query = query.strip()
+        key = normalize_query(query)
+        if key:
+            counts[key] += 1
+            spellings.setdefault(key, query)
+    return [spellings[key] for key, count in counts.most_common(top) if count >= min_count]
+
+
+# --- JOB ---
+async def precompute(engine, store: PrecomputedAnswers, version: str, questions, authors, languages,
+                     concurrency: int = 4, refresh_after_seconds: float = 25 * 24 * 3600, render_audio=None):
+    """
+    Answers every (question, author, language) without a current entry and stores the result.
+    Degraded answers (Gemini failed or timed out) and failures are not stored, so the next run
+    retries them. `render_audio`, if given, is awaited with each answer, including ones already
+    stored. Returns counts by outcome.
+    """
+    counts, finished = Counter(), 0
+    slots = asyncio.Semaphore(concurrency)
+    work = [(question, author, language) for question in questions for author in authors for language in languages]
+    started = time.perf_counter()
+
+    async def answer(question, author, language):
+        nonlocal finished
+        row = store.entry(question, author, language)
+        current = (row is not None and row[0] == version
+                   and time.time() - row[1] < refresh_after_seconds)
+        async with slots:
+            try:
+                if current:
+                    counts["skipped"] += 1
+                    text = _decode(row[2])[0] if render_audio is not None else None
+                else:
+                    text, source_docs, degraded = await engine.generate_answer_async(question, author, language)
+                    if degraded:
+                        counts["degraded"] += 1
+                        return
+                    store.put(question, author, language, version, text, source_docs)
+                    counts["answered"] += 1
+                if render_audio is not None:
+                    counts["audio_rendered"] += bool(await render_audio(text))
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"Failed: '{question}' ({author}, {language}): {type(e).__name__}: {e}")
+            finally:
+                finished += 1
+                if finished % 25 == 0 or finished == len(work):
+                    print(f"  {finished}/{len(work)} done ({counts['answered']} answered, {counts['skipped']} current) "
+                          f"in {time.perf_counter() - started:.0f}s")
+
+    await asyncio.gather(*(answer(*item) for item in work))
+    return dict(counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute answers for frequent questions.")
+    parser.add_argument("--path", default=os.environ.get("PRECOMPUTED_ANSWERS_PATH", "./precomputed_answers.db"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    questions_source = run_parser.add_mutually_exclusive_group(required=True)
+    questions_source.add_argument("--questions", help="File with one question per line")
+    questions_source.add_argument("--log", help="Backend log to mine the most frequent questions from")
+    run_parser.add_argument("--top", type=int, default=200, help="With --log: how many questions to keep")
+    run_parser.add_argument("--min-count", type=int, default=2, help="With --log: ignore questions asked fewer times")
+    run_parser.add_argument("--authors", default="all", help="Comma-separated authors, or 'all' from the verse table")
+    run_parser.add_argument("--languages", default=",".join(SUPPORTED_LANGUAGES))
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Generations at once")
+    run_parser.add_argument("--refresh-days", type=float, default=25, help="Recompute entries older than this")
+    run_parser.add_argument("--tts", action="store_true", help="Also render each answer's audio into the audio store")
+    commands.add_parser("stats")
+    commands.add_parser("prune")
+    args = parser.parse_args()
+
+    if args.command == "run" and args.tts:
+        # main's engine, TTS client and audio store, so rendered files get exactly the names /ask looks for
+        import main
+        engine = main.gita_engine
+        if main.tts_engine is None:
+            sys.exit("--tts needs a TTS backend (ELEVENLABS_API_KEY or TTS_BACKEND=stub).")
+
+        async def render_audio(text):
+            filename = main.audio_store.filename_for(text, main.tts_engine.voice)
+            if main.audio_store.lookup(filename):
+                return False
+            await main.synthesize_and_store(text, filename)
+            return True
+    else:
+        from gita_rag import GitaRAG
+        engine = GitaRAG()
+        render_audio = None
+
+    store = PrecomputedAnswers(args.path, max_age_seconds=0)
+    version = engine.answer_version
+    if args.command == "stats":
+        print(json.dumps({"version": version, **store.counts(version)}, indent=2))
+    elif args.command == "prune":
+        store.max_age_seconds = float(os.environ.get("PRECOMPUTED_MAX_AGE_DAYS", "30")) * 24 * 3600
+        print(f"Deleted {store.prune(version)} stale entries from '{args.path}'.")
+    else:
+        if args.questions:
+            with open(args.questions, "r", encoding="utf-8") as f:
+                questions = top_queries(f, top=None)
+        else:
+            questions = top_queries(read_queries(args.log), args.top, args.min_count)
+        if args.authors == "all":
+            from verse_table import shared_verse_table
+            authors = list(shared_verse_table().authors)
+        else:
+            authors = [author.strip() for author in args.authors.split(",") if author.strip()]
+        languages = [language.strip().lower() for language in args.languages.split(",") if language.strip()]
+        print(f"Precomputing {len(questions)} questions x {len(authors)} authors x {len(languages)} languages "
+              f"(version {version})...")
+        engine.warm_up()
+        counts = asyncio.run(precompute(
+            engine, store, version, questions, authors, languages,
+            concurrency=args.concurrency, refresh_after_seconds=args.refresh_days * 24 * 3600,
+            render_audio=render_audio,
+        ))
+        print(f"Done: {json.dumps(counts)}")
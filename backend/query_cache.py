@@ -0,0 +1,194 @@
+# query_cache.py (Cache of query embeddings keyed on normalized text)
+#
+# Usage:
+#   python query_cache.py prewarm --log backend.log [--path query_vectors.db]
+#
+# The same questions get re-embedded whenever the author or output language changes.
+# This cache maps normalized query text to its vector, in an in-memory LRU tier backed
+# by an optional SQLite tier that survives restarts and can be pre-warmed from logs.
+
+import os
+import re
+import time
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+# Zero-width joiners/non-joiners and BOMs change nothing visible in Devanagari text
+_INVISIBLE = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"))
+# Devanagari digits -> ASCII, so "२.४७" and "2.47" share an entry
+_DEVANAGARI_DIGITS = {0x0966 + i: str(i) for i in range(10)}
+_TRAILING_PUNCTUATION = "?!.।॥ "
+
+
+def normalize_query(text: str) -> str:
+    """NFC + case folding + whitespace collapsing, with Devanagari-specific clean-up."""
+    text = unicodedata.normalize("NFC", text)
+    text = text.translate(_INVISIBLE).translate(_DEVANAGARI_DIGITS)
+    text = text.casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION) or text
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache of query vectors. `namespace` identifies the embedding model, so
+    vectors from different backends (torch vs onnx) never mix in the disk tier.
+    """
+
+    def __init__(self, max_entries=10000, db_path=None, namespace="default"):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.namespace = namespace
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if db_path:
+            self._open_db()
+
+    @classmethod
+    def from_env(cls, namespace="default"):
+        """Builds the cache from QUERY_CACHE_* environment variables, or returns None if disabled."""
+        if os.environ.get("QUERY_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            max_entries=int(os.environ.get("QUERY_CACHE_SIZE", "10000")),
+            db_path=os.environ.get("QUERY_CACHE_PATH") or None,
+            namespace=namespace,
+        )
+
+    def get(self, query: str):
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT embedding FROM query_vectors WHERE namespace = ? AND query = ?", (self.namespace, key)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector):
+        key = normalize_query(query)
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_vectors VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, vector.tobytes(), time.time()),
+                )
+                self._db.commit()
+
+    def __contains__(self, query: str):
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._entries:
+                return True
+            if self._db is None:
+                return False
+            return self._db.execute(
+                "SELECT 1 FROM query_vectors WHERE namespace = ? AND query = ?", (self.namespace, key)
+            ).fetchone() is not None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    # --- INTERNALS ---
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_vectors ("
+            "namespace TEXT, query TEXT, embedding BLOB, updated_at REAL, PRIMARY KEY (namespace, query))"
+        )
+        self._db.commit()
+
+
+# --- PRE-WARMING ---
+_LOGGED_QUERY = re.compile(r"Received (?:streaming )?query: '(.*?)'(?:,|$)")
+
+
+def read_queries(log_path: str):
+    """Yields queries from a log file: either backend log lines or one plain query per line."""
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            match = _LOGGED_QUERY.search(line)
+            yield match.group(1) if match else line
+
+
+def prewarm(cache: QueryEmbeddingCache, queries, encode, batch_size: int = 64):
+    """Embeds every query not already cached, `batch_size` at a time. Returns how many were added."""
+    pending, seen, added = [], set(), 0
+    for query in queries:
+        key = normalize_query(query)
+        if key in seen or query in cache:
+            continue
+        seen.add(key)
+        pending.append(query)
+        if len(pending) >= batch_size:
+            added += _prewarm_batch(cache, pending, encode)
+            pending = []
+    if pending:
+        added += _prewarm_batch(cache, pending, encode)
+    return added
+
+
+def _prewarm_batch(cache, queries, encode):
+    for query, vector in zip(queries, encode(queries)):
+        cache.put(query, vector)
+    return len(queries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the on-disk query embedding cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prewarm_parser = commands.add_parser("prewarm")
+    prewarm_parser.add_argument("--log", required=True, help="Backend log or a file with one query per line")
+    prewarm_parser.add_argument("--path", default=os.environ.get("QUERY_CACHE_PATH") or "query_vectors.db")
+    args = parser.parse_args()
+
+    from gita_rag import GitaRAG, EMBEDDING_BACKEND
+    engine = GitaRAG()
+    disk_cache = QueryEmbeddingCache(db_path=args.path, namespace=EMBEDDING_BACKEND)
+    count = prewarm(disk_cache, read_queries(args.log), engine._encode_texts)
+    print(f"Pre-warmed {count} query embeddings into '{args.path}'.")
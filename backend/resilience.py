@@ -0,0 +1,156 @@
+# resilience.py (Deadlines, hedged requests and a circuit breaker for upstream calls)
+#
+# A slow Gemini response should cost us at most our own deadline, not the provider's.
+# hedged_call() bounds a call by a deadline and, optionally, fires a second identical
+# call when the first is slower than usual (the recent p95), keeping whichever answers
+# first and cancelling the other. The circuit breaker stops calling an upstream that
+# keeps failing, so requests degrade immediately instead of waiting for timeouts.
+
+import time
+import asyncio
+import threading
+from collections import deque
+
+from metrics import UPSTREAM_EVENTS
+
+
+class LatencyTracker:
+    """Recent call latencies, for picking the hedge delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float, default: float):
+        if len(self.samples) < self.min_samples:
+            return default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures it opens and
+    rejects calls for `reset_seconds`; then one trial call is let through (half-open),
+    which closes the breaker on success or re-opens it on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+        UPSTREAM_EVENTS.labels(self.name, "circuit_open").inc()
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def abandon(self):
+        """The call was cancelled before it could succeed or fail; frees the half-open trial slot."""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+async def hedged_call(make_call, deadline: float, hedge_after: float = None, upstream: str = "llm", discard=None):
+    """
+    Awaits `make_call()` for at most `deadline` seconds (raising asyncio.TimeoutError after that).
+    With `hedge_after`, a second call starts if the first hasn't finished by then, or as soon as
+    it fails; the first successful result wins and the other call is cancelled. `discard` is
+    awaited with any extra result that finished too late to be used (e.g. to close a stream);
+    such results are counted as "unused", since they were paid for all the same.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    pending = {asyncio.ensure_future(make_call())}
+    hedged = hedge_after is None
+    error = None
+    try:
+        while pending or not hedged:
+            now = loop.time()
+            if not hedged and (error is not None or now - started >= hedge_after):
+                hedged = True
+                UPSTREAM_EVENTS.labels(upstream, "hedged").inc()
+                pending.add(asyncio.ensure_future(make_call()))
+                continue
+            if now - started >= deadline:
+                UPSTREAM_EVENTS.labels(upstream, "timeout").inc()
+                raise asyncio.TimeoutError(f"{upstream} call exceeded its {deadline:.1f}s deadline")
+            wake_at = started + (deadline if hedged else min(deadline, hedge_after))
+            done, pending = await asyncio.wait(pending, timeout=wake_at - now, return_when=asyncio.FIRST_COMPLETED)
+            winner = None
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task
+                else:
+                    _abandon(task, upstream, discard)
+            if winner is not None:
+                UPSTREAM_EVENTS.labels(upstream, "ok").inc()
+                return winner.result()
+        UPSTREAM_EVENTS.labels(upstream, "error").inc()
+        raise error
+    finally:
+        for task in pending:
+            _abandon(task, upstream, discard)
+
+
+def _abandon(task, upstream: str, discard):
+    # Cancels a call whose result won't be used, and reads its outcome whenever it ends: a late
+    # exception is then never reported as unretrieved, and a late answer is counted and discarded.
+    def settle(done):
+        if done.cancelled() or done.exception() is not None:
+            return
+        UPSTREAM_EVENTS.labels(upstream, "unused").inc()
+        if discard is not None:
+            asyncio.ensure_future(discard(done.result()))
+
+    if task.done():
+        settle(task)
+    else:
+        task.cancel()
+        task.add_done_callback(settle)
+
+
+async def open_stream(stream):
+    """Waits for the first item of an async iterator; returns (stream, first_item). Closes the stream on failure."""
+    try:
+        return stream, await stream.__anext__()
+    except StopAsyncIteration:
+        await stream.aclose()
+        raise RuntimeError("Stream ended without producing anything")
+    except BaseException:
+        await stream.aclose()
+        raise
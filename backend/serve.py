@@ -0,0 +1,71 @@
+# serve.py (Production entry point: one shared model process, N uvicorn workers)
+#
+# Usage:
+#   WEB_CONCURRENCY=4 python serve.py
+#
+# With WEB_CONCURRENCY=1 (the default) this is plain `uvicorn main:app`. With more
+# workers it first starts model_server.py, which loads the embedding model and vector
+# index once, waits until it answers (the readiness gate), and only then starts the
+# workers with MODEL_SERVER_SOCKET pointing at it. Workers hold no model of their own,
+# so adding one costs the size of the web app, not another copy of the model.
+# If the model server dies, the whole server exits so the container gets restarted.
+
+import os
+import sys
+import time
+import signal
+import atexit
+import tempfile
+import threading
+import subprocess
+
+import uvicorn
+
+from model_server import ModelClient
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8000"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "/tmp/gita-models.sock")
+MODEL_SERVER_WAIT_SECONDS = float(os.environ.get("MODEL_SERVER_WAIT_SECONDS", "300"))
+
+
+def start_model_server():
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_server.py")
+    sidecar = subprocess.Popen([sys.executable, script, "--socket", MODEL_SERVER_SOCKET])
+    atexit.register(sidecar.terminate)
+    client = ModelClient(MODEL_SERVER_SOCKET)
+    print(f"Waiting for the model server (pid {sidecar.pid}) to load...")
+    # Stale socket files from a previous run are ignored: the ping must come from this sidecar
+    deadline = time.monotonic() + MODEL_SERVER_WAIT_SECONDS
+    while True:
+        if sidecar.poll() is not None:
+            sys.exit(f"Model server exited with code {sidecar.returncode} before becoming ready.")
+        if time.monotonic() >= deadline:
+            sidecar.terminate()
+            sys.exit(f"Model server not ready after {MODEL_SERVER_WAIT_SECONDS:.0f}s.")
+        try:
+            if client.wait_until_ready(2.0)["pid"] == sidecar.pid:
+                break
+        except RuntimeError:
+            pass
+    print("Model server is ready; starting workers.")
+
+    def watch():
+        sidecar.wait()
+        print(f"Model server exited with code {sidecar.returncode}; shutting down.")
+        os.kill(os.getpid(), signal.SIGTERM)
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def main():
+    if WEB_CONCURRENCY > 1:
+        start_model_server()
+        os.environ["MODEL_SERVER_SOCKET"] = MODEL_SERVER_SOCKET
+        # Per-process metric files, aggregated by /metrics (see metrics.py)
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="gita-metrics-"))
+    uvicorn.run("main:app", host=HOST, port=PORT, workers=WEB_CONCURRENCY)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# singleflight.py (Coalescing of identical in-flight work)
+#
+# When a popular question trends, many identical requests arrive at once. Instead of
+# each running the embedder, vector search, Gemini and ElevenLabs, the first caller for
+# a key starts the computation and every concurrent caller with the same key awaits
+# that same task.
+
+import asyncio
+
+from metrics import COALESCED
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time. Concurrent callers share its result or
+    its exception. A caller that is cancelled only stops waiting; the shared computation is
+    cancelled once no caller is waiting for it any more.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights = {}  # key -> [task, number of waiting callers]
+        self.started = 0
+        self.joined = 0
+
+    async def run(self, key, make_coroutine):
+        """Returns the result of `make_coroutine()`, or of the identical computation already running for `key`."""
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(make_coroutine())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+            COALESCED.labels(self.name, "started").inc()
+        else:
+            self.joined += 1
+            COALESCED.labels(self.name, "joined").inc()
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            # shield() keeps one caller's cancellation from cancelling the others' result
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and flight[1] == 1:
+                # Forget it first, so a caller arriving now starts afresh instead of joining a cancelled task
+                self._forget(key, task)
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    def stats(self):
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._flights)}
+
+    def _forget(self, key, task):
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
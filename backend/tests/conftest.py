@@ -0,0 +1,12 @@
+# conftest.py (Puts backend/ on sys.path, so tests import its flat modules as the app does)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep tests off the network and off any cache files left in the working directory
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("TTS_BACKEND", "stub")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "0")
+os.environ.setdefault("QUERY_CACHE_ENABLED", "0")
+os.environ.setdefault("PRECOMPUTED_ANSWERS_ENABLED", "0")
@@ -0,0 +1,79 @@
+# test_admission.py (Admission control and load shedding)
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+async def _hold(controller, release):
+    async with controller.admit():
+        await release.wait()
+
+
+def test_full_queue_is_shed_with_429():
+    async def main():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=1, queue_timeout=5.0)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        waiter = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.01)
+        assert controller.pressured() and controller.saturated()
+        with pytest.raises(Overloaded) as shed:
+            async with controller.admit():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return shed.value, controller.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.status_code == 429 and error.reason == "queue full"
+    assert 1 <= error.retry_after <= 60
+    assert stats["shed"] == 1 and stats["queued"] == 1 and stats["admitted"] == 2
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+
+
+def test_waiting_too_long_is_shed_with_503():
+    async def main():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=4, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as timed_out:
+            async with controller.admit():
+                pass
+        assert controller.stats()["waiting"] == 0
+        release.set()
+        await holder
+        return timed_out.value, controller.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.status_code == 503
+    assert stats["timeout"] == 1 and stats["in_flight"] == 0
+
+
+def test_slots_are_handed_to_waiters_in_arrival_order():
+    order = []
+
+    async def enter(controller, name):
+        async with controller.admit():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=4, queue_timeout=5.0)
+        await asyncio.gather(*(enter(controller, name) for name in "abcd"))
+
+    asyncio.run(main())
+    assert order == list("abcd")
+
+
+def test_retry_after_grows_with_the_queue():
+    controller = AdmissionController("test", max_in_flight=2, max_queue=100, queue_timeout=5.0)
+    controller.mean_hold_seconds = 3.0
+    assert controller.retry_after() == 2
+    controller._waiters.extend([None] * 9)
+    assert controller.retry_after() == 15
+    controller._waiters.extend([None] * 90)
+    assert controller.retry_after() == 60
@@ -0,0 +1,73 @@
+# test_answer_cache.py (Semantic answer cache and exact-key entries)
+
+import sqlite3
+
+import numpy as np
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+def test_exact_key_survives_restart(tmp_path):
+    db_path = str(tmp_path / "answers.db")
+    cache = SemanticAnswerCache(db_path=db_path)
+    cache.store_key("Swami Sivananda", "English", "verse:BG2.47", "Do your duty.", [{"shloka_id": "BG2.47"}])
+    cache.store_key("Swami Sivananda", "english", "verse:BG2.47", "Act without attachment.", [])
+
+    reopened = SemanticAnswerCache(db_path=db_path)
+    assert reopened.lookup_key("Swami Sivananda", "english", "verse:BG2.47") == ("Act without attachment.", [])
+    assert reopened.lookup_key("Swami Sivananda", "hindi", "verse:BG2.47") is None
+    assert reopened.stats()["entries"] == 1
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_semantic_hits_are_per_version():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("Swami Sivananda", "english", _vector(1, 0, 0), "Old answer.", [], version="v1")
+    assert cache.lookup("Swami Sivananda", "english", _vector(0.99, 0.1, 0), version="v1") == ("Old answer.", [])
+    assert cache.lookup("Swami Sivananda", "english", _vector(0.99, 0.1, 0), version="v2") is None
+    assert cache.lookup("Swami Sivananda", "english", _vector(0, 1, 0), version="v1") is None
+
+
+def test_eviction_keeps_the_key_matrix_consistent():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=3)
+    for i, vector in enumerate([(1, 0, 0), (0, 1, 0), (0, 0, 1)]):
+        cache.store("Swami Sivananda", "english", _vector(*vector), f"answer {i}", [])
+    # Touch the first answer, so the second is now least recently used
+    assert cache.lookup("Swami Sivananda", "english", _vector(1, 0, 0))[0] == "answer 0"
+    cache.store("Swami Sivananda", "english", _vector(1, 1, 0), "answer 3", [])
+
+    assert cache.lookup("Swami Sivananda", "english", _vector(0, 1, 0)) is None
+    for i, vector in [(0, (1, 0, 0)), (2, (0, 0, 1)), (3, (1, 1, 0))]:
+        assert cache.lookup("Swami Sivananda", "english", _vector(*vector))[0] == f"answer {i}"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_answers_are_not_served(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    cache.store("Swami Sivananda", "english", _vector(1, 0), "Early.", [])
+    now[0] += 30
+    cache.store_key("Swami Sivananda", "english", "verse:BG2.47", "Later.", [])
+    now[0] += 40
+    assert cache.lookup("Swami Sivananda", "english", _vector(1, 0)) is None
+    assert cache.lookup_key("Swami Sivananda", "english", "verse:BG2.47") == ("Later.", [])
+    assert cache.stats()["entries"] == 1
+
+
+def test_reopening_without_ttl_prunes_rows_beyond_max_entries(tmp_path):
+    db_path = str(tmp_path / "answers.db")
+    cache = SemanticAnswerCache(ttl_seconds=0, max_entries=10, db_path=db_path)
+    for i in range(10):
+        cache.store_key("Swami Sivananda", "english", f"verse:BG1.{i}", f"answer {i}", [])
+
+    reopened = SemanticAnswerCache(ttl_seconds=0, max_entries=4, db_path=db_path)
+    assert reopened.stats()["entries"] == 4
+    assert reopened.lookup_key("Swami Sivananda", "english", "verse:BG1.9") == ("answer 9", [])
+    assert reopened.lookup_key("Swami Sivananda", "english", "verse:BG1.0") is None
+    rows = sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+    assert rows == 4
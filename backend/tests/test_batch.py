@@ -0,0 +1,45 @@
+# test_batch.py (Batch answers: per-item errors and their own generation gate)
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from fake_llm import FakeLLM
+from gita_rag import GitaRAG, BATCH_LLM_MAX_CONCURRENCY
+
+
+def test_failed_items_report_errors_and_batches_keep_off_interactive_slots():
+    engine = GitaRAG()
+    engine.answer_cache = engine.query_cache = None
+    llm = FakeLLM(first_token_latency=0.0, tokens_per_second=10000.0)
+    slots_seen = []
+
+    async def generate_content_async(prompt, **kwargs):
+        slots_seen.append((engine.stage_limits["llm"]._value, engine.stage_limits["llm_batch"]._value))
+        return await FakeLLM.generate_content_async(llm, prompt, **kwargs)
+    engine.llm_client = llm
+    llm.generate_content_async = generate_content_async
+
+    def encode_texts(texts):
+        raise RuntimeError("embedding model unavailable")
+    engine._encode_texts = encode_texts
+
+    async def run():
+        items = [{"query": "BG 2.47", "author": "Swami Sivananda"},
+                 {"query": "What is karma?", "author": "Swami Sivananda"}]
+        return {index: (answer, error) async for index, answer, _, error in engine.ask_krishna_batch_async(items)}
+
+    results = asyncio.run(run())
+    assert results[0][0] and results[0][1] is None
+    assert results[1] == (None, "RuntimeError: embedding model unavailable")
+    llm_slots = engine.stage_limits["llm"]._value
+    assert slots_seen == [(llm_slots, BATCH_LLM_MAX_CONCURRENCY - 1)]
+
+
+def test_batch_concurrency_is_capped():
+    response = TestClient(main.app).post("/ask/batch", json={
+        "items": [{"query": "BG 2.47", "author": "Swami Sivananda"}],
+        "llm_concurrency": BATCH_LLM_MAX_CONCURRENCY + 1,
+    })
+    assert response.status_code == 422
@@ -0,0 +1,45 @@
+# test_embedding_batcher.py (Micro-batching of query embeddings)
+
+import asyncio
+
+import pytest
+
+from embedding_batcher import EmbeddingBatcher
+
+
+def test_concurrent_texts_share_a_batch():
+    async def encode(texts):
+        return [len(text) for text in texts]
+
+    async def main():
+        batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=20)
+        vectors = await asyncio.gather(*(batcher.embed("x" * n) for n in range(1, 6)))
+        return vectors, batcher.stats()
+
+    vectors, stats = asyncio.run(main())
+    assert vectors == [1, 2, 3, 4, 5]
+    assert stats["batches"] == 1 and stats["largest_batch"] == 5
+
+
+def test_cancelled_encode_releases_waiters():
+    started = None
+
+    async def encode(texts):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def main():
+        nonlocal started
+        started = asyncio.Event()
+        batcher = EmbeddingBatcher(encode, max_wait_ms=1)
+        waiter = asyncio.ensure_future(batcher.embed("karma"))
+        await started.wait()
+        assert len(batcher._encoding) == 1
+        for task in list(batcher._encoding):
+            task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiter, timeout=1)
+        await asyncio.sleep(0)
+        assert not batcher._encoding
+
+    asyncio.run(main())
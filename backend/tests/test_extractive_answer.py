@@ -0,0 +1,53 @@
+# test_extractive_answer.py (Degraded answers built from the retrieved passages)
+
+import asyncio
+
+import gita_rag
+from context_builder import extractive_answer
+from fake_llm import FakeLLM
+
+
+def _doc(shloka_id, commentary_type, text, author="Swami Sivananda"):
+    return {"shloka_id": shloka_id, "shloka_sanskrit": "", "commentary": text, "author": author,
+            "commentary_type": commentary_type}
+
+
+SOURCES = [
+    _doc("BG2.47", "english_commentary", "A long purport about action. It goes on and on."),
+    _doc("BG2.47", "english_translation", "Thy right is to work only, never to its fruits."),
+    _doc("BG2.47", "hindi_translation", "कर्म करने में ही तुम्हारा अधिकार है, फल में कभी नहीं।"),
+    _doc("BG3.19", "english_commentary", "Therefore, without attachment, do thy duty."),
+]
+
+
+def test_prefers_translation_in_requested_language():
+    english = extractive_answer(SOURCES, "Intro:", "english")
+    assert "Chapter 2, Verse 47: Thy right is to work only" in english
+    assert "purport" not in english
+
+    hindi = extractive_answer(SOURCES, "Intro:", "hindi")
+    assert "Chapter 2, Verse 47: कर्म करने में ही तुम्हारा अधिकार है" in hindi
+
+
+def test_falls_back_to_commentary_without_translation():
+    answer = extractive_answer(SOURCES, "Intro:", "english")
+    assert "Chapter 3, Verse 19: Therefore, without attachment, do thy duty." in answer
+    # One line per verse, in retrieval order
+    assert answer.split("\n\n") == [
+        "Intro:",
+        "Chapter 2, Verse 47: Thy right is to work only, never to its fruits.",
+        "Chapter 3, Verse 19: Therefore, without attachment, do thy duty.",
+    ]
+
+
+def test_deadline_falls_back_to_translations(monkeypatch):
+    monkeypatch.setattr(gita_rag, "LLM_DEADLINE_SECONDS", 0.05)
+    engine = gita_rag.GitaRAG()
+    engine.llm_client = FakeLLM(first_token_latency=5.0)
+
+    answer, degraded = asyncio.run(engine._generate_guarded("What is my duty?", "context", SOURCES, "hindi"))
+
+    assert degraded
+    assert answer.startswith("मेरे प्रिय साधक")
+    assert "कर्म करने में ही तुम्हारा अधिकार है" in answer
+    assert engine.llm_breaker.consecutive_failures == 1
@@ -0,0 +1,47 @@
+# test_load_shedding.py (/ask under Gemini and TTS saturation)
+
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionController
+from audio_store import AudioStore
+
+
+def _fixed_answer(monkeypatch):
+    async def ask_krishna_async(query, author, output_language='english'):
+        return "My dear friend, act without attachment.", []
+    monkeypatch.setattr(main.gita_engine, "ask_krishna_async", ask_krishna_async)
+
+
+def test_ask_answers_with_text_when_tts_is_saturated(monkeypatch, tmp_path):
+    _fixed_answer(monkeypatch)
+    monkeypatch.setattr(main, "audio_store", AudioStore(str(tmp_path)))
+    monkeypatch.setattr(main, "TTS_PIPELINE", False)
+    # TTS looked free when audio_allowed() ran, but no slot or queue place is left by synthesis time
+    monkeypatch.setattr(main, "audio_allowed", lambda: True)
+    monkeypatch.setattr(main, "tts_admission", AdmissionController("tts", 0, 0, 1.0))
+
+    response = TestClient(main.app).post(
+        "/ask", json={"query": "How do I act?", "author": "Swami Sivananda", "generate_audio": True}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"] == "My dear friend, act without attachment."
+    assert body["audio_url"] is None
+    assert body["audio_degraded"] is True
+
+
+def test_ask_is_shed_with_429_and_retry_after(monkeypatch):
+    monkeypatch.setattr(main.gita_engine, "llm_admission", AdmissionController("answer", 0, 0, 1.0))
+
+    async def ask_krishna_async(query, author, output_language='english'):
+        async with main.gita_engine.llm_admission.admit():
+            return "unreachable", []
+    monkeypatch.setattr(main.gita_engine, "ask_krishna_async", ask_krishna_async)
+
+    client = TestClient(main.app)
+    for path in ("/ask", "/ask/stream"):
+        response = client.post(path, json={"query": "How do I act?", "author": "Swami Sivananda"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert "busy" in response.json()["detail"]
@@ -0,0 +1,38 @@
+# test_precompute.py (Offline answers and the API's view of them)
+
+import asyncio
+
+from precompute import PrecomputedAnswers, precompute
+
+
+class _Engine:
+    def __init__(self):
+        self.asked = []
+
+    async def generate_answer_async(self, query, author, output_language='english'):
+        self.asked.append((query, author, output_language))
+        return f"Answer to {query}", [{"shloka_id": "BG2.47"}], query.startswith("slow")
+
+
+def test_api_store_picks_up_a_file_created_after_startup(tmp_path):
+    db_path = str(tmp_path / "precomputed.db")
+    reader = PrecomputedAnswers(db_path, create=False)
+    assert reader.get("What is karma?", "Swami Sivananda", "english", "v1") is None
+
+    writer = PrecomputedAnswers(db_path)
+    writer.put("What is karma?", "Swami Sivananda", "english", "v1", "Action.", [])
+    assert reader.get("what is karma", "Swami Sivananda", "English", "v1") == ("Action.", [])
+    assert reader.get("What is karma?", "Swami Sivananda", "english", "v2") is None
+
+
+def test_job_stores_fresh_answers_and_skips_current_and_degraded(tmp_path):
+    store = PrecomputedAnswers(str(tmp_path / "precomputed.db"))
+    engine = _Engine()
+    questions = ["What is karma?", "slow question"]
+    counts = asyncio.run(precompute(engine, store, "v1", questions, ["Swami Sivananda"], ["english"]))
+    assert counts == {"answered": 1, "degraded": 1}
+    assert store.get("slow question", "Swami Sivananda", "english", "v1") is None
+
+    counts = asyncio.run(precompute(engine, store, "v1", questions, ["Swami Sivananda"], ["english"]))
+    assert counts == {"skipped": 1, "degraded": 1}
+    assert len(engine.asked) == 3
@@ -0,0 +1,156 @@
+# test_resilience.py (Deadlines, hedged requests and the circuit breaker)
+
+import gc
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, LatencyTracker, hedged_call
+
+
+def _call_sequence(*behaviours):
+    # Each call to the returned function takes the next (delay, result) pair; an Exception result is raised
+    calls = iter(behaviours)
+    started = []
+
+    async def make_call():
+        delay, result = next(calls)
+        started.append(delay)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return make_call, started
+
+
+def test_returns_within_deadline_without_hedging():
+    make_call, started = _call_sequence((0.01, "answer"))
+    assert asyncio.run(hedged_call(make_call, deadline=1.0)) == "answer"
+    assert len(started) == 1
+
+
+def test_deadline_raises_timeout():
+    make_call, _ = _call_sequence((5.0, "too late"))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(hedged_call(make_call, deadline=0.05))
+
+
+def test_slow_call_is_hedged_and_the_faster_one_wins():
+    make_call, started = _call_sequence((5.0, "slow"), (0.01, "hedge"))
+    assert asyncio.run(hedged_call(make_call, deadline=1.0, hedge_after=0.05)) == "hedge"
+    assert len(started) == 2
+
+
+def test_failed_call_is_hedged_at_once():
+    make_call, started = _call_sequence((0.0, RuntimeError("503")), (0.01, "retry"))
+    assert asyncio.run(hedged_call(make_call, deadline=1.0, hedge_after=10.0)) == "retry"
+    assert len(started) == 2
+
+
+def test_hedged_calls_still_respect_the_deadline():
+    make_call, started = _call_sequence((5.0, "slow"), (5.0, "slower"))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(hedged_call(make_call, deadline=0.1, hedge_after=0.02))
+    assert len(started) == 2
+
+
+def test_both_failures_raise_the_last_error():
+    make_call, _ = _call_sequence((0.0, RuntimeError("first")), (0.0, RuntimeError("second")))
+    with pytest.raises(RuntimeError, match="second"):
+        asyncio.run(hedged_call(make_call, deadline=1.0, hedge_after=10.0))
+
+
+def test_breaker_opens_then_lets_one_trial_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0}
+    assert breaker.allow()
+
+
+def test_abandoned_trial_frees_the_half_open_slot(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    now[0] += 10
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+
+
+def test_latency_tracker_uses_the_default_until_enough_samples():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.add(1.0)
+    assert tracker.percentile(95, default=8.0) == 8.0
+    for seconds in (2.0, 3.0, 4.0):
+        tracker.add(seconds)
+    assert tracker.percentile(95, default=8.0) == 4.0
+
+
+def test_when_both_calls_finish_the_extra_result_is_discarded():
+    discarded = []
+
+    async def main():
+        gate = asyncio.Event()
+        results = iter(["first", "second"])
+
+        async def make_call():
+            result = next(results)
+            await gate.wait()
+            return result
+
+        async def discard(result):
+            discarded.append(result)
+
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        answer = await hedged_call(make_call, deadline=1.0, hedge_after=0.01, discard=discard)
+        await asyncio.sleep(0)
+        return answer
+
+    answer = asyncio.run(main())
+    assert answer in ("first", "second")
+    assert discarded == [{"first", "second"}.difference([answer]).pop()]
+
+
+def test_late_failure_of_an_abandoned_call_is_retrieved():
+    unretrieved = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        calls = iter(["slow", "fast"])
+
+        async def make_call():
+            if next(calls) == "fast":
+                return "hedge"
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                # Some clients surface their own error when cancelled
+                raise RuntimeError("connection reset")
+
+        answer = await hedged_call(make_call, deadline=1.0, hedge_after=0.01)
+        await asyncio.sleep(0.01)
+        gc.collect()
+        return answer
+
+    assert asyncio.run(main()) == "hedge"
+    assert unretrieved == []
@@ -0,0 +1,79 @@
+# test_singleflight.py (Coalescing of identical in-flight work)
+
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.run("karma", compute) for _ in range(5)))
+        return results, flights.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert stats == {"started": 1, "joined": 4, "in_flight": 0}
+
+
+def test_callers_share_the_exception_and_the_next_call_starts_afresh():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.run("karma", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await flights.run("karma", lambda: asyncio.sleep(0, result="recovered")) == "recovered"
+        return flights.stats()
+
+    assert asyncio.run(main())["started"] == 2
+
+
+def test_cancelling_one_caller_leaves_the_others_their_result():
+    async def main():
+        flights = SingleFlight("test")
+        first = asyncio.ensure_future(flights.run("karma", lambda: asyncio.sleep(0.05, result="answer")))
+        second = asyncio.ensure_future(flights.run("karma", lambda: asyncio.sleep(0.05, result="other")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "answer"
+
+
+def test_computation_is_cancelled_when_its_last_caller_leaves():
+    cancelled = []
+
+    async def compute():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        flights = SingleFlight("test")
+        caller = asyncio.ensure_future(flights.run("karma", compute))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        return flights.stats()
+
+    assert asyncio.run(main())["in_flight"] == 0
+    assert cancelled == [1]
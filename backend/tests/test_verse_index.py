@@ -0,0 +1,43 @@
+# test_verse_index.py (Verse references in queries)
+
+import pytest
+
+from gita_rag import GitaRAG
+from verse_index import VerseIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return VerseIndex.build()
+
+
+@pytest.mark.parametrize("query, shloka_id", [
+    ("BG 2.47", "BG2.47"),
+    ("chapter 2 verse 47", "BG2.47"),
+    ("2.47", "BG2.47"),
+    ("verse 2:47?", "BG2.47"),
+    ("shloka 18.66", "BG18.66"),
+    ("२.४७", "BG2.47"),
+])
+def test_parses_references(index, query, shloka_id):
+    assert index.parse_reference(query) == shloka_id
+
+
+@pytest.mark.parametrize("query", ["what is 1.5 times karma", "Is 3:1 ratio good", "2.47 meaning please"])
+def test_ignores_numbers_inside_questions(index, query):
+    assert index.parse_reference(query) is None
+
+
+def test_reference_inside_a_question_does_not_share_the_reference_cache_entry(index):
+    engine = GitaRAG()
+    engine.verse_index = index
+
+    def cache_key(query):
+        return engine._verse_cache_key(query, index.lookup(query, "Swami Sivananda"))
+
+    assert {cache_key(query) for query in ("2.47", "BG 2.47", "chapter 2 verse 47?")} == {"verse:BG2.47"}
+    questions = ["How does BG 2.47 apply to students?", "Explain chapter 2 verse 47 for someone who lost a job",
+                 "Compare gita 2.47 with 3.19"]
+    keys = [cache_key(question) for question in questions]
+    assert all(key.startswith("verse:BG2.47:") for key in keys)
+    assert len(set(keys)) == len(questions)
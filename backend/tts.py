@@ -0,0 +1,218 @@
+# tts.py (Sentence-pipelined text-to-speech)
+#
+# Instead of synthesizing the whole answer in one call, the text is cut at sentence
+# boundaries as it becomes available and several sentences are synthesized at once.
+# The MP3 bytes are published, in order, to a LiveAudio buffer that /audio/stream/{id}
+# streams to the browser, so playback starts after the first sentence.
+
+import os
+import re
+import time
+import uuid
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।॥])[\"'”’)]*\s+")
+
+
+# --- SENTENCE SEGMENTATION ---
+class SentenceSegmenter:
+    """Incrementally splits streamed text into sentences of at least `min_chars` characters."""
+
+    def __init__(self, min_chars: int = 40):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str):
+        """Adds text and returns the sentences that are now complete."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.end() - start >= self.min_chars:
+                sentences.append(self._buffer[start:match.end()].strip())
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Returns whatever text is left over once the stream has ended."""
+        remainder, self._buffer = self._buffer.strip(), ""
+        return [remainder] if remainder else []
+
+
+def split_sentences(text: str, min_chars: int = 40):
+    segmenter = SentenceSegmenter(min_chars)
+    return segmenter.feed(text) + segmenter.flush()
+
+
+# --- TTS BACKENDS ---
+# Every backend exposes `voice`: the parameters that, together with the text, fully
+# determine the audio. audio_store.py hashes them into the cache filename.
+class ElevenLabsTTS:
+    def __init__(self, client, voice_id: str, model_id: str, voice_settings: dict):
+        from elevenlabs import VoiceSettings
+        self.client = client
+        self.voice = {"voice_id": voice_id, "model_id": model_id, **voice_settings}
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.voice_settings = VoiceSettings(**voice_settings)
+
+    async def synthesize(self, text: str) -> bytes:
+        chunks = [chunk async for chunk in self.client.text_to_speech.convert(
+            voice_id=self.voice_id, text=text, model_id=self.model_id, voice_settings=self.voice_settings,
+        )]
+        return b"".join(chunks)
+
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz): 4-byte header + 413 zero bytes
+_SILENT_MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+
+
+class StubTTS:
+    """
+    Local stand-in for tests and benchmarks: returns silent MP3 audio roughly proportional to
+    the text length after `latency` seconds plus `seconds_per_char` per character, and fails
+    a `failure_rate` fraction of calls.
+    """
+
+    def __init__(self, latency: float = 0.05, seconds_per_char: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+        self.failure_rate = failure_rate
+        self.voice = {"voice_id": "stub", "model_id": "stub"}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.environ.get("STUB_TTS_LATENCY_MS", "50")) / 1000.0,
+            seconds_per_char=float(os.environ.get("STUB_TTS_MS_PER_CHAR", "0")) / 1000.0,
+            failure_rate=float(os.environ.get("STUB_TTS_FAILURE_RATE", "0")),
+        )
+
+    async def synthesize(self, text: str) -> bytes:
+        await asyncio.sleep(self.latency + self.seconds_per_char * len(text))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Stub TTS failure (simulated)")
+        # ~26 ms per frame; assume ~15 characters per second of speech
+        return _SILENT_MP3_FRAME * max(1, int(len(text) / 15 / 0.026))
+
+
+# --- LIVE AUDIO BUFFER ---
+class LiveAudio:
+    """Append-only byte buffer that any number of readers can stream while it is still being written."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.chunks = []
+        self.failed_segments = 0
+        self.finished = False
+        self.finished_at = None
+        self._changed = asyncio.Condition()
+
+    async def append(self, data: bytes):
+        async with self._changed:
+            self.chunks.append(data)
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.finished = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def iter_bytes(self):
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.chunks) or self.finished)
+                pending = self.chunks[position:]
+                done = self.finished
+            for data in pending:
+                yield data
+            position += len(pending)
+            if done and position == len(self.chunks):
+                return
+
+
+class AudioStreamRegistry:
+    """Keeps live audio buffers addressable by id until `ttl_seconds` after they finish."""
+
+    def __init__(self, ttl_seconds: float = 600):
+        self.ttl_seconds = ttl_seconds
+        self._streams = {}
+
+    def create(self):
+        self._purge()
+        live_audio = LiveAudio()
+        self._streams[live_audio.id] = live_audio
+        return live_audio
+
+    def get(self, stream_id: str):
+        return self._streams.get(stream_id)
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [stream_id for stream_id, live_audio in self._streams.items()
+                   if live_audio.finished and now - live_audio.finished_at > self.ttl_seconds]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+
+# --- PIPELINE ---
+async def synthesize_pipelined(synthesize_fn, text_chunks, live_audio: LiveAudio, max_parallel: int = 3, min_chars: int = 40):
+    """
+    Consumes an async iterator of text chunks, synthesizes complete sentences with up to
+    `max_parallel` calls to `synthesize_fn` in flight, and appends the audio to `live_audio`
+    in sentence order.
+    """
+    limit = asyncio.Semaphore(max_parallel)
+    segmenter = SentenceSegmenter(min_chars)
+    pending = asyncio.Queue()
+
+    async def synthesize(sentence):
+        async with limit:
+            return await synthesize_fn(sentence)
+
+    async def publish_in_order():
+        while True:
+            task = await pending.get()
+            if task is None:
+                return
+            try:
+                await live_audio.append(await task)
+            except Exception as e:
+                live_audio.failed_segments += 1
+                logger.error(f"Error synthesizing audio segment: {e}")
+
+    publisher = asyncio.create_task(publish_in_order())
+    try:
+        async for text in text_chunks:
+            for sentence in segmenter.feed(text):
+                await pending.put(asyncio.create_task(synthesize(sentence)))
+        for sentence in segmenter.flush():
+            await pending.put(asyncio.create_task(synthesize(sentence)))
+        await pending.put(None)
+        await publisher
+    finally:
+        if not publisher.done():
+            publisher.cancel()
+        await live_audio.finish()
+
+
+async def iter_text(sentences):
+    # Adapts an already complete list of text pieces to the async iterator the pipeline expects
+    for sentence in sentences:
+        yield sentence
+
+
+async def iter_queue(queue: asyncio.Queue):
+    # Yields items put on `queue` until a None sentinel arrives
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        yield item
@@ -0,0 +1,246 @@
+# verse_index.py (Direct verse lookup and lexical search over the slok corpus)
+#
+# Many questions are verse references ("BG 2.47", "chapter 18 verse 66") or a pasted
+# Sanskrit line / transliteration. Semantic search often misses the exact verse for
+# those, so this index, built once at startup from the slok files, answers them
+# directly: references are parsed and resolved through an id map, and everything else
+# can be matched with BM25 over the Sanskrit, transliteration and translations.
+
+import re
+import json
+import math
+import unicodedata
+from collections import Counter, defaultdict
+
+from corpus import DEFAULT_SLOK_DIR, COMMENTARY_TYPES, list_slok_files
+
+# Order in which an author's texts are offered as passages: translations first
+PASSAGE_TYPES = ['et', 'ht', 'ec', 'hc', 'sc']
+TRANSLATION_TYPES = ['et', 'ht']
+PASSAGE_CHARS = 1000  # Same as the ingestion chunk_size
+
+_DEVANAGARI_DIGITS = {0x0966 + i: str(i) for i in range(10)}
+_REFERENCE_PATTERNS = [
+    # BG 2.47 / Gita 2:47 / Bhagavad Gita 2.47
+    (re.compile(r"\b(?:bg|gita|geeta|bhagavad\s*g[iī]ta)\s*(\d{1,2})\s*[.:,\- ]\s*(\d{1,2})\b"), True),
+    # chapter 18 verse 66 / ch. 18 v. 66 / chapter 18, shloka 66
+    (re.compile(r"\b(?:chapter|ch\.?)\s*(\d{1,2})\s*,?\s*(?:verse|shloka|sloka|slok|v\.?)\s*(\d{1,2})\b"), True),
+    # अध्याय 2 श्लोक 47
+    (re.compile(r"अध्याय\s*(\d{1,2})\s*,?\s*(?:श्लोक|श्लोका)\s*(\d{1,2})"), True),
+    # A bare "2.47" only counts when it is the whole query ("verse 2.47" and "shloka 2:47" too),
+    # so "what is 1.5 times karma" or "is a 3:1 ratio good" are not taken for verses
+    (re.compile(r"(?:(?:verse|shloka|sloka|slok|श्लोक)\s*)?(\d{1,2})\s*[.:]\s*(\d{1,2})\s*[?.!।]*"), False),
+]
+_TOKEN_SPLIT = re.compile(r"[\s.,;:!?\"'“”‘’()\[\]{}|।॥\-–—/\\*_0-9]+")
+# Spelling variants of romanized Sanskrit folded together (after diacritics are removed)
+_PHONETIC_FOLDS = [("sh", "s"), ("ch", "c"), ("w", "v"), ("ee", "i"), ("oo", "u"), ("aa", "a"), ("h", "")]
+_MIN_VERSE_TRIGRAMS = 10
+
+
+def tokenize(text: str):
+    """Case-folded tokens with Latin diacritics removed, so 'karmaṇyevādhikāraste' matches 'karmanyevadhikaraste'."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not "̀" <= c <= "ͯ")
+    return [token for token in _TOKEN_SPLIT.split(text) if len(token) > 1]
+
+
+def _trigrams(text: str):
+    folded = "".join(tokenize(text))
+    for source, target in _PHONETIC_FOLDS:
+        folded = folded.replace(source, target)
+    return {folded[i:i + 3] for i in range(len(folded) - 2)}
+
+
+class VerseIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.verses = {}  # shloka_id -> {chapter, verse, slok, transliteration, path}
+        self.by_reference = {}  # (chapter, verse) -> shloka_id
+        self._doc_ids = []
+        self._doc_lengths = []
+        self._postings = defaultdict(list)  # token -> [(doc_index, term_frequency)]
+        self._idf = {}
+        self._average_length = 0.0
+        self._trigram_postings = defaultdict(list)  # trigram of Sanskrit/transliteration -> [doc_index]
+
+    @classmethod
+    def build(cls, data_directory: str = DEFAULT_SLOK_DIR):
+        index = cls()
+        for file_path in list_slok_files(data_directory):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            index._add(data, file_path)
+        index._finalize()
+        return index
+
+    def __len__(self):
+        return len(self.verses)
+
+    # --- REFERENCES ---
+    def parse_reference(self, query: str):
+        """Returns the shloka_id a query refers to ("BG 2.47", "chapter 2 verse 47", ...), or None."""
+        text = query.translate(_DEVANAGARI_DIGITS).casefold().strip()
+        for pattern, explicit in _REFERENCE_PATTERNS:
+            match = pattern.search(text) if explicit else pattern.fullmatch(text)
+            if match is None:
+                continue
+            shloka_id = self.by_reference.get((int(match.group(1)), int(match.group(2))))
+            if shloka_id is not None:
+                return shloka_id
+        return None
+
+    def is_reference_only(self, query: str) -> bool:
+        """True when the whole query is a verse reference ("BG 2.47?"), not a question that mentions one."""
+        text = query.translate(_DEVANAGARI_DIGITS).casefold().strip().rstrip("?.!। ")
+        for pattern, _ in _REFERENCE_PATTERNS:
+            match = pattern.fullmatch(text)
+            if match is not None and (int(match.group(1)), int(match.group(2))) in self.by_reference:
+                return True
+        return False
+
+    # --- BM25 ---
+    def search(self, query: str, k: int = 5):
+        """Top-k (shloka_id, score) pairs by BM25 over Sanskrit, transliteration and translations."""
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            idf = self._idf.get(token)
+            if idf is None:
+                continue
+            for doc_index, frequency in self._postings[token]:
+                length_norm = 1 - self.b + self.b * self._doc_lengths[doc_index] / self._average_length
+                scores[doc_index] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self._doc_ids[doc_index], score) for doc_index, score in best]
+
+    # --- VERSE TEXT ---
+    def match_verse_text(self, query: str, min_containment: float = 0.7, min_margin: float = 0.15):
+        """
+        The shloka_id of a pasted Sanskrit line or transliteration, or None. Uses character trigrams
+        of the phonetically folded text, so loose spellings ("karmanye vadhikaraste") and different
+        word splits still match; the best verse must contain most of the query and beat the runner-up.
+        """
+        grams = _trigrams(query)
+        if len(grams) < _MIN_VERSE_TRIGRAMS:
+            return None
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(self._trigram_postings.get(gram, ()))
+        if not overlap:
+            return None
+        (best, best_count), *rest = overlap.most_common(2)
+        runner_up = rest[0][1] if rest else 0
+        if best_count < min_containment * len(grams) or best_count - runner_up < min_margin * len(grams):
+            return None
+        return self._doc_ids[best]
+
+    # --- PASSAGES ---
+    def passages(self, shloka_id: str, author: str):
+        """
+        The author's translation/commentary for one verse, in Chroma's (ids, documents, metadatas)
+        shape. Texts are read from the slok file on demand, so the index itself stays small.
+        """
+        verse = self.verses[shloka_id]
+        with open(verse['path'], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = [value for value in data.values() if isinstance(value, dict) and value.get('author') == author]
+        if not entries:
+            # Fall back to the first author that has a translation of this verse
+            entries = [value for value in data.values()
+                       if isinstance(value, dict) and any(value.get(t) for t in TRANSLATION_TYPES)][:1]
+
+        ids, documents, metadatas = [], [], []
+        for entry in entries:
+            for type_key in PASSAGE_TYPES:
+                if not entry.get(type_key):
+                    continue
+                ids.append(f"verse:{shloka_id}:{entry['author']}:{type_key}")
+                documents.append(entry[type_key][:PASSAGE_CHARS])
+                metadatas.append({
+                    'author': entry['author'],
+                    'chapter': verse['chapter'],
+                    'verse': verse['verse'],
+                    'shloka_id': shloka_id,
+                    'commentary_type': COMMENTARY_TYPES[type_key],
+                    'shloka_sanskrit': verse['slok'],
+                    'chunk_index': 0,
+                })
+        return ids, documents, metadatas
+
+    def lookup(self, query: str, author: str, n_results: int = 5):
+        """Results for a verse reference or a pasted verse, shaped like Chroma's collection.query(); None otherwise."""
+        shloka_id = self.parse_reference(query) or self.match_verse_text(query)
+        if shloka_id is None:
+            return None
+        ids, documents, metadatas = self.passages(shloka_id, author)
+        if not ids:
+            return None
+        ids, documents, metadatas = ids[:n_results], documents[:n_results], metadatas[:n_results]
+        return {"ids": [ids], "documents": [documents], "metadatas": [metadatas], "distances": [[0.0] * len(ids)]}
+
+    def fuse(self, results, query: str, author: str, n_results: int = 5, rrf_k: int = 60):
+        """
+        Reciprocal-rank fusion of vector results with lexical verse hits. A lexical hit whose
+        verse is already among the vector results boosts it; otherwise the verse's passage is added.
+        """
+        vector_ids = results["ids"][0]
+        vector_metadatas = results["metadatas"][0]
+        candidates = {}
+        for rank, id_ in enumerate(vector_ids):
+            candidates[id_] = [1.0 / (rrf_k + rank), rank, None]
+
+        for rank, (shloka_id, _) in enumerate(self.search(query, k=n_results)):
+            boost = 1.0 / (rrf_k + rank)
+            matching = [id_ for id_, metadata in zip(vector_ids, vector_metadatas) if metadata.get('shloka_id') == shloka_id]
+            if matching:
+                for id_ in matching:
+                    candidates[id_][0] += boost
+                continue
+            ids, documents, metadatas = self.passages(shloka_id, author)
+            if ids:
+                candidates[ids[0]] = [boost, None, (documents[0], metadatas[0])]
+
+        ranked = sorted(candidates.items(), key=lambda item: item[1][0], reverse=True)[:n_results]
+        fused = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        for id_, (score, vector_rank, passage) in ranked:
+            document, metadata = passage if passage else (results["documents"][0][vector_rank], vector_metadatas[vector_rank])
+            fused["ids"][0].append(id_)
+            fused["documents"][0].append(document)
+            fused["metadatas"][0].append(metadata)
+            fused["distances"][0].append(1.0 - score)
+        return fused
+
+    # --- BUILDING ---
+    def _add(self, data, file_path):
+        shloka_id = data.get('_id')
+        if not shloka_id:
+            return
+        self.verses[shloka_id] = {
+            'chapter': data.get('chapter'),
+            'verse': data.get('verse'),
+            'slok': data.get('slok', ''),
+            'transliteration': data.get('transliteration', ''),
+            'path': file_path,
+        }
+        self.by_reference[(int(data.get('chapter')), int(data.get('verse')))] = shloka_id
+
+        doc_index = len(self._doc_ids)
+        texts = [data.get('slok', ''), data.get('transliteration', '')]
+        for gram in _trigrams(texts[0]) | _trigrams(texts[1]):
+            self._trigram_postings[gram].append(doc_index)
+        for value in data.values():
+            if isinstance(value, dict) and 'author' in value:
+                texts.extend(value[t] for t in TRANSLATION_TYPES if value.get(t))
+        terms = Counter(tokenize(" ".join(texts)))
+
+        self._doc_ids.append(shloka_id)
+        self._doc_lengths.append(sum(terms.values()))
+        for token, frequency in terms.items():
+            self._postings[token].append((doc_index, frequency))
+
+    def _finalize(self):
+        count = len(self._doc_ids)
+        self._average_length = sum(self._doc_lengths) / count if count else 1.0
+        for token, postings in self._postings.items():
+            frequency = len(postings)
+            self._idf[token] = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
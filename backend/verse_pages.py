@@ -0,0 +1,110 @@
+# verse_pages.py (Cacheable verse documents for GET /verse/{shloka_id})
+#
+# With SOURCES_MODE=ref, /ask returns sources as short references (shloka_id, author,
+# snippet) and the client fetches a verse's full text from /verse/{shloka_id} only when
+# it is opened. Those documents never change between deployments, so each one is
+# serialized once, with a strong ETag derived from its bytes, and served with a long
+# cache lifetime: browsers and proxies revalidate at most, and usually not even that.
+
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from corpus import DEFAULT_SLOK_DIR, COMMENTARY_TYPES, list_slok_files
+
+TRANSLATION_TYPES = ('et', 'ht')
+COMMENTARY_ONLY_TYPES = ('ec', 'hc', 'sc')
+
+
+def _page(document):
+    body = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class VersePages:
+    """
+    Verse documents keyed by shloka_id. The verse, its transliteration and every author's
+    translations are preloaded (about 4 MB for the corpus). An author's commentaries (about
+    30 MB in all) are read from the slok file when asked for and kept in a small LRU.
+    """
+
+    def __init__(self, max_author_pages: int = 256):
+        self.pages = {}   # shloka_id -> (body, etag)
+        self.paths = {}   # shloka_id -> slok file
+        self.max_author_pages = max_author_pages
+        self._author_pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pages)
+
+    @classmethod
+    def build(cls, data_directory: str = DEFAULT_SLOK_DIR, max_author_pages: int = 256):
+        pages = cls(max_author_pages)
+        for file_path in list_slok_files(data_directory):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('_id'):
+                pages.paths[data['_id']] = file_path
+                pages.pages[data['_id']] = _page(cls._document(data))
+        return pages
+
+    @staticmethod
+    def _document(data, author: str = None):
+        document = {
+            "shloka_id": data['_id'],
+            "chapter": int(data['chapter']),
+            "verse": int(data['verse']),
+            "shloka_sanskrit": data.get('slok') or '',
+            "transliteration": data.get('transliteration') or '',
+            "translations": [
+                {"author": value['author'], "type": COMMENTARY_TYPES[type_key], "text": value[type_key]}
+                for value in data.values() if isinstance(value, dict) and 'author' in value
+                for type_key in TRANSLATION_TYPES if value.get(type_key)
+            ],
+        }
+        if author is not None:
+            document["author"] = author
+            document["commentaries"] = [
+                {"type": COMMENTARY_TYPES[type_key], "text": value[type_key]}
+                for value in data.values() if isinstance(value, dict) and value.get('author') == author
+                for type_key in COMMENTARY_ONLY_TYPES if value.get(type_key)
+            ]
+        return document
+
+    def get(self, shloka_id: str, author: str = None):
+        """Returns (body, etag) for the verse, with `author`'s commentaries if given; None if either is unknown."""
+        if shloka_id not in self.pages:
+            return None
+        if author is None:
+            return self.pages[shloka_id]
+        key = (shloka_id, author)
+        with self._lock:
+            if key in self._author_pages:
+                self._author_pages.move_to_end(key)
+                return self._author_pages[key]
+        with open(self.paths[shloka_id], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not any(isinstance(value, dict) and value.get('author') == author for value in data.values()):
+            return None
+        page = _page(self._document(data, author))
+        with self._lock:
+            self._author_pages[key] = page
+            while len(self._author_pages) > self.max_author_pages:
+                self._author_pages.popitem(last=False)
+        return page
+
+
+_shared_pages = None
+_shared_lock = threading.Lock()
+
+
+def shared_verse_pages() -> VersePages:
+    global _shared_pages
+    if _shared_pages is None:
+        with _shared_lock:
+            if _shared_pages is None:
+                _shared_pages = VersePages.build()
+                print(f"Preloaded {len(_shared_pages)} verse pages.")
+    return _shared_pages
@@ -0,0 +1,203 @@
+# verse_table.py (Normalized verse table: one copy of every shloka, integer codes in chunk metadata)
+#
+# Usage:
+#   python verse_table.py build   [--out gita_verses.json]
+#   python verse_table.py migrate [--db ./gita_vector_db]
+#
+# Chunks used to carry the chapter, verse, author, commentary type and the full Devanagari
+# shloka in their metadata, so each verse was stored, decoded and returned dozens of times.
+# Compact chunk metadata holds only small integer keys:
+#   {"verse_code": 2047, "author_code": 3, "type_code": 1, "chunk_index": 0}
+# and the shloka ids, texts and author names live once in this table, which is loaded a
+# single time per process. expand() turns compact metadata back into the usual shape,
+# referencing the table's strings rather than copying them. Collections still holding the
+# old per-chunk metadata keep working; `migrate` rewrites them in place without re-embedding.
+
+import os
+import json
+import threading
+import argparse
+from array import array
+
+from corpus import DEFAULT_SLOK_DIR, COMMENTARY_TYPES, list_slok_files
+
+VERSE_TABLE_PATH = os.environ.get("VERSE_TABLE_PATH", "./gita_verses.json")
+# Type codes are positions in this tuple, so the order of COMMENTARY_TYPES must not change
+TYPE_NAMES = tuple(COMMENTARY_TYPES.values())
+
+
+def verse_code(chapter, verse) -> int:
+    """BG 2.47 -> 2047. Derived from the reference itself, so codes never shift when verses are added."""
+    return int(chapter) * 1000 + int(verse)
+
+
+def is_compact(metadata) -> bool:
+    return metadata is not None and "verse_code" in metadata
+
+
+class VerseTable:
+    """Read-only table of verses and authors. Author codes are positions in `authors` and only ever get appended."""
+
+    __slots__ = ("authors", "shloka_ids", "chapters", "verses", "sanskrit", "_author_codes", "_rows")
+
+    def __init__(self, authors, verse_rows):
+        # verse_rows: (shloka_id, chapter, verse, shloka_sanskrit) tuples
+        verse_rows = sorted(verse_rows, key=lambda row: verse_code(row[1], row[2]))
+        self.authors = tuple(authors)
+        self.shloka_ids = tuple(row[0] for row in verse_rows)
+        self.chapters = array("H", (int(row[1]) for row in verse_rows))
+        self.verses = array("H", (int(row[2]) for row in verse_rows))
+        self.sanskrit = tuple(row[3] for row in verse_rows)
+        self._author_codes = {author: code for code, author in enumerate(self.authors)}
+        self._rows = {verse_code(row[1], row[2]): i for i, row in enumerate(verse_rows)}
+
+    def __len__(self):
+        return len(self.shloka_ids)
+
+    @classmethod
+    def build(cls, data_directory: str = DEFAULT_SLOK_DIR, previous=None):
+        """Reads the slok files. Authors already in `previous` keep their codes; new ones are appended."""
+        verse_rows, authors = [], set()
+        for file_path in list_slok_files(data_directory):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not data.get('_id'):
+                continue
+            verse_rows.append((data['_id'], data['chapter'], data['verse'], data.get('slok') or ''))
+            authors.update(value['author'] for value in data.values() if isinstance(value, dict) and 'author' in value)
+        known = list(previous.authors) if previous is not None else []
+        return cls(known + sorted(authors - set(known)), verse_rows)
+
+    @classmethod
+    def load(cls, path: str = VERSE_TABLE_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if tuple(data["types"]) != TYPE_NAMES:
+            raise ValueError(f"'{path}' was written with different commentary types.")
+        return cls(data["authors"], [tuple(row) for row in data["verses"]])
+
+    def save(self, path: str = VERSE_TABLE_PATH):
+        data = {
+            "types": list(TYPE_NAMES),
+            "authors": list(self.authors),
+            "verses": [[self.shloka_ids[i], self.chapters[i], self.verses[i], self.sanskrit[i]] for i in range(len(self))],
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def author_code(self, author: str):
+        """The author's code, or None for an author not in the table."""
+        return self._author_codes.get(author)
+
+    def compact(self, metadata):
+        """Full chunk metadata -> compact metadata."""
+        code = self._author_codes.get(metadata['author'])
+        if code is None:
+            raise KeyError(f"Author '{metadata['author']}' is not in the verse table; rebuild it first.")
+        return {
+            "verse_code": verse_code(metadata['chapter'], metadata['verse']),
+            "author_code": code,
+            "type_code": TYPE_NAMES.index(metadata['commentary_type']),
+            "chunk_index": metadata.get('chunk_index', 0),
+        }
+
+    def expand(self, metadata):
+        """Compact metadata -> the full shape retrieval and context building expect. Other metadata is returned as is."""
+        if not is_compact(metadata):
+            return metadata
+        row = self._rows[metadata["verse_code"]]
+        return {
+            "author": self.authors[metadata["author_code"]],
+            "chapter": self.chapters[row],
+            "verse": self.verses[row],
+            "shloka_id": self.shloka_ids[row],
+            "commentary_type": TYPE_NAMES[metadata["type_code"]],
+            "shloka_sanskrit": self.sanskrit[row],
+            "chunk_index": metadata.get("chunk_index", 0),
+        }
+
+
+def expand_results(results, table: VerseTable):
+    """Chroma-shaped query results with compact metadata expanded."""
+    if not results or not results.get("metadatas") or not any(is_compact(m) for ms in results["metadatas"] for m in ms):
+        return results
+    return {**results, "metadatas": [[table.expand(m) for m in ms] for ms in results["metadatas"]]}
+
+
+_shared_table = None
+_shared_lock = threading.Lock()
+
+
+def shared_verse_table() -> VerseTable:
+    """The process-wide table: loaded from VERSE_TABLE_PATH, or built from the slok files (and saved) if missing."""
+    global _shared_table
+    if _shared_table is None:
+        with _shared_lock:
+            if _shared_table is None:
+                if os.path.exists(VERSE_TABLE_PATH):
+                    _shared_table = VerseTable.load(VERSE_TABLE_PATH)
+                else:
+                    _shared_table = VerseTable.build()
+                    _shared_table.save(VERSE_TABLE_PATH)
+                print(f"Loaded verse table with {len(_shared_table)} verses and {len(_shared_table.authors)} authors.")
+    return _shared_table
+
+
+def collection_is_compact(collection) -> bool:
+    sample = collection.get(limit=1, include=["metadatas"])["metadatas"]
+    return bool(sample) and is_compact(sample[0])
+
+
+def migrate(collection, table: VerseTable, batch_size: int = 1000):
+    """
+    Rewrites every chunk with full metadata to compact metadata, reusing its stored embedding.
+    Chunks are re-added rather than updated because Chroma merges updated metadata into the old.
+    """
+    ids = collection.get(include=[])["ids"]
+    migrated = 0
+    for i in range(0, len(ids), batch_size):
+        batch = collection.get(ids=ids[i:i + batch_size], include=["embeddings", "documents", "metadatas"])
+        rows = [row for row, metadata in enumerate(batch["metadatas"]) if not is_compact(metadata)]
+        if not rows:
+            continue
+        row_ids = [batch["ids"][row] for row in rows]
+        metadatas = [table.compact(batch["metadatas"][row]) for row in rows]
+        collection.delete(ids=row_ids)
+        collection.add(
+            ids=row_ids,
+            embeddings=[list(map(float, batch["embeddings"][row])) for row in rows],
+            documents=[batch["documents"][row] for row in rows],
+            metadatas=metadatas,
+        )
+        migrated += len(rows)
+        print(f"  {migrated} chunks migrated...")
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the verse table or migrate a collection to compact metadata.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build")
+    build_parser.add_argument("--slok-dir", default=DEFAULT_SLOK_DIR)
+    build_parser.add_argument("--out", default=VERSE_TABLE_PATH)
+    migrate_parser = commands.add_parser("migrate")
+    migrate_parser.add_argument("--db", default="./gita_vector_db")
+    migrate_parser.add_argument("--table", default=VERSE_TABLE_PATH)
+    migrate_parser.add_argument("--slok-dir", default=DEFAULT_SLOK_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        previous = VerseTable.load(args.out) if os.path.exists(args.out) else None
+        table = VerseTable.build(args.slok_dir, previous)
+        table.save(args.out)
+        print(f"Wrote {len(table)} verses and {len(table.authors)} authors to '{args.out}'.")
+    else:
+        import chromadb
+        previous = VerseTable.load(args.table) if os.path.exists(args.table) else None
+        table = VerseTable.build(args.slok_dir, previous)
+        table.save(args.table)
+        collection = chromadb.PersistentClient(path=args.db).get_collection(name="gita_commentaries")
+        print(f"Migrated {migrate(collection, table)} chunks to compact metadata.")
+        print("Rebuild the NumPy index (python numpy_index.py build) if RETRIEVAL_ENGINE=numpy.")